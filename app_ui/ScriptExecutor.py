@@ -46,6 +46,7 @@ class ScriptExecutor(QObject):
         self.is_running = False
         self.last_log_position = 0
         self.current_script_name: Optional[str] = None
+        self.config_file_path: Optional[str] = None  # 仅 Windows 使用的临时配置文件，进程结束后删除
 
         # 创建监控定时器
         self.monitor_timer = QTimer()
@@ -70,10 +71,8 @@ class ScriptExecutor(QObject):
                 self.script_error.emit(f'脚本文件不存在: {script_dir}')
                 return False
 
-            # 创建临时配置文件
-            config_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8')
-            json.dump(config, config_file, ensure_ascii=False, indent=2)
-            config_file.close()
+            # 传递配置：POSIX 上走继承的匿名管道（/dev/fd/N），不落盘；Windows 退回临时文件
+            config_path, pass_fds = self._handoff_config(config)
 
             # 设置环境变量
             env = os.environ.copy()
@@ -85,7 +84,7 @@ class ScriptExecutor(QObject):
             if script_path.endswith(('.so', '.pyd')):
                 # 对于编译后的文件，使用 Python 模块导入方式执行
                 script_dir_escaped = os.path.abspath(script_dir).replace('\\', '\\\\')
-                config_file_escaped = os.path.abspath(config_file.name).replace('\\', '\\\\')
+                config_file_escaped = config_path.replace('\\', '\\\\')
 
                 cmd = [
                     'python',
@@ -113,10 +112,14 @@ except Exception as e:
                 ]
             else:
                 # 对于 .py 文件，直接执行
-                cmd = ['python', script_path, config_file.name]
+                cmd = ['python', script_path, config_path]
 
             print(f'启动脚本: {" ".join(cmd)}')
-            self.current_process = subprocess.Popen(cmd, text=True, bufsize=1, env=env)
+            try:
+                self.current_process = subprocess.Popen(cmd, text=True, bufsize=1, env=env, pass_fds=pass_fds)
+            finally:
+                for fd in pass_fds:
+                    os.close(fd)
 
             # 启动监控
             self.is_running = True
@@ -135,6 +138,31 @@ except Exception as e:
             self.script_error.emit(f'启动脚本失败: {str(e)}')
             return False
 
+    def _handoff_config(self, config):
+        """返回 (配置路径, 需继承的 fd)。管道在后台线程写入，脚本读完或退出后自动关闭。"""
+        data = json.dumps(config, ensure_ascii=False, indent=2).encode('utf-8')
+        if os.name != 'posix':
+            config_file = tempfile.NamedTemporaryFile(delete=False, suffix='.json')
+            config_file.write(data)
+            config_file.close()
+            self.config_file_path = config_file.name
+            return os.path.abspath(config_file.name), ()
+
+        read_fd, write_fd = os.pipe()
+
+        def write_config():
+            view = memoryview(data)
+            try:
+                while view:
+                    view = view[os.write(write_fd, view):]
+            except OSError:
+                pass
+            finally:
+                os.close(write_fd)
+
+        threading.Thread(target=write_config, daemon=True).start()
+        return f'/dev/fd/{read_fd}', (read_fd,)
+
     def stop_script(self):
         """停止当前运行的脚本"""
         if self.monitor_timer:
@@ -173,6 +201,12 @@ except Exception as e:
             self.script_error.emit(f'监控进程时出错: {str(e)}')
         finally:
             self.is_running = False
+            if self.config_file_path:
+                try:
+                    os.remove(self.config_file_path)
+                except OSError:
+                    pass
+                self.config_file_path = None
             if self.monitor_timer:
                 self.stop_timer_signal.emit()
 
@@ -4,6 +4,28 @@ import { Sidecar } from './sidecar'
 
 const isDev = !app.isPackaged
 
+interface LogRange {
+  offset?: number
+  length?: number
+  line?: number
+  lines?: number
+  direction?: 'forward' | 'backward'
+}
+
+interface LogFilter {
+  script?: string
+  dateFrom?: string
+  dateTo?: string
+}
+
+interface BatchRequest {
+  configs?: Record<string, unknown>[]
+  grid?: Record<string, unknown[]>
+  base_config?: Record<string, unknown>
+  parallel?: number
+  retries?: number
+}
+
 let mainWindow: BrowserWindow | null = null
 let sidecar: Sidecar | null = null
 
@@ -46,6 +68,17 @@ app.whenReady().then(async () => {
   sidecar = new Sidecar()
   await sidecar.start()
 
+  // sidecar 推送的通知转发给渲染进程
+  sidecar.onNotification((method, params) => {
+    if (method === 'terminal_output') mainWindow?.webContents.send('sidecar:terminalOutput', params)
+    else if (method === 'run_output') mainWindow?.webContents.send('sidecar:runOutput', params)
+    else if (method === 'run_status') mainWindow?.webContents.send('sidecar:runStatus', params)
+    else if (method === 'run_progress') mainWindow?.webContents.send('sidecar:runProgress', params)
+    else if (method === 'batch_status') mainWindow?.webContents.send('sidecar:batchStatus', params)
+    else if (method === 'ai_output') mainWindow?.webContents.send('sidecar:aiOutput', params)
+    else if (method === 'ai_status') mainWindow?.webContents.send('sidecar:aiStatus', params)
+  })
+
   // 注册 IPC 处理
   registerIpcHandlers()
 
@@ -72,24 +105,65 @@ function registerIpcHandlers(): void {
   }
 
   ipcMain.handle('sidecar:getScripts', () => api('get_scripts'))
+  ipcMain.handle('sidecar:getScriptsDiff', (_e, sinceVersion: number, validate?: boolean) =>
+    api('get_scripts_diff', sinceVersion, validate ?? false)
+  )
   ipcMain.handle('sidecar:getScriptDetail', (_e, path: string) => api('get_script_detail', path))
-  ipcMain.handle('sidecar:runScript', (_e, path: string, config: unknown) => api('run_script', path, config))
+  ipcMain.handle('sidecar:runScript', (_e, path: string, config: unknown, profile?: boolean) =>
+    api('run_script', path, config, profile ?? false)
+  )
 
   ipcMain.handle('sidecar:terminalStart', (_e, cols?: number, rows?: number) => api('terminal_start', cols ?? 100, rows ?? 30))
   ipcMain.handle('sidecar:terminalRead', () => api('terminal_read'))
+  ipcMain.handle('sidecar:terminalSubscribe', () => api('terminal_subscribe'))
+  ipcMain.handle('sidecar:terminalAck', (_e, seq: number) => api('terminal_ack', seq))
   ipcMain.handle('sidecar:terminalWrite', (_e, data: string) => api('terminal_write', data))
   ipcMain.handle('sidecar:terminalResize', (_e, cols: number, rows: number) => api('terminal_resize', cols, rows))
   ipcMain.handle('sidecar:terminalStop', () => api('terminal_stop'))
 
+  ipcMain.handle('sidecar:startRun', (_e, path: string, config: unknown, profile?: boolean) =>
+    api('start_run', path, config, profile ?? false)
+  )
+  ipcMain.handle('sidecar:listRuns', () => api('list_runs'))
+  ipcMain.handle('sidecar:attachRun', (_e, runId: string, cursor?: number) => api('attach_run', runId, cursor ?? 0))
+  ipcMain.handle('sidecar:runWrite', (_e, runId: string, data: string) => api('run_write', runId, data))
+  ipcMain.handle('sidecar:cancelRun', (_e, runId: string) => api('cancel_run', runId))
+  ipcMain.handle('sidecar:getRunMetrics', (_e, runId: string) => api('get_run_metrics', runId))
+  ipcMain.handle('sidecar:getRunProfile', (_e, runId: string) => api('get_run_profile', runId))
+  ipcMain.handle('sidecar:runBatch', (_e, path: string, request: BatchRequest) =>
+    api('run_batch', path, request.configs ?? null, request.grid ?? null, request.base_config ?? null,
+      request.parallel ?? 2, request.retries ?? 0)
+  )
+  ipcMain.handle('sidecar:getBatch', (_e, batchId: string) => api('get_batch', batchId))
+  ipcMain.handle('sidecar:listBatches', () => api('list_batches'))
+  ipcMain.handle('sidecar:cancelBatch', (_e, batchId: string) => api('cancel_batch', batchId))
+  ipcMain.handle('sidecar:streamRun', (_e, runId: string) => api('stream_run', runId))
+  ipcMain.handle('sidecar:unstreamRun', (_e, runId: string) => api('unstream_run', runId))
+  ipcMain.handle('sidecar:runAck', (_e, runId: string, seq: number) => api('run_ack', runId, seq))
+
   ipcMain.handle('sidecar:stopCurrent', () => api('stop_current'))
   ipcMain.handle('sidecar:analyzeRun', (_e, runId: string) => api('analyze_run_with_opencode', runId))
   ipcMain.handle('sidecar:analyzeTerminal', (_e, path: string, config: unknown, log: string) =>
     api('analyze_terminal_with_opencode', path, config, log)
   )
   ipcMain.handle('sidecar:aiAssist', (_e, payload: unknown) => api('ai_assist', payload))
-  ipcMain.handle('sidecar:getRecentLogs', (_e, limit?: number) => api('get_recent_logs', limit ?? 20))
-  ipcMain.handle('sidecar:getLogDetail', (_e, path: string, maxChars?: number) =>
-    api('get_log_detail', path, maxChars ?? 120000)
+  ipcMain.handle('sidecar:startAiJob', (_e, kind: string, params: unknown) => api('start_ai_job', kind, params))
+  ipcMain.handle('sidecar:getAiJob', (_e, jobId: string, cursor?: number) => api('get_ai_job', jobId, cursor ?? 0))
+  ipcMain.handle('sidecar:listAiJobs', () => api('list_ai_jobs'))
+  ipcMain.handle('sidecar:cancelAiJob', (_e, jobId: string) => api('cancel_ai_job', jobId))
+  ipcMain.handle('sidecar:getRecentLogs', (_e, limit?: number, offset?: number, filter?: LogFilter) =>
+    api('get_recent_logs', limit ?? 20, offset ?? 0, filter?.script ?? null, filter?.dateFrom ?? null, filter?.dateTo ?? null)
+  )
+  ipcMain.handle('sidecar:getLogDetail', (_e, path: string, maxChars?: number, range?: LogRange) =>
+    api(
+      'get_log_detail', path, maxChars ?? 120000,
+      range?.offset ?? null, range?.length ?? null, range?.line ?? null, range?.lines ?? null,
+      range?.direction ?? 'forward'
+    )
+  )
+
+  ipcMain.handle('sidecar:searchLogs', (_e, query: string, filter?: LogFilter, limit?: number) =>
+    api('search_logs', query, filter?.script ?? null, filter?.dateFrom ?? null, filter?.dateTo ?? null, limit ?? 50)
   )
 
   // 文件选择 — 使用 Electron 原生对话框
@@ -4,15 +4,19 @@ import { createInterface } from 'readline'
 import { app } from 'electron'
 import * as fs from 'fs'
 
+type NotificationListener = (method: string, params: unknown) => void
+
 /**
  * Python sidecar 管理器
  * 通过 stdin/stdout JSON-RPC 与 Python 后端通信
+ * 无 id 的消息为 sidecar 主动推送的通知（如 terminal_output）
  */
 export class Sidecar {
   private process: ChildProcess | null = null
   private requestId = 0
   private pending = new Map<number, { resolve: (v: unknown) => void; reject: (e: Error) => void }>()
   private ready = false
+  private listeners = new Set<NotificationListener>()
 
   get isRunning(): boolean {
     return this.process !== null && this.ready
@@ -106,7 +110,16 @@ export class Sidecar {
     })
   }
 
-  private handleMessage(msg: { id?: number; ok?: boolean; data?: unknown; error?: string }): void {
+  onNotification(listener: NotificationListener): () => void {
+    this.listeners.add(listener)
+    return () => this.listeners.delete(listener)
+  }
+
+  private handleMessage(msg: { id?: number; method?: string; params?: unknown; ok?: boolean; data?: unknown; error?: string }): void {
+    if (msg.id === undefined && msg.method) {
+      for (const listener of this.listeners) listener(msg.method, msg.params)
+      return
+    }
     if (msg.id !== undefined && this.pending.has(msg.id)) {
       const p = this.pending.get(msg.id)!
       this.pending.delete(msg.id)
@@ -1,24 +1,103 @@
-import { contextBridge, ipcRenderer } from 'electron'
+import { contextBridge, ipcRenderer, IpcRendererEvent } from 'electron'
 
 const api = {
   getScripts: () => ipcRenderer.invoke('sidecar:getScripts'),
+  getScriptsDiff: (sinceVersion: number, validate?: boolean) =>
+    ipcRenderer.invoke('sidecar:getScriptsDiff', sinceVersion, validate),
   getScriptDetail: (path: string) => ipcRenderer.invoke('sidecar:getScriptDetail', path),
-  runScript: (path: string, config: unknown) => ipcRenderer.invoke('sidecar:runScript', path, config),
+  runScript: (path: string, config: unknown, profile?: boolean) =>
+    ipcRenderer.invoke('sidecar:runScript', path, config, profile),
 
   terminalStart: (cols?: number, rows?: number) => ipcRenderer.invoke('sidecar:terminalStart', cols, rows),
   terminalRead: () => ipcRenderer.invoke('sidecar:terminalRead'),
+  terminalSubscribe: () => ipcRenderer.invoke('sidecar:terminalSubscribe'),
+  terminalAck: (seq: number) => ipcRenderer.invoke('sidecar:terminalAck', seq),
+  onTerminalOutput: (callback: (frame: { seq: number; data: string }) => void) => {
+    const listener = (_e: IpcRendererEvent, frame: { seq: number; data: string }) => callback(frame)
+    ipcRenderer.on('sidecar:terminalOutput', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:terminalOutput', listener)
+    }
+  },
   terminalWrite: (data: string) => ipcRenderer.invoke('sidecar:terminalWrite', data),
   terminalResize: (cols: number, rows: number) => ipcRenderer.invoke('sidecar:terminalResize', cols, rows),
   terminalStop: () => ipcRenderer.invoke('sidecar:terminalStop'),
 
+  startRun: (path: string, config: unknown, profile?: boolean) =>
+    ipcRenderer.invoke('sidecar:startRun', path, config, profile),
+  listRuns: () => ipcRenderer.invoke('sidecar:listRuns'),
+  attachRun: (runId: string, cursor?: number) => ipcRenderer.invoke('sidecar:attachRun', runId, cursor),
+  runWrite: (runId: string, data: string) => ipcRenderer.invoke('sidecar:runWrite', runId, data),
+  cancelRun: (runId: string) => ipcRenderer.invoke('sidecar:cancelRun', runId),
+  getRunMetrics: (runId: string) => ipcRenderer.invoke('sidecar:getRunMetrics', runId),
+  getRunProfile: (runId: string) => ipcRenderer.invoke('sidecar:getRunProfile', runId),
+  streamRun: (runId: string) => ipcRenderer.invoke('sidecar:streamRun', runId),
+  unstreamRun: (runId: string) => ipcRenderer.invoke('sidecar:unstreamRun', runId),
+  runAck: (runId: string, seq: number) => ipcRenderer.invoke('sidecar:runAck', runId, seq),
+  onRunOutput: (callback: (frame: { run_id: string; seq: number; data: string }) => void) => {
+    const listener = (_e: IpcRendererEvent, frame: { run_id: string; seq: number; data: string }) => callback(frame)
+    ipcRenderer.on('sidecar:runOutput', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:runOutput', listener)
+    }
+  },
+  onRunStatus: (callback: (run: unknown) => void) => {
+    const listener = (_e: IpcRendererEvent, run: unknown) => callback(run)
+    ipcRenderer.on('sidecar:runStatus', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:runStatus', listener)
+    }
+  },
+  onRunProgress: (callback: (progress: unknown) => void) => {
+    const listener = (_e: IpcRendererEvent, progress: unknown) => callback(progress)
+    ipcRenderer.on('sidecar:runProgress', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:runProgress', listener)
+    }
+  },
+
+  runBatch: (path: string, request: unknown) => ipcRenderer.invoke('sidecar:runBatch', path, request),
+  getBatch: (batchId: string) => ipcRenderer.invoke('sidecar:getBatch', batchId),
+  listBatches: () => ipcRenderer.invoke('sidecar:listBatches'),
+  cancelBatch: (batchId: string) => ipcRenderer.invoke('sidecar:cancelBatch', batchId),
+  onBatchStatus: (callback: (status: unknown) => void) => {
+    const listener = (_e: IpcRendererEvent, status: unknown) => callback(status)
+    ipcRenderer.on('sidecar:batchStatus', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:batchStatus', listener)
+    }
+  },
+
   stopCurrent: () => ipcRenderer.invoke('sidecar:stopCurrent'),
   analyzeRun: (runId: string) => ipcRenderer.invoke('sidecar:analyzeRun', runId),
   analyzeTerminal: (path: string, config: unknown, log: string) =>
     ipcRenderer.invoke('sidecar:analyzeTerminal', path, config, log),
   aiAssist: (payload: unknown) => ipcRenderer.invoke('sidecar:aiAssist', payload),
+  startAiJob: (kind: string, params: unknown) => ipcRenderer.invoke('sidecar:startAiJob', kind, params),
+  getAiJob: (jobId: string, cursor?: number) => ipcRenderer.invoke('sidecar:getAiJob', jobId, cursor),
+  listAiJobs: () => ipcRenderer.invoke('sidecar:listAiJobs'),
+  cancelAiJob: (jobId: string) => ipcRenderer.invoke('sidecar:cancelAiJob', jobId),
+  onAiOutput: (callback: (frame: { job_id: string; data: string; cursor: number }) => void) => {
+    const listener = (_e: IpcRendererEvent, frame: { job_id: string; data: string; cursor: number }) => callback(frame)
+    ipcRenderer.on('sidecar:aiOutput', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:aiOutput', listener)
+    }
+  },
+  onAiStatus: (callback: (job: unknown) => void) => {
+    const listener = (_e: IpcRendererEvent, job: unknown) => callback(job)
+    ipcRenderer.on('sidecar:aiStatus', listener)
+    return () => {
+      ipcRenderer.removeListener('sidecar:aiStatus', listener)
+    }
+  },
 
-  getRecentLogs: (limit?: number) => ipcRenderer.invoke('sidecar:getRecentLogs', limit),
-  getLogDetail: (path: string, maxChars?: number) => ipcRenderer.invoke('sidecar:getLogDetail', path, maxChars),
+  getRecentLogs: (limit?: number, offset?: number, filter?: { script?: string; dateFrom?: string; dateTo?: string }) =>
+    ipcRenderer.invoke('sidecar:getRecentLogs', limit, offset, filter),
+  getLogDetail: (path: string, maxChars?: number, range?: unknown) =>
+    ipcRenderer.invoke('sidecar:getLogDetail', path, maxChars, range),
+  searchLogs: (query: string, filter?: { script?: string; dateFrom?: string; dateTo?: string }, limit?: number) =>
+    ipcRenderer.invoke('sidecar:searchLogs', query, filter, limit),
 
   chooseDirectory: () => ipcRenderer.invoke('sidecar:chooseDirectory'),
   chooseFile: () => ipcRenderer.invoke('sidecar:chooseFile')
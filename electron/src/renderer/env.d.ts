@@ -3,19 +3,48 @@
 interface Window {
   cedar: {
     getScripts: () => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    getScriptsDiff: (sinceVersion: number, validate?: boolean) => Promise<{ ok: boolean; data?: unknown; error?: string }>
     getScriptDetail: (path: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
-    runScript: (path: string, config: unknown) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    runScript: (path: string, config: unknown, profile?: boolean) => Promise<{ ok: boolean; data?: unknown; error?: string }>
     terminalStart: (cols?: number, rows?: number) => Promise<{ ok: boolean; data?: unknown; error?: string }>
     terminalRead: () => Promise<{ ok: boolean; data?: string; error?: string }>
+    terminalSubscribe: () => Promise<{ ok: boolean; error?: string }>
+    terminalAck: (seq: number) => Promise<{ ok: boolean; error?: string }>
+    onTerminalOutput: (callback: (frame: { seq: number; data: string }) => void) => () => void
     terminalWrite: (data: string) => Promise<{ ok: boolean; error?: string }>
     terminalResize: (cols: number, rows: number) => Promise<{ ok: boolean; error?: string }>
     terminalStop: () => Promise<{ ok: boolean; error?: string }>
+    startRun: (path: string, config: unknown, profile?: boolean) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    listRuns: () => Promise<{ ok: boolean; data?: unknown[]; error?: string }>
+    attachRun: (runId: string, cursor?: number) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    runWrite: (runId: string, data: string) => Promise<{ ok: boolean; error?: string }>
+    cancelRun: (runId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    getRunMetrics: (runId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    getRunProfile: (runId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    streamRun: (runId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    unstreamRun: (runId: string) => Promise<{ ok: boolean; error?: string }>
+    runAck: (runId: string, seq: number) => Promise<{ ok: boolean; error?: string }>
+    onRunOutput: (callback: (frame: { run_id: string; seq: number; data: string }) => void) => () => void
+    onRunStatus: (callback: (run: unknown) => void) => () => void
+    onRunProgress: (callback: (progress: unknown) => void) => () => void
+    runBatch: (path: string, request: unknown) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    getBatch: (batchId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    listBatches: () => Promise<{ ok: boolean; data?: unknown[]; error?: string }>
+    cancelBatch: (batchId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    onBatchStatus: (callback: (status: unknown) => void) => () => void
     stopCurrent: () => Promise<{ ok: boolean; data?: unknown; error?: string }>
     analyzeRun: (runId: string) => Promise<{ ok: boolean; data?: { review: string }; error?: string }>
     analyzeTerminal: (path: string, config: unknown, log: string) => Promise<{ ok: boolean; data?: { review: string }; error?: string }>
     aiAssist: (payload: unknown) => Promise<{ ok: boolean; data?: { review: string }; error?: string }>
-    getRecentLogs: (limit?: number) => Promise<{ ok: boolean; data?: unknown[]; error?: string }>
-    getLogDetail: (path: string, maxChars?: number) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    startAiJob: (kind: string, params: unknown) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    getAiJob: (jobId: string, cursor?: number) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    listAiJobs: () => Promise<{ ok: boolean; data?: unknown[]; error?: string }>
+    cancelAiJob: (jobId: string) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    onAiOutput: (callback: (frame: { job_id: string; data: string; cursor: number }) => void) => () => void
+    onAiStatus: (callback: (job: unknown) => void) => () => void
+    getRecentLogs: (limit?: number, offset?: number, filter?: { script?: string; dateFrom?: string; dateTo?: string }) => Promise<{ ok: boolean; data?: unknown[]; error?: string }>
+    getLogDetail: (path: string, maxChars?: number, range?: unknown) => Promise<{ ok: boolean; data?: unknown; error?: string }>
+    searchLogs: (query: string, filter?: { script?: string; dateFrom?: string; dateTo?: string }, limit?: number) => Promise<{ ok: boolean; data?: unknown; error?: string }>
     chooseDirectory: () => Promise<{ ok: boolean; data?: string; error?: string }>
     chooseFile: () => Promise<{ ok: boolean; data?: string; error?: string }>
     mermaid?: typeof import('mermaid')
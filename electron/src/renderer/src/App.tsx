@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from 'react'
+import { useState, useEffect, useCallback, useRef } from 'react'
 import { ActivityBar } from './components/ActivityBar'
 import { Sidebar } from './components/Sidebar'
 import { EditorTabs } from './components/EditorTabs'
@@ -6,11 +6,37 @@ import { EditorArea } from './components/EditorArea'
 import { TerminalPanel } from './components/TerminalPanel'
 import { StatusBar } from './components/StatusBar'
 import { Toast } from './components/Toast'
-import type { ScriptNode, ScriptDetail } from './types/api'
+import type { ScriptNode, ScriptDetail, ScriptTreeChange, RunProgress } from './types/api'
 
 export type ViewKey = 'explorer' | 'run' | 'search' | 'history' | 'ai'
 export type EditorTab = 'form' | 'readme' | 'history'
 
+// 按顺序应用 get_scripts_diff 返回的增量操作，返回新的脚本树
+function applyScriptChanges(tree: ScriptNode[], changes: ScriptTreeChange[]): ScriptNode[] {
+  const clone = (nodes: ScriptNode[]): ScriptNode[] => nodes.map((n) => ({ ...n, children: clone(n.children) }))
+  const root: ScriptNode = { name: 'scripts', path: '', runnable: false, children: clone(tree) }
+  const find = (path: string): ScriptNode | null => {
+    let node: ScriptNode | undefined = root
+    for (const part of path ? path.split('/') : []) {
+      node = node.children.find((c) => c.name === part)
+      if (!node) return null
+    }
+    return node
+  }
+  for (const change of changes) {
+    if (change.op === 'remove') {
+      const parent = find(change.path.split('/').slice(0, -1).join('/'))
+      if (parent) parent.children = parent.children.filter((c) => c.path !== change.path)
+    } else if (change.op === 'add') {
+      find(change.parent)?.children.splice(change.index, 0, change.node)
+    } else {
+      const node = find(change.path)
+      if (node) node.runnable = change.runnable
+    }
+  }
+  return root.children
+}
+
 function App() {
   const [scripts, setScripts] = useState<ScriptNode[]>([])
   const [activeView, setActiveView] = useState<ViewKey>('explorer')
@@ -19,6 +45,7 @@ function App() {
   const [selectedNode, setSelectedNode] = useState<ScriptNode | null>(null)
   const [scriptDetail, setScriptDetail] = useState<ScriptDetail | null>(null)
   const [running, setRunning] = useState(false)
+  const [progress, setProgress] = useState<RunProgress | null>(null)
   const [terminalTranscript, setTerminalTranscript] = useState('')
   const [toast, setToast] = useState<string | null>(null)
   const [searchQuery, setSearchQuery] = useState('')
@@ -28,11 +55,18 @@ function App() {
     setTimeout(() => setToast(null), 2600)
   }, [])
 
-  // 加载脚本
-  const loadScripts = useCallback(async () => {
-    const res = await window.cedar.getScripts()
+  // 加载脚本：首次整树，之后按版本取增量；手动刷新时按目录 mtime 校验
+  const scriptsVersion = useRef(-1)
+  const loadScripts = useCallback(async (validate = false) => {
+    const res = await window.cedar.getScriptsDiff(scriptsVersion.current, validate)
     if (res.ok && res.data) {
-      setScripts(res.data)
+      const diff = res.data
+      if (diff.reset) {
+        setScripts(diff.tree || [])
+      } else if (diff.changes.length) {
+        setScripts((prev) => applyScriptChanges(prev, diff.changes))
+      }
+      scriptsVersion.current = diff.version
     } else {
       showToast(res.error || '加载脚本失败')
     }
@@ -42,6 +76,26 @@ function App() {
     loadScripts()
   }, [loadScripts])
 
+  // 脚本上报的结构化进度（最近一次运行）
+  const progressRunId = useRef<string | null>(null)
+  useEffect(() => {
+    const offProgress = window.cedar.onRunProgress(({ run_id, ...p }) => {
+      progressRunId.current = run_id
+      setProgress(p)
+    })
+    const offStatus = window.cedar.onRunStatus(run => {
+      if (run.run_id === progressRunId.current && run.finished_at) {
+        setTimeout(() => {
+          if (progressRunId.current === run.run_id) setProgress(null)
+        }, 5000)
+      }
+    })
+    return () => {
+      offProgress()
+      offStatus()
+    }
+  }, [])
+
   // 选择脚本
   const selectScript = useCallback(async (node: ScriptNode) => {
     if (running) {
@@ -60,7 +114,7 @@ function App() {
   }, [running, showToast])
 
   // 运行脚本
-  const runScript = useCallback(async (config: Record<string, unknown>) => {
+  const runScript = useCallback(async (config: Record<string, unknown>, profile = false) => {
     if (!selectedPath || running) return
     setRunning(true)
     try {
@@ -69,11 +123,11 @@ function App() {
         showToast(terminal.error || '终端启动失败')
         return
       }
-      const res = await window.cedar.runScript(selectedPath, config)
+      const res = await window.cedar.runScript(selectedPath, config, profile)
       if (!res.ok) {
         showToast(res.error || '启动失败')
       } else {
-        showToast('已发送到终端')
+        showToast(profile ? '已发送到终端（性能分析已开启）' : '已发送到终端')
       }
     } catch (e) {
       showToast(String(e))
@@ -82,6 +136,21 @@ function App() {
     }
   }, [selectedPath, running, showToast])
 
+  // AI 分析终端内容：后台任务，输出由 EditorArea 流式显示
+  const startTerminalAnalysis = useCallback(async (log: string) => {
+    const res = await window.cedar.startAiJob('terminal', {
+      script_path: selectedPath,
+      config: collectConfigFromForm(),
+      terminal_log: log,
+    })
+    if (res.ok && res.data) {
+      window.dispatchEvent(new CustomEvent('ai-job-started', { detail: res.data }))
+      showToast('AI 分析已开始')
+    } else {
+      showToast(res.error || 'AI 分析启动失败')
+    }
+  }, [selectedPath, showToast])
+
   const scriptCount = scripts.reduce((count, node) => count + countRunnable(node), 0)
 
   return (
@@ -102,7 +171,7 @@ function App() {
           searchQuery={searchQuery}
           onSearchChange={setSearchQuery}
           onSelectScript={selectScript}
-          onRefresh={loadScripts}
+          onRefresh={() => loadScripts(true)}
           scriptCount={scriptCount}
           showToast={showToast}
         />
@@ -131,13 +200,7 @@ function App() {
             }}
             onAnalyze={(log) => {
               if (!selectedNode || !scriptDetail) return
-              window.cedar
-                .analyzeTerminal(selectedPath, collectConfigFromForm(), log)
-                .then(res => {
-                  if (res.ok && res.data) {
-                    showToast('AI 分析完成')
-                  }
-                })
+              startTerminalAnalysis(log)
             }}
             terminalTranscript={terminalTranscript}
             showToast={showToast}
@@ -147,16 +210,14 @@ function App() {
             onTranscriptChange={setTerminalTranscript}
             onAnalyze={() => {
               if (!selectedNode || !scriptDetail) return
-              window.cedar
-                .analyzeTerminal(selectedPath, collectConfigFromForm(), terminalTranscript)
-                .then(() => showToast('AI 分析已触发'))
+              startTerminalAnalysis(terminalTranscript)
             }}
             showToast={showToast}
           />
         </main>
       </div>
 
-      <StatusBar running={running} />
+      <StatusBar running={running} progress={progress} />
       <Toast message={toast} />
     </div>
   )
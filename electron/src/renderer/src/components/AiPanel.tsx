@@ -1,5 +1,5 @@
-import { useState, useCallback } from 'react'
-import type { ScriptNode, ScriptDetail, AiAssistPayload, ApiResult } from '../types/api'
+import { useState, useCallback, useEffect, useRef } from 'react'
+import type { ScriptNode, ScriptDetail, AiAssistPayload, AiJobInfo } from '../types/api'
 
 interface Props {
   selectedPath: string | null
@@ -21,6 +21,21 @@ const actionLabels: Record<AiAction, string> = {
 
 export function AiPanel({ selectedPath, selectedNode, scriptDetail, terminalTranscript, onAiResult, showToast }: Props) {
   const [loading, setLoading] = useState<AiAction | null>(null)
+  const jobRef = useRef<string | null>(null)
+
+  const finishJob = useCallback((job: AiJobInfo) => {
+    jobRef.current = null
+    setLoading(null)
+    if (job.status === 'cancelled') showToast('AI 处理已取消')
+    else if (job.status === 'finished' && job.exit_code === 0) showToast('AI 处理完成')
+    else showToast(job.error || `AI 处理失败（退出码 ${job.exit_code}）`)
+  }, [showToast])
+
+  // AI 任务在后台运行，输出由 EditorArea 流式显示；这里只跟踪结束状态
+  useEffect(() => window.cedar.onAiStatus(job => {
+    if (job.job_id !== jobRef.current) return
+    if (job.status !== 'queued' && job.status !== 'running') finishJob(job)
+  }), [finishJob])
 
   const doAction = useCallback(async (action: AiAction) => {
     if (!selectedPath || !scriptDetail) {
@@ -28,7 +43,6 @@ export function AiPanel({ selectedPath, selectedNode, scriptDetail, terminalTran
       return
     }
     setLoading(action)
-    onAiResult('AI 正在处理，请稍候...')
 
     const payload: AiAssistPayload = {
       action,
@@ -40,17 +54,20 @@ export function AiPanel({ selectedPath, selectedNode, scriptDetail, terminalTran
       terminal_log: terminalTranscript.slice(-16000),
     }
 
-    const res: ApiResult<{ review: string }> = await window.cedar.aiAssist(payload)
-    setLoading(null)
-
-    if (res.ok && res.data?.review) {
-      onAiResult(res.data.review)
-      showToast('AI 处理完成')
-    } else {
+    const res = await window.cedar.startAiJob('assist', payload)
+    if (!res.ok || !res.data) {
+      setLoading(null)
       onAiResult(`AI 处理失败：${res.error || '未知错误'}`)
       showToast(res.error || 'AI 处理失败')
+      return
     }
-  }, [selectedPath, selectedNode, scriptDetail, terminalTranscript, onAiResult, showToast])
+    window.dispatchEvent(new CustomEvent('ai-job-started', { detail: res.data }))
+    if (res.data.status === 'queued' || res.data.status === 'running') {
+      jobRef.current = res.data.job_id
+    } else {
+      finishJob(res.data)
+    }
+  }, [selectedPath, selectedNode, scriptDetail, terminalTranscript, onAiResult, showToast, finishJob])
 
   const actions: AiAction[] = ['explain_params', 'generate_command', 'diagnose_log', 'create_template']
 
@@ -68,6 +85,11 @@ export function AiPanel({ selectedPath, selectedNode, scriptDetail, terminalTran
               {loading === action ? '处理中...' : actionLabels[action]}
             </button>
           ))}
+          {loading !== null && (
+            <button className='btn-ghost' onClick={() => jobRef.current && window.cedar.cancelAiJob(jobRef.current)}>
+              取消
+            </button>
+          )}
         </div>
       </div>
 
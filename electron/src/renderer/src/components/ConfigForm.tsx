@@ -3,7 +3,7 @@ import type { ScriptField } from '../types/api'
 
 interface Props {
   fields: ScriptField[]
-  onRun: (config: Record<string, unknown>) => void
+  onRun: (config: Record<string, unknown>, profile?: boolean) => void
   onStop: () => void
   onReset: () => void
   running: boolean
@@ -13,6 +13,7 @@ interface Props {
 export function ConfigForm({ fields, onRun, onStop, onReset, running, selectedPath }: Props) {
   const formRef = useRef<HTMLFormElement>(null)
   const [config, setConfig] = useState<Record<string, unknown>>({})
+  const [profile, setProfile] = useState(false)
 
   useEffect(() => {
     // 初始化表单默认值
@@ -29,8 +30,8 @@ export function ConfigForm({ fields, onRun, onStop, onReset, running, selectedPa
 
   const handleRun = useCallback((e: React.FormEvent) => {
     e.preventDefault()
-    onRun(config)
-  }, [config, onRun])
+    onRun(config, profile)
+  }, [config, profile, onRun])
 
   const handleReset = useCallback(() => {
     const defaults: Record<string, unknown> = {}
@@ -41,6 +42,13 @@ export function ConfigForm({ fields, onRun, onStop, onReset, running, selectedPa
     onReset()
   }, [fields, onReset])
 
+  const profileToggle = (
+    <label className='muted' title='在 cProfile 下运行，结束后可查看热点函数与火焰图' style={{ display: 'flex', alignItems: 'center', gap: 4 }}>
+      <input type='checkbox' checked={profile} onChange={e => setProfile(e.target.checked)} />
+      性能分析
+    </label>
+  )
+
   if (!fields || fields.length === 0) {
     return (
       <div className='card'>
@@ -50,7 +58,8 @@ export function ConfigForm({ fields, onRun, onStop, onReset, running, selectedPa
             <p className='muted'>该脚本没有参数配置，点击「运行脚本」即可执行。</p>
           </div>
           <div style={{ display: 'flex', gap: 8 }}>
-            <button type='button' className='btn-primary' onClick={() => onRun(config)} disabled={running}>
+            {profileToggle}
+            <button type='button' className='btn-primary' onClick={() => onRun(config, profile)} disabled={running}>
               ▶ 运行脚本
             </button>
             <button type='button' className='btn-danger' onClick={onStop}>停止 / Ctrl+C</button>
@@ -68,6 +77,7 @@ export function ConfigForm({ fields, onRun, onStop, onReset, running, selectedPa
           <p className='muted'>由 form.yaml 生成，可保存为运行预设。</p>
         </div>
         <div style={{ display: 'flex', gap: 8 }}>
+          {profileToggle}
           <button type='button' className='btn-ghost' onClick={handleReset}>重置</button>
           <button type='button' className='btn-primary' onClick={handleRun} disabled={running}>
             ▶ 运行脚本
@@ -13,7 +13,7 @@ interface Props {
   selectedNode: ScriptNode | null
   scriptDetail: ScriptDetail | null
   running: boolean
-  onRun: (config: Record<string, unknown>) => void
+  onRun: (config: Record<string, unknown>, profile?: boolean) => void
   onStop: () => void
   onReset: () => void
   onAnalyze: (log: string) => void
@@ -36,6 +36,7 @@ export function EditorArea({
 }: Props) {
   const [aiReviewContent, setAiReviewContent] = useState<string | null>(null)
   const [status, setStatus] = useState<string>('空闲')
+  const aiJobRef = useRef<{ id: string; cursor: number } | null>(null)
 
   // 监听历史日志详情事件
   useEffect(() => {
@@ -52,6 +53,48 @@ export function EditorArea({
     return () => window.removeEventListener('show-log-detail', handler as EventListener)
   }, [])
 
+  // 流式显示最近启动的 AI 任务输出（由 ai-job-started 事件指定）
+  useEffect(() => {
+    const append = (id: string, text: string, cursor: number) => {
+      const job = aiJobRef.current
+      if (!job || job.id !== id || cursor <= job.cursor) return
+      const chars = Array.from(text)  // 游标按 Unicode 字符计
+      const fresh = chars.slice(Math.max(0, chars.length - (cursor - job.cursor))).join('')
+      const first = job.cursor === 0
+      job.cursor = cursor
+      setAiReviewContent(prev => (first ? '' : prev ?? '') + fresh)
+    }
+    const onStarted = (e: CustomEvent) => {
+      const id: string | undefined = e.detail?.job_id
+      if (!id) return
+      aiJobRef.current = { id, cursor: 0 }
+      setAiReviewContent('AI 正在处理，请稍候...')
+      // 补上事件到达前已产生的输出
+      window.cedar.getAiJob(id).then(res => {
+        if (res.ok && res.data) append(id, res.data.output, res.data.cursor)
+      })
+    }
+    window.addEventListener('ai-job-started', onStarted as EventListener)
+    const offOutput = window.cedar.onAiOutput(frame => append(frame.job_id, frame.data, frame.cursor))
+    const offStatus = window.cedar.onAiStatus(job => {
+      const current = aiJobRef.current
+      if (!current || current.id !== job.job_id) return
+      if (job.status === 'queued' || job.status === 'running') return
+      const failed = job.status !== 'finished' || job.exit_code !== 0
+      if (failed) {
+        const reason = job.status === 'cancelled' ? '已取消' : job.error || `退出码 ${job.exit_code}`
+        setAiReviewContent(prev => `${current.cursor ? prev ?? '' : ''}\n\n> AI 处理未完成：${reason}`)
+      } else if (!current.cursor) {
+        setAiReviewContent('AI 没有返回内容')
+      }
+    })
+    return () => {
+      window.removeEventListener('ai-job-started', onStarted as EventListener)
+      offOutput()
+      offStatus()
+    }
+  }, [])
+
   return (
     <section className='editor-area'>
       <div className='editor-pane'>
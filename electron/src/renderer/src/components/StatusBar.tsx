@@ -1,12 +1,24 @@
+import type { RunProgress } from '../types/api'
+
 interface Props {
   running: boolean
+  progress?: RunProgress | null
+}
+
+function formatProgress(p: RunProgress): string {
+  const parts = [p.total ? `${p.done}/${p.total}` : `${p.done}`]
+  if (p.throughput) parts.push(`${p.throughput.toFixed(1)}/s`)
+  if (p.eta !== null && p.total) parts.push(`剩余 ${Math.ceil(p.eta)}s`)
+  if (p.message) parts.push(p.message)
+  return parts.join(' · ')
 }
 
-export function StatusBar({ running }: Props) {
+export function StatusBar({ running, progress }: Props) {
   return (
     <footer className='statusbar'>
       <span>
         {running ? '⚡ 脚本运行中...' : 'CedarEx 工作区'}
+        {progress && <span className='progress'>  进度 {formatProgress(progress)}</span>}
       </span>
       <span className='right'>
         <span>AI：opencode 就绪</span>
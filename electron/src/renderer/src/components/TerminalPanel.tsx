@@ -12,7 +12,7 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
   const terminalRef = useRef<HTMLDivElement>(null)
   const xtermRef = useRef<Terminal | null>(null)
   const fitAddonRef = useRef<FitAddon | null>(null)
-  const pollerRef = useRef<ReturnType<typeof setInterval> | null>(null)
+  const unsubscribeRef = useRef<(() => void) | null>(null)
   const [title, setTitle] = useState('空闲')
 
   const initTerminal = useCallback(async () => {
@@ -39,6 +39,16 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
     xtermRef.current = term
     fitAddonRef.current = fitAddon
 
+    // sidecar 推送输出 → xterm；写入完成后确认，形成背压
+    // 先订阅再启动，避免丢失 shell 的首屏输出
+    let transcript = ''
+    unsubscribeRef.current = window.cedar.onTerminalOutput((frame) => {
+      transcript += frame.data
+      term.write(frame.data, () => {
+        window.cedar.terminalAck(frame.seq)
+      })
+    })
+
     // 启动 Python sidecar 终端
     const cols = term.cols || 100
     const rows = term.rows || 30
@@ -47,6 +57,8 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
       term.writeln(`终端启动失败: ${started.error}`)
       return
     }
+    // 新订阅：清空上一次挂载遗留的未确认帧计数（运行脚本时不会清空，背压窗口保持有效）
+    await window.cedar.terminalSubscribe()
     setTitle(`真实终端 — ${(started.data as { platform?: string })?.platform || 'ready'}`)
 
     // 终端输入 → Python
@@ -54,16 +66,6 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
       window.cedar.terminalWrite(data)
     })
 
-    // 终输出轮询 → xterm
-    let transcript = ''
-    pollerRef.current = setInterval(async () => {
-      const res = await window.cedar.terminalRead()
-      if (res.ok && res.data) {
-        transcript += res.data
-        term.write(res.data)
-      }
-    }, 50)
-
     // 定期更新 transcript
     const transcriptTimer = setInterval(() => {
       if (transcript) {
@@ -83,7 +85,8 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
 
     // Cleanup function stored on ref
     const cleanup = () => {
-      clearInterval(pollerRef.current!)
+      unsubscribeRef.current?.()
+      unsubscribeRef.current = null
       clearInterval(transcriptTimer)
       window.removeEventListener('resize', resizeHandler)
     }
@@ -93,7 +96,7 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
   useEffect(() => {
     initTerminal()
     return () => {
-      if (pollerRef.current) clearInterval(pollerRef.current)
+      unsubscribeRef.current?.()
       if (xtermRef.current) {
         ;(xtermRef.current as any).__cleanup?.()
         xtermRef.current.dispose()
@@ -103,7 +106,7 @@ export function TerminalPanel({ onTranscriptChange, onAnalyze, showToast }: Prop
 
   const restartTerminal = useCallback(async () => {
     await window.cedar.terminalStop()
-    if (pollerRef.current) clearInterval(pollerRef.current)
+    ;(xtermRef.current as any)?.__cleanup?.()
     xtermRef.current?.dispose()
     xtermRef.current = null
     setTitle('空闲')
@@ -5,6 +5,18 @@ export interface ScriptNode {
   children: ScriptNode[]
 }
 
+export type ScriptTreeChange =
+  | { op: 'remove'; path: string }
+  | { op: 'add'; parent: string; index: number; node: ScriptNode }
+  | { op: 'update'; path: string; runnable: boolean }
+
+export interface ScriptTreeDiff {
+  version: number
+  reset: boolean
+  tree?: ScriptNode[]
+  changes: ScriptTreeChange[]
+}
+
 export interface ScriptField {
   name: string
   label?: string
@@ -26,9 +38,19 @@ export interface ScriptDetail {
 export interface LogItem {
   name: string
   path: string
+  script: string
   modified: string
   size: number
+  exit_code: number | null
+  run_id: string | null
   preview: string
+  metrics?: RunMetricsSummary | null
+}
+
+export interface LogFilter {
+  script?: string
+  dateFrom?: string
+  dateTo?: string
 }
 
 export interface LogDetail {
@@ -38,6 +60,168 @@ export interface LogDetail {
   size: number
   content: string
   clipped: boolean
+  offset_start: number
+  offset_end: number
+  line_start?: number
+  line_end?: number
+  total_lines?: number
+}
+
+export interface LogSearchHit {
+  path: string
+  script: string
+  modified: string
+  offset: number
+  snippet: string
+  match_start: number
+}
+
+export interface LogRange {
+  offset?: number
+  length?: number
+  line?: number
+  lines?: number
+  direction?: 'forward' | 'backward'
+}
+
+export interface TerminalOutputFrame {
+  seq: number
+  data: string
+}
+
+export type RunStatus = 'queued' | 'running' | 'finished' | 'cancelled' | 'failed'
+
+export interface ScriptRunInfo {
+  run_id: string
+  script_name: string
+  script_path: string
+  status: RunStatus
+  error: string
+  pid: number | null
+  created_at: string
+  started_at: string | null
+  finished_at: string | null
+  exit_code: number | null
+  progress?: RunProgress | null
+  metrics?: RunMetricsSummary | null
+  profiled?: boolean
+}
+
+export interface ProfileEntry {
+  function: string
+  file: string
+  line: number
+  label: string
+  calls: number
+  primitive_calls: number
+  self_time: number
+  cumulative_time: number
+}
+
+export interface RunProfile {
+  run_id: string
+  total_time: number
+  total_calls: number
+  by_cumulative: ProfileEntry[]
+  by_self: ProfileEntry[]
+  stats_path: string
+  collapsed_path: string
+}
+
+export interface RunMetricsSummary {
+  duration: number
+  cpu_time: number
+  cpu_percent: number
+  rss_peak: number
+  threads_peak: number
+  procs_peak: number
+  read_bytes: number
+  write_bytes: number
+  disk_read: number
+  disk_write: number
+  io_wait: number
+  bound: 'cpu' | 'io' | 'wait'
+  samples: number
+}
+
+export interface RunMetricsSample {
+  t: number
+  cpu: number | null
+  cpu_time: number
+  rss: number
+  read_bytes: number
+  write_bytes: number
+  threads: number
+  procs: number
+}
+
+export interface RunMetrics {
+  run_id: string
+  script: string
+  finished: boolean
+  summary: RunMetricsSummary
+  interval: number
+  series: RunMetricsSample[]
+  previous: (RunMetricsSummary & { run_id: string; finished_at: string; exit_code: number | null })[]
+}
+
+export interface RunProgress {
+  done: number
+  total: number | null
+  throughput: number | null
+  eta: number | null
+  message: string
+}
+
+export interface RunProgressEvent extends RunProgress {
+  run_id: string
+}
+
+export type BatchItemStatus = 'pending' | 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled'
+
+export interface BatchItem {
+  index: number
+  params: Record<string, unknown>
+  status: BatchItemStatus
+  attempts: number
+  run_id: string | null
+  run_ids: string[]
+  exit_code: number | null
+  duration: number | null
+  error: string
+}
+
+export interface BatchSummary {
+  batch_id: string
+  script_path: string
+  status: 'running' | 'finished' | 'cancelled'
+  parallel: number
+  retries: number
+  total: number
+  counts: Partial<Record<BatchItemStatus, number>>
+  created_at: string
+  finished_at: string | null
+  elapsed: number
+}
+
+export interface BatchInfo extends BatchSummary {
+  items: BatchItem[]
+}
+
+export interface BatchStatusEvent extends BatchSummary {
+  item?: BatchItem
+}
+
+export interface BatchRequest {
+  configs?: Record<string, unknown>[]
+  grid?: Record<string, unknown[]>
+  base_config?: Record<string, unknown>
+  parallel?: number
+  retries?: number
+}
+
+export interface RunOutputFrame extends TerminalOutputFrame {
+  run_id: string
 }
 
 export interface ApiResult<T = unknown> {
@@ -56,26 +240,77 @@ export interface AiAssistPayload {
   terminal_log: string
 }
 
+export type AiJobKind = 'run' | 'terminal' | 'assist'
+
+export interface AiJobInfo {
+  job_id: string
+  kind: AiJobKind
+  status: 'queued' | 'running' | 'finished' | 'failed' | 'cancelled'
+  error: string
+  exit_code: number | null
+  created_at: string
+  started_at: string | null
+  finished_at: string | null
+  length: number
+}
+
+export interface AiOutputFrame {
+  job_id: string
+  data: string
+  cursor: number
+}
+
 declare global {
   interface Window {
     cedar: {
       getScripts: () => Promise<ApiResult<ScriptNode[]>>
+      getScriptsDiff: (sinceVersion: number, validate?: boolean) => Promise<ApiResult<ScriptTreeDiff>>
       getScriptDetail: (path: string) => Promise<ApiResult<ScriptDetail>>
-      runScript: (path: string, config: unknown) => Promise<ApiResult>
+      runScript: (path: string, config: unknown, profile?: boolean) => Promise<ApiResult>
 
       terminalStart: (cols?: number, rows?: number) => Promise<ApiResult>
       terminalRead: () => Promise<ApiResult<string>>
+      terminalSubscribe: () => Promise<ApiResult>
+      terminalAck: (seq: number) => Promise<ApiResult>
+      onTerminalOutput: (callback: (frame: TerminalOutputFrame) => void) => () => void
       terminalWrite: (data: string) => Promise<ApiResult>
       terminalResize: (cols: number, rows: number) => Promise<ApiResult>
       terminalStop: () => Promise<ApiResult>
 
+      startRun: (path: string, config: unknown, profile?: boolean) => Promise<ApiResult<ScriptRunInfo>>
+      listRuns: () => Promise<ApiResult<ScriptRunInfo[]>>
+      attachRun: (runId: string, cursor?: number) => Promise<ApiResult<ScriptRunInfo & { text: string; cursor: number }>>
+      runWrite: (runId: string, data: string) => Promise<ApiResult>
+      cancelRun: (runId: string) => Promise<ApiResult<ScriptRunInfo>>
+      getRunMetrics: (runId: string) => Promise<ApiResult<RunMetrics>>
+      getRunProfile: (runId: string) => Promise<ApiResult<RunProfile>>
+      streamRun: (runId: string) => Promise<ApiResult<ScriptRunInfo>>
+      unstreamRun: (runId: string) => Promise<ApiResult>
+      runAck: (runId: string, seq: number) => Promise<ApiResult>
+      onRunOutput: (callback: (frame: RunOutputFrame) => void) => () => void
+      onRunStatus: (callback: (run: ScriptRunInfo) => void) => () => void
+      onRunProgress: (callback: (progress: RunProgressEvent) => void) => () => void
+
+      runBatch: (path: string, request: BatchRequest) => Promise<ApiResult<BatchInfo>>
+      getBatch: (batchId: string) => Promise<ApiResult<BatchInfo>>
+      listBatches: () => Promise<ApiResult<BatchSummary[]>>
+      cancelBatch: (batchId: string) => Promise<ApiResult<BatchInfo>>
+      onBatchStatus: (callback: (status: BatchStatusEvent) => void) => () => void
+
       stopCurrent: () => Promise<ApiResult>
       analyzeRun: (runId: string) => Promise<ApiResult<{ review: string }>>
       analyzeTerminal: (path: string, config: unknown, log: string) => Promise<ApiResult<{ review: string }>>
       aiAssist: (payload: AiAssistPayload) => Promise<ApiResult<{ review: string }>>
+      startAiJob: (kind: AiJobKind, params: unknown) => Promise<ApiResult<AiJobInfo>>
+      getAiJob: (jobId: string, cursor?: number) => Promise<ApiResult<AiJobInfo & { output: string; cursor: number }>>
+      listAiJobs: () => Promise<ApiResult<AiJobInfo[]>>
+      cancelAiJob: (jobId: string) => Promise<ApiResult<AiJobInfo>>
+      onAiOutput: (callback: (frame: AiOutputFrame) => void) => () => void
+      onAiStatus: (callback: (job: AiJobInfo) => void) => () => void
 
-      getRecentLogs: (limit?: number) => Promise<ApiResult<LogItem[]>>
-      getLogDetail: (path: string, maxChars?: number) => Promise<ApiResult<LogDetail>>
+      getRecentLogs: (limit?: number, offset?: number, filter?: LogFilter) => Promise<ApiResult<LogItem[]>>
+      getLogDetail: (path: string, maxChars?: number, range?: LogRange) => Promise<ApiResult<LogDetail>>
+      searchLogs: (query: string, filter?: LogFilter, limit?: number) => Promise<ApiResult<{ results: LogSearchHit[]; indexing: boolean }>>
 
       chooseDirectory: () => Promise<ApiResult<string>>
       chooseFile: () => Promise<ApiResult<string>>
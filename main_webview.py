@@ -1,12 +1,20 @@
+import codecs
+import bisect
+import itertools
 import json
+import mmap
 import os
 import platform
+import sqlite3
 import subprocess
 import sys
 import tempfile
 import threading
 import time
-from datetime import datetime
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
 from pathlib import Path
 
 import yaml
@@ -15,19 +23,119 @@ import yaml
 BASE_DIR = Path(__file__).resolve().parent
 SCRIPTS_DIR = BASE_DIR / 'scripts'
 WEB_DIR = BASE_DIR / 'web'
+SDK_DIR = BASE_DIR / 'sdk'  # 脚本可 import 的运行时辅助（cedarex），运行时加入 PYTHONPATH
 LOG_DIR = BASE_DIR / 'log'
+RUN_LOG_DIR = LOG_DIR / 'runs'
+RUN_STATUS_MAX_BYTES = 1024 * 1024
+PROGRESS_INTERVAL = 0.5  # 进度通知最小间隔（秒）
+METRICS_INTERVAL = 1.0  # 资源采样间隔（秒）；运行初期更密，以覆盖短任务
+METRICS_MAX_SAMPLES = 600  # 时间序列点数上限，超出后隔点抽稀并加倍采样间隔
+PROFILE_TOP = 30  # get_run_profile 默认返回的函数条数
+HISTORY_DB_PATH = LOG_DIR / 'history.db'
+SEARCH_DB_PATH = LOG_DIR / 'search.db'
+SEARCH_CHUNK_BYTES = 64 * 1024
+LOG_PREVIEW_CHARS = 300
+LOG_PAGE_BYTES = 256 * 1024
+LOG_PAGE_LINES = 1000
+LINE_INDEX_CACHE_SIZE = 32
+PTY_READ_MIN = 4096
+PTY_READ_MAX = 64 * 1024
+BATCH_MAX_ITEMS = 1000
+BATCH_MAX_RETRIES = 5
+BATCH_BUFFER_BYTES = 256 * 1024  # 批量运行每项的终端缓冲；完整输出已归档到运行日志
+MAX_PARALLEL_RUNS = int(os.environ.get('CEDAR_MAX_PARALLEL_RUNS') or os.cpu_count() or 1)
+TERMINAL_BUFFER_BYTES = int(os.environ.get('CEDAR_TERMINAL_BUFFER_BYTES') or 4 * 1024 * 1024)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)  # 有 libyaml 时用 C 实现
+WARM_WORKERS = os.environ.get('CEDAR_WARM_WORKERS', '0') not in ('', '0', 'false', 'no')
+WARM_PRELOAD = os.environ.get('CEDAR_WARM_PRELOAD', 'numpy,cv2,pandas,altair,cedar')
+AI_COMMAND = os.environ.get('CEDAR_AI_COMMAND') or 'opencode'  # 可换成本地桩程序，调用方式为 <命令> run <prompt>
+AI_MAX_JOBS = int(os.environ.get('CEDAR_AI_MAX_JOBS') or 2)
+AI_TIMEOUT = 180
+AI_KEEP_JOBS = 50  # 保留的已结束 AI 任务数
+CONFIG_HANDOFF = os.environ.get('CEDAR_CONFIG_HANDOFF') or ('pipe' if os.name == 'posix' else 'file')
+
+
+class OutputBuffer:
+    """定长字节环形缓冲。
+
+    写入位置用累计字节数（绝对偏移）表示，读者各自持有游标；
+    游标落后于最旧的保留字节时，返回被覆盖丢弃的字节数。
+    """
+
+    def __init__(self, capacity=TERMINAL_BUFFER_BYTES):
+        self.capacity = max(int(capacity), 1024)
+        self.buf = bytearray(self.capacity)
+        self.end = 0
+
+    @property
+    def start(self):
+        return max(0, self.end - self.capacity)
+
+    def write(self, data: bytes):
+        skip = max(0, len(data) - self.capacity)
+        if skip:
+            data = data[skip:]
+            self.end += skip
+        pos = self.end % self.capacity
+        first = min(len(data), self.capacity - pos)
+        self.buf[pos:pos + first] = data[:first]
+        self.buf[:len(data) - first] = data[first:]
+        self.end += len(data)
+
+    def read(self, cursor, max_bytes=None):
+        """从 cursor 开始读取，返回 (bytes, 新游标, 丢弃字节数)。
+
+        读取边界会对齐到 UTF-8 字符边界，避免切断多字节字符。
+        """
+        start = self.start
+        dropped = 0
+        if cursor < start:
+            dropped = start - cursor
+            cursor = start
+            while cursor < self.end and self._is_continuation(cursor):
+                cursor += 1
+                dropped += 1
+        cursor = min(cursor, self.end)
+        stop = self.end if not max_bytes else min(self.end, cursor + int(max_bytes))
+        while cursor < stop < self.end and self._is_continuation(stop):
+            stop -= 1
+        return self._slice(cursor, stop), stop, dropped
+
+    def _is_continuation(self, offset):
+        return self.buf[offset % self.capacity] & 0xC0 == 0x80
+
+    def _slice(self, begin, stop):
+        if stop <= begin:
+            return b''
+        a = begin % self.capacity
+        b = a + (stop - begin)
+        if b <= self.capacity:
+            return bytes(self.buf[a:b])
+        return bytes(self.buf[a:]) + bytes(self.buf[:b - self.capacity])
 
 
 class TerminalSession:
-    def __init__(self, cwd=None):
+    """PTY 会话。默认启动交互式 shell；传入 argv 时直接在 PTY 中运行该命令。"""
+
+    def __init__(self, cwd=None, buffer_bytes=TERMINAL_BUFFER_BYTES, argv=None, env=None, spawner=None,
+                 pass_fds=()):
         self.cwd = str(cwd or BASE_DIR)
         self.system = platform.system()
-        self.output = []
+        self.argv = list(argv) if argv else None
+        self.env = env
+        self.spawner = spawner  # (argv, cwd, env, slave_fd, pass_fds) -> 进程对象或 None，None 时照常 Popen
+        self.pass_fds = tuple(pass_fds)  # 按原编号继承给子进程的 fd（仅 POSIX）
+        self.output = OutputBuffer(buffer_bytes)
+        self.cursors = {}  # 具名读者 → 游标，供 read() 使用
+        self.listeners = []  # 读线程收到新输出后的回调（sidecar 推送用）
         self.alive = False
         self.lock = threading.Lock()
         self.process = None
         self.master_fd = None
+        self._wake_w = None  # 读线程自管道写端，stop() 写入以唤醒阻塞的 select
+        self._wake_lock = threading.Lock()  # 保护 _wake_w 的检查、写入与关闭，避免写入已被复用的 fd 编号
         self.winpty = None
+        self._reader_thread = None
 
     def start(self, cols=100, rows=30):
         if self.alive:
@@ -48,31 +156,77 @@ class TerminalSession:
         shell = os.environ.get('SHELL') or ('/bin/zsh' if Path('/bin/zsh').exists() else '/bin/bash')
         master_fd, slave_fd = pty.openpty()
         self.master_fd = master_fd
-        self.process = subprocess.Popen(
-            [shell],
-            cwd=self.cwd,
-            stdin=slave_fd,
-            stdout=slave_fd,
-            stderr=slave_fd,
-            env=os.environ.copy(),
-            close_fds=True,
-        )
-        os.close(slave_fd)
+        try:
+            if self.spawner and self.argv:
+                self.process = self.spawner(self.argv, self.cwd, self.env or os.environ.copy(), slave_fd, self.pass_fds)
+            self.process = self.process or subprocess.Popen(
+                self.argv or [shell],
+                cwd=self.cwd,
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                env=self.env or os.environ.copy(),
+                close_fds=True,
+                pass_fds=self.pass_fds,
+                start_new_session=self.argv is not None,
+                preexec_fn=self._set_controlling_tty if self.argv is not None else None,
+            )
+        except BaseException:
+            os.close(master_fd)
+            self.master_fd = None
+            raise
+        finally:
+            os.close(slave_fd)
         self.resize(cols, rows)
 
+        wake_r, wake_w = os.pipe()
+        self._wake_w = wake_w
+
         def reader():
-            while self.process and self.process.poll() is None:
-                try:
-                    ready, _, _ = select.select([master_fd], [], [], 0.1)
-                    if ready:
-                        data = os.read(master_fd, 4096).decode(errors='ignore')
-                        if data:
-                            with self.lock:
-                                self.output.append(data)
-                except OSError:
-                    break
+            # 增量解码：跨 read 边界的多字节字符留到下次拼接，不会被截断
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            chunk_size = PTY_READ_MIN
+            try:
+                while True:
+                    # 无超时阻塞等待；stop() 通过自管道唤醒
+                    ready, _, _ = select.select([master_fd, wake_r], [], [])
+                    if wake_r in ready:
+                        break
+                    data = os.read(master_fd, chunk_size)
+                    if not data:
+                        break
+                    # 自适应读取大小：读满则加倍，输出稀疏时回落
+                    if len(data) == chunk_size:
+                        chunk_size = min(chunk_size * 2, PTY_READ_MAX)
+                    elif len(data) < chunk_size // 4:
+                        chunk_size = max(chunk_size // 2, PTY_READ_MIN)
+                    text = decoder.decode(data)
+                    if text:
+                        self._append_output(text)
+            except (OSError, ValueError):
+                pass
+            finally:
+                tail = decoder.decode(b'', final=True)
+                if tail:
+                    self._append_output(tail)
+                with self._wake_lock:
+                    self._wake_w = None
+                    for fd in (wake_r, wake_w):
+                        try:
+                            os.close(fd)
+                        except OSError:
+                            pass
+
+        self._reader_thread = threading.Thread(target=reader, daemon=True)
+        self._reader_thread.start()
+
+    @staticmethod
+    def _set_controlling_tty():
+        """子进程中（setsid 之后）把 PTY 从端设为控制终端，Ctrl+C 才会以 SIGINT 送达脚本。"""
+        import fcntl
+        import termios
 
-        threading.Thread(target=reader, daemon=True).start()
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
 
     def _start_windows(self, cols, rows):
         try:
@@ -81,114 +235,2566 @@ class TerminalSession:
             raise RuntimeError('Windows 真实终端需要安装 pywinpty') from exc
 
         shell = 'powershell.exe'
-        self.winpty = PtyProcess.spawn(shell, cwd=self.cwd, dimensions=(rows, cols))
+        self.winpty = PtyProcess.spawn(self.argv or shell, cwd=self.cwd, env=self.env, dimensions=(rows, cols))
 
         def reader():
             while self.winpty and self.winpty.isalive():
                 try:
                     data = self.winpty.read(4096)
                     if data:
-                        with self.lock:
-                            self.output.append(data)
+                        self._append_output(data)
                 except Exception:
                     break
 
-        threading.Thread(target=reader, daemon=True).start()
+        self._reader_thread = threading.Thread(target=reader, daemon=True)
+        self._reader_thread.start()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _append_output(self, data):
+        with self.lock:
+            self.output.write(data.encode('utf-8'))
+        for callback in list(self.listeners):
+            callback()
+
+    @property
+    def pid(self):
+        if self.winpty:
+            return self.winpty.pid
+        return self.process.pid if self.process else None
+
+    def poll(self):
+        """进程仍在运行时返回 None，否则返回退出码。"""
+        if self.winpty:
+            return None if self.winpty.isalive() else self.winpty.exitstatus
+        return self.process.poll() if self.process else None
+
+    def wait(self):
+        """等待进程退出并读完剩余输出，返回退出码。"""
+        if self.winpty:
+            while self.winpty.isalive():
+                time.sleep(0.2)
+            code = self.winpty.exitstatus
+        else:
+            code = self.process.wait()
+        if self._reader_thread:
+            self._reader_thread.join(timeout=2)
+        return code
+
+    def cursor(self):
+        """当前输出末尾的游标；新读者从这里开始只读取之后的输出。"""
+        with self.lock:
+            return self.output.end
+
+    def read_from(self, cursor, max_bytes=None):
+        """按游标读取输出，返回 (文本, 新游标)，不影响其他读者。"""
+        with self.lock:
+            data, cursor, dropped = self.output.read(int(cursor or 0), max_bytes)
+        text = data.decode('utf-8', errors='replace')
+        if dropped:
+            text = f'\r\n[输出过多，已丢弃 {dropped} 字节]\r\n' + text
+        return text, cursor
+
+    def pending_size(self, reader='default'):
+        with self.lock:
+            return self.output.end - self.cursors.get(reader, self.output.start)
+
+    def read(self, max_bytes=None, reader='default'):
+        """读取具名读者自上次读取以来的输出；max_bytes 限制单次返回的字节数。"""
+        with self.lock:
+            cursor = self.cursors.get(reader, self.output.start)
+        text, cursor = self.read_from(cursor, max_bytes)
+        with self.lock:
+            self.cursors[reader] = cursor
+        return text
+
+    def write(self, data):
+        if not self.alive:
+            return
+        if self.system == 'Windows':
+            if self.winpty:
+                self.winpty.write(data)
+        elif self.master_fd is not None:
+            os.write(self.master_fd, data.encode())
+
+    def resize(self, cols, rows):
+        if self.system == 'Windows':
+            if self.winpty:
+                self.winpty.setwinsize(rows, cols)
+            return
+        if self.master_fd is None:
+            return
+        import fcntl
+        import struct
+        import termios
+
+        size = struct.pack('HHHH', rows, cols, 0, 0)
+        fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ, size)
+
+    def stop(self):
+        self.alive = False
+        if self.system == 'Windows' and self.winpty:
+            try:
+                self.winpty.close()
+            except Exception:
+                pass
+        with self._wake_lock:
+            if self._wake_w is not None:
+                try:
+                    os.write(self._wake_w, b'\0')
+                except OSError:
+                    pass
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+        if self.master_fd is not None:
+            try:
+                os.close(self.master_fd)
+            except OSError:
+                pass
+            self.master_fd = None
+
+
+def should_skip_directory(dir_name):
+    skip_patterns = {'.build', '__pycache__', '.git', '.svn', '.hg', 'node_modules', '.vscode', '.idea'}
+    return dir_name in skip_patterns or dir_name.endswith('.build')
+
+
+def get_script_file_path(script_dir):
+    main_py = script_dir / 'main.py'
+    if main_py.exists():
+        return main_py
+
+    for file_path in script_dir.iterdir():
+        name = file_path.name
+        if (name.startswith('main.cpython-') or name.startswith('main.cp')) and name.endswith(('.so', '.pyd')):
+            return file_path
+    return None
+
+
+def has_script_file(script_dir):
+    return script_dir.is_dir() and get_script_file_path(script_dir) is not None
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def compile_field_validator(field):
+    """把 form.yaml 中的一个字段定义编译成校验函数 value -> 错误信息（通过时为 None）。
+
+    支持字段已有的 type（int/float/bool/select，其余按文本）、min、max、options、required。
+    """
+    label = field.get('label') or field.get('name')
+    field_type = field.get('type') or 'text'
+    required = bool(field.get('required'))
+    minimum, maximum = field.get('min'), field.get('max')
+    options = field.get('options')
+    allowed = {str(opt) for opt in options} if options else None
+    checks = []
+
+    if field_type == 'int':
+        def to_number(value):
+            if isinstance(value, bool):
+                raise ValueError
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            return int(value) if isinstance(value, int) else int(str(value).strip())
+        number_error = f'{label}: 必须为整数'
+    elif field_type == 'float':
+        def to_number(value):
+            if isinstance(value, bool):
+                raise ValueError
+            return float(value) if isinstance(value, (int, float)) else float(str(value).strip())
+        number_error = f'{label}: 必须为数字'
+    else:
+        to_number = None
+
+    if to_number is not None:
+        def check_number(value):
+            try:
+                number = to_number(value)
+            except (TypeError, ValueError):
+                return number_error
+            if minimum is not None and number < minimum:
+                return f'{label}: 不能小于 {minimum}'
+            if maximum is not None and number > maximum:
+                return f'{label}: 不能大于 {maximum}'
+            return None
+        checks.append(check_number)
+    elif field_type == 'bool':
+        checks.append(lambda value: None if isinstance(value, bool) or value in (0, 1) else f'{label}: 必须为布尔值')
+    if allowed is not None:
+        checks.append(lambda value: None if str(value) in allowed else f'{label}: 必须是 {"、".join(sorted(allowed))} 之一')
+
+    def validate(value):
+        if _is_empty(value):
+            return f'{label}: 必填' if required else None
+        for check in checks:
+            error = check(value)
+            if error:
+                return error
+        return None
+
+    return validate
+
+
+def utf8_complete_length(data: bytes) -> int:
+    """返回 data 中以完整 UTF-8 字符结尾的前缀长度（去掉末尾被截断的多字节字符）。"""
+    for k in range(1, min(4, len(data)) + 1):
+        byte = data[-k]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte >= 0xC0:
+            need = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            if need > k:
+                return len(data) - k
+        break
+    return len(data)
+
+
+def read_text_range(path, offset=0, max_bytes=None):
+    """从字节偏移 offset 起读取文本，返回 (文本, 下一个偏移, 文件大小)。
+
+    只读取 [offset, offset + max_bytes) 区间，结尾对齐到 UTF-8 字符边界，
+    调用方可把返回的偏移作为下次读取的游标。
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        offset = min(max(int(offset or 0), 0), size)
+        length = size - offset if not max_bytes else min(size - offset, int(max_bytes))
+        f.seek(offset)
+        data = f.read(length)
+    if offset + len(data) < size:
+        data = data[:utf8_complete_length(data)]
+    return data.decode('utf-8', errors='replace'), offset + len(data), size
+
+
+def read_byte_range(path, start, stop):
+    """读取 [start, stop) 字节区间，两端对齐到 UTF-8 字符边界。
+
+    返回 (文本, 实际起点, 实际终点, 文件大小)。
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        start = min(max(int(start), 0), size)
+        stop = min(max(int(stop), start), size)
+        f.seek(start)
+        data = f.read(stop - start)
+    skip = 0
+    while start > 0 and skip < min(3, len(data)) and data[skip] & 0xC0 == 0x80:
+        skip += 1
+    data = data[skip:]
+    if stop < size:
+        data = data[:utf8_complete_length(data)]
+    start += skip
+    return data.decode('utf-8', errors='replace'), start, start + len(data), size
+
+
+def read_tail_text(path, max_chars):
+    """只读取文件末尾（按 UTF-8 最多 4 字节/字符估算），返回最后 max_chars 个字符。"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - max_chars * 4))
+        data = f.read()
+    return data.decode('utf-8', errors='ignore')[-max_chars:]
+
+
+def profile_label(func):
+    """pstats 的 (文件, 行号, 函数名) → 'name (file:line)'；内建函数只保留名称。"""
+    filename, line, name = func
+    if filename == '~' and line == 0:
+        return name
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def profile_top(stats, limit=PROFILE_TOP):
+    """按累计耗时和自身耗时各取前 limit 个函数。"""
+    rows = []
+    for func, (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            'function': func[2],
+            'file': func[0],
+            'line': func[1],
+            'label': profile_label(func),
+            'calls': nc,
+            'primitive_calls': cc,
+            'self_time': round(tt, 6),
+            'cumulative_time': round(ct, 6),
+        })
+    limit = max(1, int(limit))
+    return (
+        sorted(rows, key=lambda row: row['cumulative_time'], reverse=True)[:limit],
+        sorted(rows, key=lambda row: row['self_time'], reverse=True)[:limit],
+    )
+
+
+def collapse_profile(stats, min_fraction=0.0005, max_depth=64):
+    """把 cProfile 调用图展开为 flamegraph 折叠栈：{'a;b;c': 微秒}。
+
+    cProfile 只记录调用者→被调用者的边，同一函数在不同调用路径上的耗时按各边的累计耗时比例
+    分摊，因此是近似栈。递归边的耗时已含在该函数的总量中，直接略去；超过 max_depth 或占比低于
+    min_fraction 的分支计入当前帧自身。
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    total = sum(entry[2] for entry in raw.values())
+    threshold = total * min_fraction
+    stacks = {}
+
+    def walk(func, weight, path, labels):
+        ct = raw[func][3]
+        share = weight / ct if ct > 0 else 0.0
+        own = raw[func][2] * share
+        for callee, edge_ct in callees.get(func, ()):
+            child = edge_ct * share
+            if callee in path:
+                continue
+            if len(labels) >= max_depth or child < threshold:
+                own += child
+            else:
+                walk(callee, child, path | {callee}, labels + [profile_label(callee)])
+        key = ';'.join(labels)
+        stacks[key] = stacks.get(key, 0.0) + own
+
+    for func, entry in raw.items():
+        if not entry[4] and entry[3] >= threshold:
+            walk(func, entry[3], {func}, [profile_label(func)])
+    return {key: int(value * 1e6) for key, value in stacks.items() if value * 1e6 >= 1}
+
+
+class DirectoryWatcher:
+    """目录树变化监听基类。
+
+    Linux 上使用 inotify（ctypes 调用 libc，无额外依赖），递归监听所有子目录；
+    其他平台或 inotify 不可用时每隔 poll_interval 调用子类的 _poll()。
+    子类实现 _initial_scan / _poll / _on_event / _on_overflow。
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    thread_name = 'dir-watcher'
+
+    def __init__(self, root, poll_interval=2.0):
+        self.root = Path(root)
+        self.poll_interval = poll_interval
+        self.ready = threading.Event()
+        self.backend = None  # 'inotify' / 'poll'
+        self._wds = {}       # inotify watch 描述符 → 目录
+        self._fd = None
+        self._wake_r = self._wake_w = None
+        self._stopped = False
+
+    def start(self):
+        threading.Thread(target=self._run, name=self.thread_name, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b'\0')
+            except OSError:
+                pass
+
+    def _initial_scan(self):
+        pass
+
+    def _poll(self):
+        pass
+
+    def _on_event(self, path, mask, now):
+        pass
+
+    def _on_overflow(self):
+        self._poll()
+
+    def _skip_dir(self, name):
+        return False
+
+    def _run(self):
+        try:
+            self._initial_scan()
+        finally:
+            self.ready.set()
+        if self._start_inotify():
+            self.backend = 'inotify'
+            self._inotify_loop()
+        else:
+            self.backend = 'poll'
+            while not self._stopped:
+                time.sleep(self.poll_interval)
+                self._poll()
+
+    def _start_inotify(self):
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC)
+            if fd < 0:
+                return False
+        except (OSError, AttributeError):
+            return False
+        self._libc = libc
+        self._fd = fd
+        self._wake_r, self._wake_w = os.pipe()
+        self._watch_tree(self.root)
+        return bool(self._wds)
+
+    def _watch_tree(self, directory):
+        for current, dirs, _ in os.walk(str(directory)):
+            dirs[:] = [d for d in dirs if not self._skip_dir(d)]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), self.WATCH_MASK)
+            if wd >= 0:
+                self._wds[wd] = current
+
+    def _inotify_loop(self):
+        import select
+        import struct
+
+        header = struct.Struct('iIII')
+        try:
+            while not self._stopped:
+                ready, _, _ = select.select([self._fd, self._wake_r], [], [])
+                if self._wake_r in ready:
+                    break
+                buf = os.read(self._fd, 64 * 1024)
+                now = time.monotonic()
+                offset = 0
+                while offset + header.size <= len(buf):
+                    wd, mask, _, name_len = header.unpack_from(buf, offset)
+                    offset += header.size
+                    name = os.fsdecode(buf[offset:offset + name_len].rstrip(b'\0'))
+                    offset += name_len
+                    self._handle_event(wd, mask, name, now)
+        except OSError:
+            pass
+        finally:
+            for fd in (self._fd, self._wake_r, self._wake_w):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._wake_w = None
+
+    def _handle_event(self, wd, mask, name, now):
+        if mask & self.IN_Q_OVERFLOW:
+            self._on_overflow()
+            return
+        directory = self._wds.get(wd)
+        if directory is None:
+            return
+        if mask & (self.IN_IGNORED | self.IN_DELETE_SELF):
+            self._wds.pop(wd, None)
+            self._on_event(directory, mask, now)
+            return
+        path = os.path.join(directory, name)
+        if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO) and not self._skip_dir(name):
+            self._watch_tree(path)
+        self._on_event(path, mask, now)
+
+
+class LogWatcher(DirectoryWatcher):
+    """维护 log/ 下 *.log 文件的内存索引，记录每个文件最近一次被写入的时间。
+
+    状态查询只需检查运行开始后有写入的文件，不再每次遍历整个日志目录。
+    """
+
+    thread_name = 'log-watcher'
+
+    def __init__(self, root=LOG_DIR, suffix='.log', poll_interval=2.0):
+        super().__init__(root, poll_interval)
+        self.suffix = suffix
+        self.files = {}      # 路径 → {'size', 'mtime', 'changed'}，changed 为 time.monotonic()
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        """当前已知的 {路径: 大小}，作为运行开始时的读取偏移。"""
+        self.ready.wait(timeout=5)
+        with self.lock:
+            return {path: info['size'] for path, info in self.files.items()}
+
+    def entries(self, paths=None):
+        """返回 {路径: (大小, mtime)}；paths 为空时返回全部。"""
+        with self.lock:
+            if paths is None:
+                return {path: (info['size'], info['mtime']) for path, info in self.files.items()}
+            return {path: (self.files[path]['size'], self.files[path]['mtime']) for path in paths if path in self.files}
+
+    def count(self):
+        with self.lock:
+            return len(self.files)
+
+    def changed_since(self, since):
+        """返回 since（time.monotonic()）之后有写入的日志路径。"""
+        with self.lock:
+            return sorted(path for path, info in self.files.items() if info['changed'] >= since)
+
+    def _initial_scan(self):
+        self._scan(self.root, mark_changed=False)
+
+    def _poll(self):
+        self._scan(self.root, mark_changed=True)
+
+    def _scan(self, directory, mark_changed):
+        """scandir 递归扫描，更新索引；mark_changed 时记录大小或 mtime 变化的文件。"""
+        now = time.monotonic()
+        seen = set()
+        stack = [str(directory)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.name.endswith(self.suffix):
+                                st = entry.stat()
+                                seen.add(entry.path)
+                                self._update(entry.path, st.st_size, st.st_mtime, now if mark_changed else 0.0)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        prefix = str(directory)
+        with self.lock:
+            for path in [p for p in self.files if p.startswith(prefix) and p not in seen]:
+                del self.files[path]
+
+    def _update(self, path, size, mtime, changed):
+        with self.lock:
+            info = self.files.get(path)
+            if info is None:
+                self.files[path] = {'size': size, 'mtime': mtime, 'changed': changed}
+            elif info['size'] != size or info['mtime'] != mtime:
+                info.update(size=size, mtime=mtime)
+                if changed:
+                    info['changed'] = changed
+
+    def _on_event(self, path, mask, now):
+        if mask & self.IN_ISDIR:
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self._scan(path, mark_changed=True)
+            return
+        if not path.endswith(self.suffix):
+            return
+        if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+            with self.lock:
+                self.files.pop(path, None)
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        self._update(path, st.st_size, st.st_mtime, now)
+
+
+class ScriptWatcher(DirectoryWatcher):
+    """监听 scripts/ 目录结构变化（目录增删改名、main.* 入口文件增删），只置脏标记。
+
+    inotify 看不到网络共享上其他机器的修改，也没有 inotify 的平台一律视为脏，
+    由 ScriptTreeCache 按目录 mtime 校验。
+    """
+
+    WATCH_MASK = (DirectoryWatcher.IN_MOVED_FROM | DirectoryWatcher.IN_MOVED_TO | DirectoryWatcher.IN_CREATE
+                  | DirectoryWatcher.IN_DELETE | DirectoryWatcher.IN_DELETE_SELF)
+    thread_name = 'script-watcher'
+
+    def __init__(self, root=SCRIPTS_DIR, poll_interval=2.0):
+        super().__init__(root, poll_interval)
+        self.dirty = True
+
+    def needs_refresh(self):
+        return self.backend != 'inotify' or self.dirty
+
+    def _skip_dir(self, name):
+        return should_skip_directory(name)
+
+    def _on_overflow(self):
+        self.dirty = True
+
+    def _on_event(self, path, mask, now):
+        if mask & self.IN_ISDIR or os.path.basename(path).startswith('main') or path.rstrip(os.sep) == str(self.root):
+            self.dirty = True
+
+
+class ScriptTreeCache:
+    """内存中的脚本树，按目录 mtime 缓存每个目录的列举结果。
+
+    刷新时只对 mtime 变化的目录重新 scandir，其余直接复用；树有变化时版本号加一，
+    并记录本次的增量操作（add / remove / update），客户端用 diff_since() 追赶。
+    """
+
+    def __init__(self, root=SCRIPTS_DIR, watcher=None, history=64):
+        self.root = Path(root)
+        self.watcher = watcher
+        self.lock = threading.Lock()
+        self.tree = None
+        # 版本号从启动时间起算，sidecar 重启后旧客户端的版本不会恰好对上
+        self.version = time.time_ns() // 1_000_000
+        self._dirs = {}       # 目录 → (mtime_ns, 子目录名元组, 是否有入口文件)
+        self._changes = deque(maxlen=history)  # (版本, [操作])
+
+    def get(self, validate=False):
+        """返回 (版本, 脚本树)；validate 时无视监听器，按目录 mtime 完整校验一遍。"""
+        with self.lock:
+            self._refresh(validate)
+            return self.version, self.tree
+
+    def diff_since(self, version, validate=False):
+        """返回 (当前版本, version 之后的操作列表)，两者在同一次加锁中得到；
+        version 过旧或不认识时操作列表为 None，客户端应整树重载。"""
+        with self.lock:
+            self._refresh(validate)
+            if version == self.version:
+                return self.version, []
+            if version > self.version or not self._changes or self._changes[0][0] > version + 1:
+                return self.version, None
+            return self.version, [op for v, ops in self._changes if v > version for op in ops]
+
+    def _refresh(self, validate):
+        if self.tree is not None and not validate and self.watcher is not None and not self.watcher.needs_refresh():
+            return
+        if self.watcher is not None:
+            self.watcher.dirty = False  # 先清标记，扫描期间的新事件会重新置脏
+        seen = set()
+        tree = self._build(str(self.root), [], seen)['children']
+        for path in [p for p in self._dirs if p not in seen]:
+            del self._dirs[path]
+        if self.tree is None:
+            self.tree = tree
+            return
+        ops = []
+        self._diff(self.tree, tree, '', ops)
+        self.tree = tree
+        if ops:
+            self.version += 1
+            self._changes.append((self.version, ops))
+
+    def _listing(self, directory):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return (), False
+        cached = self._dirs.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1], cached[2]
+        subdirs = []
+        runnable = False
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    name = entry.name
+                    try:
+                        if entry.is_dir():
+                            if not should_skip_directory(name):
+                                subdirs.append(name)
+                        elif name == 'main.py' or (
+                                (name.startswith('main.cpython-') or name.startswith('main.cp'))
+                                and name.endswith(('.so', '.pyd'))):
+                            runnable = True
+                    except OSError:
+                        continue
+        except OSError:
+            return (), False
+        listing = (mtime_ns, tuple(sorted(subdirs)), runnable)
+        self._dirs[directory] = listing
+        return listing[1], listing[2]
+
+    def _build(self, directory, rel_parts, seen):
+        seen.add(directory)
+        subdirs, runnable = self._listing(directory)
+        children = []
+        for name in subdirs:
+            child = self._build(os.path.join(directory, name), rel_parts + [name], seen)
+            if child['runnable'] or child['children']:
+                children.append(child)
+        return {
+            'name': rel_parts[-1] if rel_parts else 'scripts',
+            'path': '/'.join(rel_parts),
+            'runnable': runnable,
+            'children': children,
+        }
+
+    def _diff(self, old_children, new_children, parent, ops):
+        """比较同一父节点下的子节点；先出删除再按新顺序出新增，客户端按 index 插入即可。"""
+        old = {node['name']: node for node in old_children}
+        new_names = {node['name'] for node in new_children}
+        for node in old_children:
+            if node['name'] not in new_names:
+                ops.append({'op': 'remove', 'path': node['path']})
+        for index, node in enumerate(new_children):
+            before = old.get(node['name'])
+            if before is None:
+                ops.append({'op': 'add', 'parent': parent, 'index': index, 'node': node})
+                continue
+            if before['runnable'] != node['runnable']:
+                ops.append({'op': 'update', 'path': node['path'], 'runnable': node['runnable']})
+            self._diff(before['children'], node['children'], node['path'], ops)
+
+
+class ScriptMetaCache:
+    """按脚本目录缓存解析后的 form.yaml / README.md 与编译好的字段校验函数。
+
+    每次访问只 stat 两个文件，mtime 或大小变化时才重新读取解析。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # 脚本目录 → {'key', 'fields', 'doc', 'validators'}
+
+    @staticmethod
+    def _stat_key(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, script_dir):
+        form_path = os.path.join(script_dir, 'form.yaml')
+        readme_path = os.path.join(script_dir, 'README.md')
+        key = (self._stat_key(form_path), self._stat_key(readme_path))
+        with self.lock:
+            entry = self.entries.get(str(script_dir))
+            if entry is not None and entry['key'] == key:
+                return entry
+
+        form_cfg, fields = {}, []
+        if key[0] is not None:
+            with open(form_path, 'r', encoding='utf-8') as f:
+                form_cfg = yaml.load(f, Loader=YAML_LOADER) or {}
+            fields = form_cfg.get('fields', []) or []
+        doc = ''
+        if key[1] is not None:
+            with open(readme_path, 'r', encoding='utf-8') as f:
+                doc = f.read().strip()
+        validators = [
+            (field['name'], compile_field_validator(field))
+            for field in fields if isinstance(field, dict) and field.get('name') and field.get('type') != 'doc'
+        ]
+        entry = {
+            'key': key, 'fields': fields, 'doc': doc, 'validators': validators,
+            # form.yaml 顶层 warm_worker: false 时该脚本不使用预热进程（依赖全新解释器状态的脚本）
+            'warm_worker': form_cfg.get('warm_worker', True) is not False,
+            # config_handoff: file 的旧脚本会多次打开配置文件，退回临时文件交接
+            'config_handoff': form_cfg.get('config_handoff', 'pipe'),
+        }
+        with self.lock:
+            self.entries[str(script_dir)] = entry
+        return entry
+
+    def validate(self, script_dir, config):
+        """按 form.yaml 校验运行配置，返回错误信息列表（为空表示通过）。"""
+        if not isinstance(config, dict):
+            return ['配置必须是对象']
+        errors = []
+        for name, validate in self.get(script_dir)['validators']:
+            error = validate(config.get(name))
+            if error:
+                errors.append(error)
+        return errors
+
+
+def log_script_name(rel_path):
+    """log/<script_name>/xxx.log 布局中的脚本名；log/runs/ 与根目录下的日志返回空串。"""
+    parts = Path(rel_path).parts
+    return parts[0] if len(parts) > 1 and parts[0] != RUN_LOG_DIR.name else ''
+
+
+class LineIndex:
+    """日志文件的稀疏行偏移索引。
+
+    每 1 MiB 记录一个检查点（字节偏移, 之前的换行数），用 mmap 统计换行，
+    内存占用与文件大小的 1/1MiB 成正比；定位某行时从最近的检查点向后查找。
+    文件只追加增长时增量扩展，变小时重建。
+    """
+
+    CHUNK = 1 << 20
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.mtime_ns = None
+        self.offsets = [0]   # 检查点字节偏移
+        self.lines = [0]     # 检查点之前的换行数
+        self.last_byte = b''
+
+    def refresh(self):
+        st = os.stat(self.path)
+        with self.lock:
+            if st.st_size < self.size:
+                self._reset()
+            if st.st_size == self.size and st.st_mtime_ns == self.mtime_ns:
+                return
+            if st.st_size > self.size:
+                with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pos, newlines = self.size, self.lines[-1]
+                    size = min(st.st_size, len(mm))
+                    while pos < size:
+                        end = min(pos + self.CHUNK, size)
+                        newlines += mm[pos:end].count(b'\n')
+                        pos = end
+                        self.offsets.append(pos)
+                        self.lines.append(newlines)
+                    self.last_byte = mm[size - 1:size]
+                    self.size = size
+            self.mtime_ns = st.st_mtime_ns
+
+    @property
+    def total_lines(self):
+        return self.lines[-1] + (1 if self.size and self.last_byte != b'\n' else 0)
+
+    def offset_of_line(self, line):
+        """第 line 行（从 0 开始）的起始字节偏移。"""
+        with self.lock:
+            if line <= 0:
+                return 0
+            if line >= self.lines[-1]:
+                return self.size if line >= self.total_lines else self._scan(len(self.lines) - 1, line)
+            idx = bisect.bisect_left(self.lines, line) - 1
+            return self._scan(idx, line)
+
+    def _scan(self, idx, line):
+        pos, remaining = self.offsets[idx], line - self.lines[idx]
+        # 检查点可能落在行中间，从前一个检查点开始向后数换行
+        while idx > 0 and self.lines[idx] >= line:
+            idx -= 1
+            pos, remaining = self.offsets[idx], line - self.lines[idx]
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for _ in range(remaining):
+                found = mm.find(b'\n', pos, self.size)
+                if found < 0:
+                    return self.size
+                pos = found + 1
+        return pos
+
+
+class LogHistory:
+    """运行历史索引（log/history.db），供 get_recent_logs 分页查询。
+
+    记录日志路径、所属脚本、mtime、大小、退出码和末尾预览；依据 LogWatcher
+    报告的变化增量更新，运行结束时补记退出码和资源采样（metrics 为汇总，metrics_series 为时间序列）。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS logs (
+        path TEXT PRIMARY KEY,
+        script TEXT NOT NULL DEFAULT '',
+        mtime REAL NOT NULL,
+        size INTEGER NOT NULL,
+        exit_code INTEGER,
+        run_id TEXT,
+        preview TEXT NOT NULL DEFAULT '',
+        metrics TEXT,
+        metrics_series TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_logs_mtime ON logs (mtime DESC);
+    CREATE INDEX IF NOT EXISTS idx_logs_script_mtime ON logs (script, mtime DESC);
+    """
+
+    def __init__(self, db_path=HISTORY_DB_PATH, root=LOG_DIR):
+        self.root = Path(root)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(logs)')}
+        for column in ('metrics', 'metrics_series'):
+            if column not in columns:  # 旧版数据库
+                self.conn.execute(f'ALTER TABLE logs ADD COLUMN {column} TEXT')
+        self.synced_at = None  # 上次同步时刻（monotonic），None 表示尚未全量对账
+
+    def sync(self, watcher):
+        """把 LogWatcher 索引中的变化同步进数据库。"""
+        with self.lock:
+            mark = time.monotonic()
+            full = self.synced_at is None
+            if not full:
+                count = self.conn.execute('SELECT COUNT(*) FROM logs').fetchone()[0]
+                # 有文件被删除（或新增未被标记）时退回全量对账
+                full = count != watcher.count()
+            if full:
+                watcher.ready.wait(timeout=5)
+                current = watcher.entries()
+                known = {row[0]: (row[1], row[2]) for row in self.conn.execute('SELECT path, size, mtime FROM logs')}
+                gone = [(rel,) for rel in known if str(self.root / rel) not in current]
+                self.conn.executemany('DELETE FROM logs WHERE path = ?', gone)
+            else:
+                current = watcher.entries(watcher.changed_since(self.synced_at))
+                known = {}
+                if current:
+                    rels = [self._rel(path) for path in current]
+                    placeholders = ','.join('?' * len(rels))
+                    known = {row[0]: (row[1], row[2]) for row in self.conn.execute(
+                        f'SELECT path, size, mtime FROM logs WHERE path IN ({placeholders})', rels)}
+            for path, (size, mtime) in current.items():
+                rel = self._rel(path)
+                if known.get(rel) == (size, mtime):
+                    continue
+                self._upsert(path, size, mtime)
+            self.conn.commit()
+            self.synced_at = mark
+
+    def record_run(self, run, paths):
+        """运行结束时写入运行日志及其外部日志的退出码。"""
+        with self.lock:
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                self._upsert(path, st.st_size, st.st_mtime, run)
+            self.conn.commit()
+
+    def query(self, limit=20, offset=0, script=None, date_from=None, date_to=None):
+        clauses, params = [], []
+        if script:
+            clauses.append('script = ?')
+            params.append(script)
+        if date_from:
+            clauses.append('mtime >= ?')
+            params.append(self._parse_date(date_from).timestamp())
+        if date_to:
+            end = self._parse_date(date_to)
+            if len(str(date_to)) <= 10:
+                end += timedelta(days=1)
+            clauses.append('mtime < ?')
+            params.append(end.timestamp())
+        where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+        sql = (
+            f'SELECT path, script, mtime, size, exit_code, run_id, preview, metrics FROM logs {where} '
+            'ORDER BY mtime DESC LIMIT ? OFFSET ?'
+        )
+        with self.lock:
+            rows = self.conn.execute(sql, params + [int(limit), int(offset)]).fetchall()
+        return [
+            {
+                'name': Path(rel).name,
+                'path': rel,
+                'script': script_name,
+                'modified': datetime.fromtimestamp(mtime).isoformat(timespec='seconds'),
+                'size': size,
+                'exit_code': exit_code,
+                'run_id': run_id,
+                'preview': preview,
+                'metrics': json.loads(metrics) if metrics else None,
+            }
+            for rel, script_name, mtime, size, exit_code, run_id, preview, metrics in rows
+        ]
+
+    def run_metrics(self, run_id):
+        """返回历史运行的 (脚本名, 资源采样 {summary, interval, series})；没有记录时返回 None。"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT script, metrics_series FROM logs WHERE run_id = ? AND metrics_series IS NOT NULL LIMIT 1',
+                (run_id,)).fetchone()
+        if not row:
+            return None
+        return row[0], json.loads(row[1])
+
+    def script_metrics(self, script, limit=5, exclude=None):
+        """同一脚本最近几次运行的资源汇总（新→旧），用于对比版本间的性能变化。"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT run_id, MAX(mtime) AS latest, exit_code, metrics FROM logs '
+                'WHERE script = ? AND metrics IS NOT NULL AND run_id IS NOT NULL AND run_id != ? '
+                'GROUP BY run_id ORDER BY latest DESC LIMIT ?',
+                (script, exclude or '', int(limit))).fetchall()
+        return [
+            {
+                'run_id': run_id,
+                'finished_at': datetime.fromtimestamp(mtime).isoformat(timespec='seconds'),
+                'exit_code': exit_code,
+                **json.loads(metrics),
+            }
+            for run_id, mtime, exit_code, metrics in rows
+        ]
+
+    def _upsert(self, path, size, mtime, run=None):
+        rel = self._rel(path)
+        try:
+            preview = read_tail_text(path, LOG_PREVIEW_CHARS).strip()
+        except OSError:
+            preview = ''
+        script = log_script_name(rel)
+        if run is not None:
+            script = script or run.script_name
+            metrics = series = None
+            if run.metrics:
+                metrics = json.dumps(run.metrics['summary'])
+                series = json.dumps(run.metrics, separators=(',', ':'))
+            self.conn.execute(
+                'INSERT INTO logs (path, script, mtime, size, exit_code, run_id, preview, metrics, metrics_series) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET script=excluded.script, mtime=excluded.mtime, size=excluded.size, '
+                'exit_code=excluded.exit_code, run_id=excluded.run_id, preview=excluded.preview, '
+                'metrics=excluded.metrics, metrics_series=excluded.metrics_series',
+                (rel, script, mtime, size, run.exit_code, run.run_id, preview, metrics, series),
+            )
+        else:
+            self.conn.execute(
+                'INSERT INTO logs (path, script, mtime, size, preview) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET mtime=excluded.mtime, size=excluded.size, preview=excluded.preview',
+                (rel, script, mtime, size, preview),
+            )
+
+    def _rel(self, path):
+        return Path(path).relative_to(self.root).as_posix()
+
+    @staticmethod
+    def _parse_date(value):
+        return datetime.fromisoformat(str(value))
+
+
+class LogSearchIndex:
+    """log/**/*.log 的全文索引（log/search.db，SQLite FTS5）。
+
+    日志按约 64 KiB、以换行对齐切块写入 FTS5 表，记录每块的起始字节偏移；
+    优先使用 trigram 分词器以支持中文和路径片段的子串搜索。后台线程依据
+    LogWatcher 的变化只索引新增字节，文件变小（被截断或替换）时重建该文件。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        script TEXT NOT NULL DEFAULT '',
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_files_script ON files (script);
+    CREATE INDEX IF NOT EXISTS idx_files_mtime ON files (mtime);
+    """
+
+    def __init__(self, db_path=SEARCH_DB_PATH, root=LOG_DIR, watcher=None, interval=5.0):
+        self.root = Path(root)
+        self.watcher = watcher
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.SCHEMA)
+        self.trigram = self._create_chunks_table()
+        self.synced_at = None
+        self.indexing = False
+        self._wake = threading.Event()
+        self._synced = threading.Condition()
+        self._generation = 0
+
+    def _create_chunks_table(self):
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "content, path UNINDEXED, offset UNINDEXED, tokenize='trigram')"
+            )
+            return True
+        except sqlite3.OperationalError:
+            # SQLite < 3.34 没有 trigram 分词器，退回默认分词
+            self.conn.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(content, path UNINDEXED, offset UNINDEXED)'
+            )
+            return False
+
+    def start(self):
+        threading.Thread(target=self._loop, name='log-search-index', daemon=True).start()
+        return self
+
+    def request_sync(self, timeout=2.0):
+        """唤醒后台索引并等待一轮同步完成（最多 timeout 秒）。"""
+        with self._synced:
+            target = self._generation + 1
+            self._wake.set()
+            self._synced.wait_for(lambda: self._generation >= target, timeout=timeout)
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except (OSError, sqlite3.Error):
+                traceback.print_exc(file=sys.stderr)
+            with self._synced:
+                self._generation += 1
+                self._synced.notify_all()
+
+    def sync(self):
+        """与 LogWatcher 的加锁快照对账：删除已不存在的文件，(大小, mtime) 变化的文件补索引。
+
+        每轮都按路径集合比较，不依赖文件数是否变化（一删一增时数量不变）。
+        """
+        watcher = self.watcher
+        mark = time.monotonic()
+        watcher.ready.wait(timeout=5)
+        current = {Path(path).relative_to(self.root).as_posix(): (path, size, mtime)
+                   for path, (size, mtime) in watcher.entries().items()}
+        with self.lock:
+            known = {row[0]: (row[1], row[2]) for row in self.conn.execute('SELECT path, size, mtime FROM files')}
+            gone = [rel for rel in known if rel not in current]
+            for rel in gone:
+                self._delete(rel)
+            if gone:
+                self.conn.commit()
+        self.indexing = True
+        try:
+            for rel, (path, size, mtime) in current.items():
+                if known.get(rel) == (size, mtime):
+                    continue
+                self._index_file(path, rel, known.get(rel), mtime)
+        finally:
+            self.indexing = False
+        self.synced_at = mark
+
+    def _index_file(self, path, rel, indexed, mtime):
+        """从已索引的位置起追加索引；indexed 为库中记录的 (已索引字节数, mtime) 或 None。
+
+        文件变小，或大小未变而 mtime 变了（原样大小被改写），则整文件重建。
+        只在写库时持锁，读取大文件期间 search 不被阻塞。
+        """
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        offset, indexed_mtime = indexed or (0, None)
+        if size < offset or (size == offset and mtime != indexed_mtime):
+            with self.lock:
+                self._delete(rel)
+            offset = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while offset < size:
+                data = f.read(min(SEARCH_CHUNK_BYTES, size - offset))
+                if not data:
+                    break
+                cut = data.rfind(b'\n') + 1
+                if cut == 0:
+                    # 没有换行：块已满则按字符边界切开，否则等待这一行写完
+                    if len(data) < SEARCH_CHUNK_BYTES:
+                        break
+                    cut = utf8_complete_length(data)
+                data = data[:cut]
+                with self.lock:
+                    self.conn.execute(
+                        'INSERT INTO chunks (content, path, offset) VALUES (?, ?, ?)',
+                        (data.decode('utf-8', errors='replace'), rel, offset),
+                    )
+                offset += len(data)
+                f.seek(offset)
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO files (path, script, size, mtime) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime=excluded.mtime',
+                (rel, log_script_name(rel), offset, mtime),
+            )
+            self.conn.commit()
+
+    def _delete(self, rel):
+        self.conn.execute('DELETE FROM chunks WHERE path = ?', (rel,))
+        self.conn.execute('DELETE FROM files WHERE path = ?', (rel,))
+
+    def search(self, query, script=None, date_from=None, date_to=None, limit=50, context=80):
+        """返回命中片段：日志路径、匹配处的字节偏移（可传给 get_log_detail）及上下文。"""
+        clauses, params = [], []
+        if self.trigram and len(query) < 3:
+            # trigram 索引要求至少 3 个字符，更短的词退回 LIKE 扫描
+            escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("c.content LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        else:
+            clauses.append('chunks MATCH ?')
+            params.append('"' + query.replace('"', '""') + '"')
+        if script:
+            clauses.append('f.script = ?')
+            params.append(script)
+        if date_from:
+            clauses.append('f.mtime >= ?')
+            params.append(LogHistory._parse_date(date_from).timestamp())
+        if date_to:
+            end = LogHistory._parse_date(date_to)
+            if len(str(date_to)) <= 10:
+                end += timedelta(days=1)
+            clauses.append('f.mtime < ?')
+            params.append(end.timestamp())
+        sql = (
+            'SELECT c.path, c.offset, c.content, f.script, f.mtime FROM chunks AS c '
+            'JOIN files AS f ON f.path = c.path '
+            f'WHERE {" AND ".join(clauses)} ORDER BY f.mtime DESC, c.offset LIMIT ?'
+        )
+        with self.lock:
+            rows = self.conn.execute(sql, params + [int(limit)]).fetchall()
+        results = []
+        needle = query.lower()
+        for rel, chunk_offset, content, script_name, mtime in rows:
+            lowered = content.lower()
+            pos = lowered.find(needle)
+            while pos >= 0 and len(results) < limit:
+                begin = max(0, pos - context)
+                results.append({
+                    'path': rel,
+                    'script': script_name,
+                    'modified': datetime.fromtimestamp(mtime).isoformat(timespec='seconds'),
+                    'offset': chunk_offset + len(content[:pos].encode('utf-8')),
+                    'snippet': content[begin:pos + len(query) + context],
+                    'match_start': pos - begin,
+                })
+                pos = lowered.find(needle, pos + len(needle))
+        return results
+
+
+class ConfigHandoff:
+    """把运行配置交给脚本进程，不在磁盘上留下临时文件。
+
+    POSIX 上配置写入匿名管道，读端按原编号继承给子进程，脚本拿到的配置路径是
+    /dev/fd/N（同时写入 SCRIPT_CONFIG_FILE），旧脚本照常 open() 读取即可，但只能读一次。
+    Windows、CEDAR_CONFIG_HANDOFF=file 或 form.yaml 顶层 config_handoff: file 的脚本
+    退回临时 JSON 文件，运行结束后删除。管道在运行真正启动时才创建，排队中的运行不占用 fd。
+    """
+
+    PLACEHOLDER = '/dev/fd/{fd}'
+
+    def __init__(self, config, mode=CONFIG_HANDOFF):
+        self.data = json.dumps(config or {}, ensure_ascii=False, indent=2).encode('utf-8')
+        self.mode = 'pipe' if mode == 'pipe' and os.name == 'posix' else 'file'
+        self.path = self.PLACEHOLDER
+        self.read_fd = None
+        if self.mode == 'file':
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.json') as f:
+                f.write(self.data)
+            self.path = f.name
+
+    def attach(self, session):
+        """在启动前把真实配置路径填入会话的命令行和环境变量，并登记需继承的 fd。"""
+        if self.mode == 'pipe':
+            self.read_fd, write_fd = os.pipe()
+            self.path = f'/dev/fd/{self.read_fd}'
+            session.pass_fds = tuple(session.pass_fds) + (self.read_fd,)
+            self._write(write_fd)
+        session.argv = [self.path if arg == self.PLACEHOLDER else arg for arg in session.argv]
+        if session.env is not None:
+            session.env['SCRIPT_CONFIG_FILE'] = self.path
+        return self.path
+
+    def _write(self, write_fd):
+        # 配置通常小于管道缓冲，直接写完；写不完时由后台线程写剩余部分
+        os.set_blocking(write_fd, False)
+        try:
+            written = os.write(write_fd, self.data)
+        except BlockingIOError:
+            written = 0
+        if written >= len(self.data):
+            os.close(write_fd)
+            return
+        os.set_blocking(write_fd, True)
+
+        def rest(offset):
+            try:
+                while offset < len(self.data):
+                    offset += os.write(write_fd, self.data[offset:])
+            except OSError:
+                pass  # 脚本未读完配置就退出
+            finally:
+                os.close(write_fd)
+
+        threading.Thread(target=rest, args=(written,), daemon=True).start()
+
+    def release(self):
+        """子进程启动后关闭本进程持有的读端。"""
+        if self.read_fd is not None:
+            try:
+                os.close(self.read_fd)
+            except OSError:
+                pass
+            self.read_fd = None
+
+    def close(self):
+        self.release()
+        if self.mode == 'file':
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class ProgressChannel:
+    """脚本到后端的结构化进度通道（脚本端见 sdk/cedarex.py）。
+
+    启动前创建管道，写端以 CEDAR_PROGRESS_FD 继承给子进程；读线程解析 JSON 行，
+    估算吞吐量（指数滑动平均）与剩余时间，按 interval 限频回调，静默时补发最后一次更新。仅 POSIX。
+    """
+
+    def __init__(self, callback, interval=PROGRESS_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.state = None
+        self.read_fd = None
+        self.write_fd = None
+        self._started = None
+        self._last_sample = None  # (时间, done)
+        self._rate = None
+
+    def attach(self, session):
+        if os.name != 'posix':
+            return
+        self.read_fd, self.write_fd = os.pipe()
+        session.pass_fds = tuple(session.pass_fds) + (self.write_fd,)
+        if session.env is not None:
+            session.env['CEDAR_PROGRESS_FD'] = str(self.write_fd)
+
+    def start(self):
+        """子进程启动后调用：关闭本进程的写端，开始读取。"""
+        if self.read_fd is None:
+            return
+        os.close(self.write_fd)
+        self.write_fd = None
+        self._started = time.monotonic()
+        threading.Thread(target=self._reader, daemon=True).start()
+
+    def close(self):
+        for fd in (self.read_fd, self.write_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.read_fd = self.write_fd = None
+
+    def _reader(self):
+        import select
+
+        fd = self.read_fd
+        buf = b''
+        last_sent = 0.0
+        pending = False
+        try:
+            while True:
+                timeout = max(0.0, last_sent + self.interval - time.monotonic()) if pending else None
+                ready, _, _ = select.select([fd], [], [], timeout)
+                if ready:
+                    data = os.read(fd, 65536)
+                    if not data:
+                        break
+                    *lines, buf = (buf + data).split(b'\n')
+                    for line in lines:
+                        pending = self._update(line) or pending
+                now = time.monotonic()
+                if pending and now - last_sent >= self.interval:
+                    self.callback(self.state)
+                    last_sent = now
+                    pending = False
+        except OSError:
+            pass
+        finally:
+            if pending:
+                self.callback(self.state)
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+            self.read_fd = None
+
+    def _update(self, line):
+        try:
+            message = json.loads(line.decode('utf-8'))
+            done = float(message.get('done') or 0)
+            total = message.get('total')
+            total = float(total) if total is not None else None
+        except (ValueError, TypeError, AttributeError):
+            return False
+        now = time.monotonic()
+        if self._last_sample is None:
+            elapsed = now - self._started
+            rate = done / elapsed if elapsed > 0 else None
+        else:
+            last_time, last_done = self._last_sample
+            rate = self._rate
+            if now > last_time and done >= last_done:
+                instant = (done - last_done) / (now - last_time)
+                rate = instant if rate is None else 0.3 * instant + 0.7 * rate
+        self._last_sample = (now, done)
+        self._rate = rate
+        eta = None
+        if rate and total is not None:
+            eta = max(0.0, (total - done) / rate)
+        self.state = {
+            'done': int(done) if done.is_integer() else done,
+            'total': None if total is None else (int(total) if total.is_integer() else total),
+            'throughput': None if rate is None else round(rate, 3),
+            'eta': None if eta is None else round(eta, 1),
+            'message': str(message.get('message') or '')[:200],
+        }
+        return True
+
+
+class RunSampler:
+    """运行期间按间隔读取 /proc，采样脚本进程树的资源占用（仅 Linux）。
+
+    每个点记录相对时间 t、区间 CPU 占用 cpu（%，单核 100）、累计 CPU 秒数、RSS、
+    累计读写字节（rchar/wchar，含页缓存命中）与线程/进程数。已退出子进程的 CPU 与 I/O
+    经 wait 计入父进程，累计值按单调递增处理。采不到进程退出前最后一个间隔。
+
+    给出 watch_dir 时顺带记录进程树打开过的该目录下 *.log 文件（open_logs），用于把
+    未使用 CEDAR_RUN_LOG_DIR、但长期持有日志句柄的脚本写入的日志归属到本次运行。
+    """
+
+    TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    WARMUP = (0.1, 0.2, 0.5)  # 前几次采样的间隔
+
+    def __init__(self, pid, interval=METRICS_INTERVAL, max_samples=METRICS_MAX_SAMPLES, watch_dir=None):
+        self.pid = pid
+        self.watch_prefix = str(watch_dir) + os.sep if watch_dir else None
+        self.open_logs = set()
+        self.interval = interval
+        self.max_samples = max(2, int(max_samples))
+        self.samples = []
+        self.peak = {'rss': 0, 'threads': 0, 'procs': 0}
+        self.totals = {'cpu_time': 0.0, 'read_bytes': 0, 'write_bytes': 0, 'disk_read': 0, 'disk_write': 0,
+                       'io_wait': 0.0}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = None
+        self._ended = None
+        self._last = None  # (monotonic, cpu_time)
+
+    @staticmethod
+    def supported():
+        return sys.platform.startswith('linux') and os.path.isdir('/proc/self')
+
+    def start(self):
+        self._started = time.monotonic()
+        if self.pid and self.supported():
+            threading.Thread(target=self._loop, name='run-sampler', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._ended is None:
+            self._ended = time.monotonic()
+        self._stop.set()
+
+    def _loop(self):
+        delays = list(self.WARMUP)
+        while not self._stop.wait(delays.pop(0) if delays else self.interval):
+            if not self.sample():
+                break
+
+    def sample(self):
+        """采样一次；根进程已不存在时返回 False。"""
+        tree = self._tree()
+        if not tree:
+            return False
+        cpu = rss = threads = blkio = 0
+        read = write = disk_read = disk_write = 0
+        for pid, stat in tree.items():
+            # stat 去掉 "pid (comm) " 后从第 3 个字段 state 开始：utime=14, stime=15, cutime=16, cstime=17,
+            # num_threads=20, rss=24, delayacct_blkio_ticks=42（字段序号从 1 计）
+            cpu += sum(int(v) for v in stat[11:15])
+            threads += int(stat[17])
+            rss += int(stat[21]) * self.PAGE_SIZE
+            if len(stat) > 39:
+                blkio += int(stat[39])
+            io = self._read_io(pid)
+            read += io.get('rchar', 0)
+            write += io.get('wchar', 0)
+            disk_read += io.get('read_bytes', 0)
+            disk_write += io.get('write_bytes', 0)
+            if self.watch_prefix:
+                self._scan_fds(pid)
+        now = time.monotonic()
+        with self.lock:
+            totals = self.totals
+            totals['cpu_time'] = max(totals['cpu_time'], cpu / self.TICKS)
+            totals['io_wait'] = max(totals['io_wait'], blkio / self.TICKS)
+            for key, value in (('read_bytes', read), ('write_bytes', write),
+                               ('disk_read', disk_read), ('disk_write', disk_write)):
+                totals[key] = max(totals[key], value)
+            for key, value in (('rss', rss), ('threads', threads), ('procs', len(tree))):
+                self.peak[key] = max(self.peak[key], value)
+            cpu_percent = None
+            if self._last and now > self._last[0]:
+                cpu_percent = round(100 * (totals['cpu_time'] - self._last[1]) / (now - self._last[0]), 1)
+            self._last = (now, totals['cpu_time'])
+            self.samples.append({
+                't': round(now - self._started, 2),
+                'cpu': cpu_percent,
+                'cpu_time': round(totals['cpu_time'], 2),
+                'rss': rss,
+                'read_bytes': totals['read_bytes'],
+                'write_bytes': totals['write_bytes'],
+                'threads': threads,
+                'procs': len(tree),
+            })
+            if len(self.samples) > self.max_samples:
+                self.samples = self.samples[::2]
+                self.interval *= 2
+        return True
+
+    def _tree(self):
+        """根进程及其全部后代的 stat 字段（去掉 pid 与 comm）。"""
+        stats, children = {}, {}
+        try:
+            names = os.listdir('/proc')
+        except OSError:
+            return {}
+        for name in names:
+            if not name.isdigit():
+                continue
+            try:
+                with open(f'/proc/{name}/stat', 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            fields = data[data.rfind(b')') + 2:].split()
+            pid = int(name)
+            stats[pid] = fields
+            children.setdefault(int(fields[1]), []).append(pid)
+        if self.pid not in stats:
+            return {}
+        tree, pending = {}, [self.pid]
+        while pending:
+            pid = pending.pop()
+            tree[pid] = stats[pid]
+            pending.extend(children.get(pid, ()))
+        return tree
+
+    def _scan_fds(self, pid):
+        try:
+            fds = os.listdir(f'/proc/{pid}/fd')
+        except OSError:
+            return
+        for fd in fds:
+            try:
+                target = os.readlink(f'/proc/{pid}/fd/{fd}')
+            except OSError:
+                continue
+            if target.startswith(self.watch_prefix) and target.endswith('.log'):
+                with self.lock:
+                    self.open_logs.add(target)
+
+    def logs(self):
+        with self.lock:
+            return set(self.open_logs)
+
+    @staticmethod
+    def _read_io(pid):
+        try:
+            with open(f'/proc/{pid}/io', 'rb') as f:
+                lines = f.read().split(b'\n')
+        except OSError:
+            return {}
+        io = {}
+        for line in lines:
+            key, _, value = line.partition(b':')
+            if value:
+                io[key.decode()] = int(value)
+        return io
+
+    def summary(self):
+        """汇总：耗时、CPU 秒数与平均占用、峰值 RSS/线程、读写量，以及粗略的瓶颈类型 bound。
+
+        bound：平均占用 ≥ 70% 单核为 cpu；否则读写速率 ≥ 1 MiB/s 或块设备等待占耗时 ≥ 20% 为 io；
+        其余为 wait（多为 sleep、网络或子进程等待）。无采样时返回 None。
+        """
+        with self.lock:
+            if not self.samples:
+                return None
+            end = self._ended or time.monotonic()
+            duration = max(end - self._started, 1e-6)
+            totals = dict(self.totals)
+            peak = dict(self.peak)
+            count = len(self.samples)
+        cpu_percent = 100 * totals['cpu_time'] / duration
+        io_rate = (totals['read_bytes'] + totals['write_bytes']) / duration
+        if cpu_percent >= 70:
+            bound = 'cpu'
+        elif io_rate >= 1024 * 1024 or totals['io_wait'] >= 0.2 * duration:
+            bound = 'io'
+        else:
+            bound = 'wait'
+        return {
+            'duration': round(duration, 2),
+            'cpu_time': round(totals['cpu_time'], 2),
+            'cpu_percent': round(cpu_percent, 1),
+            'rss_peak': peak['rss'],
+            'threads_peak': peak['threads'],
+            'procs_peak': peak['procs'],
+            'read_bytes': totals['read_bytes'],
+            'write_bytes': totals['write_bytes'],
+            'disk_read': totals['disk_read'],
+            'disk_write': totals['disk_write'],
+            'io_wait': round(totals['io_wait'], 2),
+            'bound': bound,
+            'samples': count,
+        }
+
+    def report(self):
+        """{summary, interval, series}；无采样（非 Linux 或运行过短）时返回 None。"""
+        summary = self.summary()
+        if summary is None:
+            return None
+        with self.lock:
+            return {'summary': summary, 'interval': self.interval, 'series': list(self.samples)}
+
+
+class WarmProcess:
+    """预热进程 fork 出的脚本子进程，提供 subprocess.Popen 的常用接口。
+
+    子进程的父进程是 fork server，退出码由其通过 socket 转告。
+    """
+
+    def __init__(self, pool, pid, time_saved):
+        self.pool = pool
+        self.pid = pid
+        self.time_saved = time_saved
+        self.returncode = None
+        self.exited = threading.Event()
+
+    def _set_exit(self, code):
+        self.returncode = code
+        self.exited.set()
+
+    def poll(self):
+        if not self.exited.is_set() and not self.pool.alive:
+            self._check_orphan()
+        return self.returncode
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.exited.wait(0.5):
+            if not self.pool.alive:
+                self._check_orphan()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(str(self.pid), timeout)
+        return self.returncode
+
+    def _check_orphan(self):
+        # fork server 已退出：子进程被 init 接管，只能判断它是否还活着，退出码未知
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            self._set_exit(-1)
+        except OSError:
+            pass
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        import signal
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        import signal
+        self.send_signal(signal.SIGKILL)
+
+
+class WarmWorkerPool:
+    """预热的 Python fork server（warm_worker.py），预先 import 重型模块。
+
+    每次运行由它 fork 子进程执行脚本，省去解释器启动和 numpy/cv2/pandas 等的导入时间；
+    子进程之间通过写时复制共享已加载的模块，彼此隔离。仅 POSIX 可用。
+    """
+
+    def __init__(self, preload=WARM_PRELOAD, enabled=WARM_WORKERS):
+        self.preload = preload
+        self.enabled = bool(enabled) and hasattr(os, 'fork')
+        self.lock = threading.Lock()
+        self.process = None
+        self.sock = None
+        self.alive = False
+        self.ready = threading.Event()
+        self.info = {}            # ready 消息：modules / failed / import_seconds
+        self.cold_seconds = 0.0   # 冷启动耗时：解释器启动 + 预加载
+        self.runs = 0
+        self.saved_seconds = 0.0
+        self._job_seq = 0
+        self._started = {}        # 任务号 → [Event, pid]
+        self._children = {}       # pid → WarmProcess
+        self._abandoned = set()   # 等待超时的任务号：迟到的 started 到达时杀掉该子进程
+        self._killed = set()      # 已杀掉的迟到子进程 pid，忽略其 exit 消息
+        if self.enabled:
+            self.start()
+
+    def configure(self, enabled=None, preload=None):
+        """修改开关或预加载模块；预加载列表变化时重启 fork server。"""
+        restart = preload is not None and preload != self.preload
+        if preload is not None:
+            self.preload = preload
+        if enabled is not None:
+            self.enabled = bool(enabled) and hasattr(os, 'fork')
+        if not self.enabled or restart:
+            self.stop()
+        if self.enabled and not self.alive:
+            self.start()
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'alive': self.alive,
+            'ready': self.ready.is_set(),
+            'pid': self.process.pid if self.process else None,
+            'preload': self.preload,
+            'modules': self.info.get('modules', []),
+            'failed': self.info.get('failed', {}),
+            'cold_seconds': round(self.cold_seconds, 3),
+            'runs': self.runs,
+            'saved_seconds': round(self.saved_seconds, 3),
+        }
+
+    def start(self):
+        import socket
+
+        with self.lock:
+            if self.alive:
+                return
+            parent, child = socket.socketpair()
+            env = os.environ.copy()
+            env['PYTHONIOENCODING'] = 'utf-8'
+            started = time.perf_counter()
+            self.process = subprocess.Popen(
+                [sys.executable, str(BASE_DIR / 'warm_worker.py'), str(child.fileno()), self.preload],
+                cwd=str(BASE_DIR), env=env, pass_fds=(child.fileno(),),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+            child.close()
+            self.sock = parent
+            self.alive = True
+            self.ready.clear()
+        threading.Thread(target=self._reader, args=(parent, self.process, started),
+                         name='warm-worker', daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            sock, process = self.sock, self.process
+            self.sock = None
+            self.alive = False
+            self.ready.clear()
+        if sock is not None:
+            sock.close()  # fork server 读到 EOF 后退出，已 fork 的子进程继续运行
+        if process is not None:
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def spawn(self, argv, cwd, env, slave_fd, pass_fds=()):
+        """请求 fork server 在 slave_fd（PTY 从端）上运行 argv；不可用时返回 None，由调用方冷启动。
+
+        pass_fds 随 PTY 一起传过去，子进程中编号会变，argv 和环境变量里的 /dev/fd/N 由子进程改写。
+        fd 已发出后等待超时则抛出 RuntimeError：fork server 仍可能启动脚本，不能再在同一 PTY
+        与配置管道上冷启动第二份；迟到的子进程在 started 消息到达时被杀掉。
+        """
+        import array
+        import socket
+
+        if not self.enabled or not self.ready.is_set():
+            return None
+        with self.lock:
+            sock = self.sock
+            if sock is None:
+                return None
+            self._job_seq += 1
+            job = self._job_seq
+            waiter = [threading.Event(), None]
+            self._started[job] = waiter
+            sent = time.perf_counter()
+            data = json.dumps({'job': job, 'argv': list(argv), 'cwd': cwd, 'env': dict(env),
+                               'pass_fds': list(pass_fds)}, ensure_ascii=False).encode('utf-8')
+            message = len(data).to_bytes(4, 'big') + data
+            try:
+                fds = array.array('i', [slave_fd, *pass_fds])
+                sock.sendmsg([message[:4]], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+                sock.sendall(message[4:])
+            except OSError:
+                self._started.pop(job, None)
+                return None
+        if not waiter[0].wait(5):
+            with self.lock:
+                if waiter[1] is None and self._started.pop(job, None) is not None:
+                    self._abandoned.add(job)
+            if waiter[1] is None:
+                raise RuntimeError('预热进程 5 秒内未响应，已放弃本次运行')
+        if waiter[1] is None:  # fork server 拒绝任务或已退出，脚本未启动
+            return None
+        pid = waiter[1]
+        saved = max(0.0, self.cold_seconds - (time.perf_counter() - sent))
+        process = WarmProcess(self, pid, saved)
+        with self.lock:
+            exit_code = self._children.get(pid)
+            self._children[pid] = process
+            self.runs += 1
+            self.saved_seconds += saved
+        if isinstance(exit_code, int):  # 极短的脚本：退出消息先于登记到达
+            process._set_exit(exit_code)
+        return process
+
+    def _reader(self, sock, process, started):
+        header = 4
+        try:
+            while True:
+                size = self._recv_exact(sock, header)
+                if size is None:
+                    break
+                body = self._recv_exact(sock, int.from_bytes(size, 'big'))
+                if body is None:
+                    break
+                self._handle(json.loads(body.decode('utf-8')), started)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self.lock:
+                if self.process is process:
+                    self.alive = False
+                    self.sock = None
+                    self.ready.clear()
+                waiters = list(self._started.values())
+                self._started.clear()
+            for waiter in waiters:
+                waiter[0].set()
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _handle(self, message, started):
+        kind = message.get('type')
+        if kind == 'ready':
+            self.info = message
+            self.cold_seconds = time.perf_counter() - started
+            self.ready.set()
+        elif kind == 'started':
+            with self.lock:
+                waiter = self._started.pop(message['job'], None)
+                abandoned = waiter is None and message['job'] in self._abandoned
+                if abandoned:
+                    self._abandoned.discard(message['job'])
+                    self._killed.add(message['pid'])
+            if waiter:
+                waiter[1] = message['pid']
+                waiter[0].set()
+            elif abandoned:
+                import signal
+
+                try:
+                    os.killpg(message['pid'], signal.SIGKILL)  # 子进程已 setsid，自成进程组
+                except OSError:
+                    pass
+        elif kind == 'rejected':  # fork server 拒绝任务，spawn 返回 None 后冷启动
+            with self.lock:
+                waiter = self._started.pop(message.get('job'), None)
+            if waiter:
+                waiter[0].set()
+        elif kind == 'exit':
+            with self.lock:
+                if message['pid'] in self._killed:
+                    self._killed.discard(message['pid'])
+                    return
+                child = self._children.pop(message['pid'], None)
+                if child is None:
+                    self._children[message['pid']] = message['code']
+            if isinstance(child, WarmProcess):
+                child._set_exit(message['code'])
+
+
+class ScriptRun:
+    def __init__(self, run_id, process, log_path, config_path, script_name, script_rel_path, config,
+                 session=None, handoff=None):
+        self.run_id = run_id
+        self.process = process
+        self.log_path = log_path
+        self.config_path = config_path
+        self.script_name = script_name
+        self.script_rel_path = script_rel_path
+        self.config = config or {}
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.finished = False
+        self.exit_code = None
+        self.file_offsets = {}
+        self.external_log = []
+        self.session = session          # 独占的 TerminalSession（PTY）
+        self.handoff = handoff          # ConfigHandoff，运行结束时清理
+        self.progress_channel = None    # ProgressChannel，脚本上报的结构化进度
+        self.progress = None            # 最近一次进度 {done, total, throughput, eta, message}
+        self.sampler = None             # RunSampler，运行期间采样进程树资源占用
+        self.metrics = None             # 结束后的采样报告 {summary, interval, series}
+        self.profile_path = None        # 性能分析时 cProfile 统计文件（运行日志旁的 .prof）
+        self.status = 'queued'          # queued / running / finished / cancelled / failed
+        self.cancelled = False          # 已请求取消（在 RunManager.lock 下读写）
+        self.error = ''
+        self.started_at = None
+        self.finished_at = None
+        self.log_file = None            # 运行输出归档文件句柄
+        self.watch_since = 0.0          # 外部日志：只收集此时刻（monotonic）之后写入的文件
+        self.log_dir = None             # 本次运行专属的外部日志目录（CEDAR_RUN_LOG_DIR）
+
+    def poll(self):
+        if self.session:
+            return self.session.poll()
+        return self.process.poll() if self.process else None
+
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'script_name': self.script_name,
+            'script_path': self.script_rel_path,
+            'status': self.status,
+            'error': self.error,
+            'pid': self.session.pid if self.session else None,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'exit_code': self.exit_code,
+            'worker': 'warm' if isinstance(self.process, WarmProcess) else 'cold',
+            'time_saved': getattr(self.process, 'time_saved', None),
+            'progress': self.progress,
+            'metrics': self.metrics['summary'] if self.metrics else None,
+            'profiled': self.profile_path is not None,
+        }
+
+    def metrics_report(self):
+        """运行中返回实时采样，结束后返回最终报告。"""
+        if self.metrics or not self.sampler:
+            return self.metrics
+        return self.sampler.report()
+
+
+class RunManager:
+    """脚本运行调度：每个运行独占一个 PTY，超出并发上限的运行按 FIFO 排队。"""
+
+    def __init__(self, max_parallel=MAX_PARALLEL_RUNS, cols=100, rows=30):
+        self.max_parallel = max(1, int(max_parallel))
+        self.cols = cols
+        self.rows = rows
+        self.runs = {}
+        self.queue = deque()
+        self.running = set()
+        self.lock = threading.Lock()
+        self.listeners = []  # 运行状态变化回调，参数为 ScriptRun
+        self.progress_listeners = []  # 进度更新回调，参数为 ScriptRun（已限频）
+
+    def submit(self, run):
+        with self.lock:
+            self.runs[run.run_id] = run
+            launch = not self.queue and len(self.running) < self.max_parallel  # 有排队时不插队
+            if launch:
+                self.running.add(run.run_id)
+            else:
+                self.queue.append(run)
+        self._notify(run)
+        if launch:
+            self._launch(run)
+        return run
+
+    def set_max_parallel(self, max_parallel):
+        with self.lock:
+            self.max_parallel = max(1, int(max_parallel))
+        self._drain_queue()
+
+    def cancel(self, run_id):
+        run = self.runs.get(run_id)
+        if not run or run.finished:
+            return run
+        with self.lock:
+            queued = run in self.queue
+            if queued:
+                self.queue.remove(run)
+            run.cancelled = True
+        run.status = 'cancelled'
+        if queued:
+            self._finish(run, None)
+        elif run.session:
+            run.session.stop()
+        return run
+
+    def list(self):
+        with self.lock:
+            runs = list(self.runs.values())
+        return [run.to_dict() for run in runs]
+
+    def _launch(self, run):
+        try:
+            run.log_path.parent.mkdir(parents=True, exist_ok=True)
+            run.log_file = run.log_path.open('a', encoding='utf-8')
+            run.session.add_listener(lambda: self._archive(run))
+            if run.handoff:
+                run.config_path = run.handoff.attach(run.session)
+            if run.progress_channel:
+                run.progress_channel.attach(run.session)
+            # 已出队但尚未启动时被取消：不再启动
+            with self.lock:
+                cancelled = run.cancelled
+            if cancelled:
+                if run.progress_channel:
+                    run.progress_channel.close()
+                self._finish(run, None)
+                return
+            run.session.start(self.cols, self.rows)
+            if run.handoff:
+                run.handoff.release()
+            if run.progress_channel:
+                run.progress_channel.start()
+            run.sampler = RunSampler(run.session.pid, watch_dir=LOG_DIR).start()
+        except Exception as e:
+            if run.progress_channel:
+                run.progress_channel.close()
+            run.status = 'failed'
+            run.error = str(e)
+            self._finish(run, None)
+            return
+        run.process = run.session.process
+        run.started_at = datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            cancelled = run.cancelled
+            if not cancelled:
+                run.status = 'running'
+        if cancelled:
+            run.session.stop()  # 取消发生在检查与启动之间，cancel() 的 stop 没有作用到进程
+        self._notify(run)
+        threading.Thread(target=self._wait, args=(run,), daemon=True).start()
+
+    def _wait(self, run):
+        try:
+            exit_code = run.session.wait()
+        except Exception:
+            exit_code = run.session.poll()
+        run.session.stop()
+        self._finish(run, exit_code)
+
+    def report_progress(self, run, state):
+        run.progress = state
+        for callback in list(self.progress_listeners):
+            try:
+                callback(run)
+            except Exception:
+                pass
+
+    def _archive(self, run):
+        """归档读者：把 PTY 新输出追加到运行日志文件（在 PTY 读线程中调用）。"""
+        text = run.session.read(reader='archive')
+        if text and run.log_file:
+            run.log_file.write(text.replace('\r\n', '\n'))
+            run.log_file.flush()
+
+    def _finish(self, run, exit_code):
+        if run.log_file:
+            self._archive(run)
+            run.log_file.write(f'\n脚本结束，退出码: {exit_code}\n')
+            run.log_file.close()
+            run.log_file = None
+        if run.sampler:
+            run.sampler.stop()
+            run.metrics = run.sampler.report()
+        run.exit_code = exit_code
+        run.finished = True
+        run.finished_at = datetime.now().isoformat(timespec='seconds')
+        if run.status == 'running':
+            run.status = 'finished'
+        if run.handoff:
+            run.handoff.close()
+        with self.lock:
+            self.running.discard(run.run_id)
+        self._notify(run)
+        self._drain_queue()
+
+    def _drain_queue(self):
+        while True:
+            with self.lock:
+                if not self.queue or len(self.running) >= self.max_parallel:
+                    return
+                run = self.queue.popleft()
+                self.running.add(run.run_id)
+            self._launch(run)
+
+    def _notify(self, run):
+        for callback in list(self.listeners):
+            try:
+                callback(run)
+            except Exception:
+                pass
+
+
+class BatchRun:
+    """一次批量运行：同一脚本的多组配置。"""
+
+    def __init__(self, batch_id, script_rel_path, configs, parallel=2, retries=0):
+        self.batch_id = batch_id
+        self.script_rel_path = script_rel_path
+        self.parallel = parallel
+        self.retries = retries
+        # 各项之间取值不同的参数，状态表中只展示这些
+        keys = sorted({key for config in configs for key in config})
+        self.varying = [key for key in keys if len({json.dumps(c.get(key), sort_keys=True) for c in configs}) > 1]
+        self.items = [{
+            'index': index, 'config': config, 'status': 'pending', 'attempts': 0, 'run_id': None,
+            'run_ids': [], 'exit_code': None, 'duration': None, 'error': '', 'started': None,
+        } for index, config in enumerate(configs)]
+        self.status = 'running'      # running / finished / cancelled
+        self.active = 0
+        self.cancelled = False
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.finished_at = None
+        self.started = time.monotonic()
+        self.elapsed = None
+        self._filling = False
+        self._refill = False
+
+    def row(self, item):
+        return {
+            'index': item['index'],
+            'params': {key: item['config'].get(key) for key in self.varying},
+            'status': item['status'],
+            'attempts': item['attempts'],
+            'run_id': item['run_id'],
+            'run_ids': list(item['run_ids']),
+            'exit_code': item['exit_code'],
+            'duration': None if item['duration'] is None else round(item['duration'], 3),
+            'error': item['error'],
+        }
+
+    def summary(self):
+        counts = {}
+        for item in self.items:
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return {
+            'batch_id': self.batch_id,
+            'script_path': self.script_rel_path,
+            'status': self.status,
+            'parallel': self.parallel,
+            'retries': self.retries,
+            'total': len(self.items),
+            'counts': counts,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'elapsed': round(self.elapsed if self.elapsed is not None else time.monotonic() - self.started, 3),
+        }
+
+    def to_dict(self):
+        return {**self.summary(), 'items': [self.row(item) for item in self.items]}
+
+
+class BatchManager:
+    """批量运行调度：批内最多 parallel 项同时提交给 RunManager（仍受全局并发上限约束），
+    非零退出的项按 retries 重试。"""
+
+    FINAL = ('succeeded', 'failed', 'cancelled')
+
+    def __init__(self, run_manager, create_run):
+        self.run_manager = run_manager
+        self.create_run = create_run    # (脚本路径, 配置) -> ScriptRun 或错误 dict
+        self.batches = {}
+        self.lock = threading.RLock()
+        self.listeners = []             # 回调参数为 (BatchRun, 变化的项或 None)
+        self._by_run = {}               # run_id → (BatchRun, 项)
+        run_manager.listeners.append(self._on_run)
 
-    def read(self):
+    def submit(self, batch):
         with self.lock:
-            data = ''.join(self.output)
-            self.output.clear()
-        return data
-
-    def write(self, data):
-        if not self.alive:
-            return
-        if self.system == 'Windows':
-            if self.winpty:
-                self.winpty.write(data)
-        elif self.master_fd is not None:
-            os.write(self.master_fd, data.encode())
+            self.batches[batch.batch_id] = batch
+        self._notify(batch, None)
+        self._fill(batch)
+        return batch
+
+    def cancel(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if not batch or batch.status != 'running':
+            return batch
+        with self.lock:
+            batch.cancelled = True
+            run_ids = []
+            for item in batch.items:
+                if item['status'] == 'pending':
+                    item['status'] = 'cancelled'
+                elif item['status'] in ('queued', 'running'):
+                    run_ids.append(item['run_id'])
+        for run_id in run_ids:
+            self.run_manager.cancel(run_id)
+        self._check_done(batch)
+        return batch
+
+    def list(self):
+        with self.lock:
+            return [batch.summary() for batch in self.batches.values()]
 
-    def resize(self, cols, rows):
-        if self.system == 'Windows':
-            if self.winpty:
-                self.winpty.setwinsize(rows, cols)
-            return
-        if self.master_fd is None:
+    def _fill(self, batch):
+        # 运行可能同步结束（启动失败）或在其他线程结束，此时只置 _refill 标记，
+        # 由正在填充的调用方再检查一遍，避免递归和丢失唤醒
+        with self.lock:
+            if batch._filling:
+                batch._refill = True
+                return
+            batch._filling = True
+        try:
+            while True:
+                with self.lock:
+                    item = None
+                    if not batch.cancelled and batch.active < batch.parallel:
+                        item = next((i for i in batch.items if i['status'] == 'pending'), None)
+                    if item is None:
+                        if batch._refill:
+                            batch._refill = False
+                            continue
+                        batch._filling = False
+                        break
+                    item['status'] = 'queued'
+                    item['attempts'] += 1
+                    batch.active += 1
+                self._start(batch, item)
+        except BaseException:
+            with self.lock:
+                batch._filling = False
+            raise
+        self._check_done(batch)
+
+    def _start(self, batch, item):
+        run = self.create_run(batch.script_rel_path, item['config'])
+        if isinstance(run, dict):
+            with self.lock:
+                item['status'] = 'failed'
+                item['error'] = run.get('error', '')
+                batch.active -= 1
+            self._notify(batch, item)
             return
-        import fcntl
-        import struct
-        import termios
-
-        size = struct.pack('HHHH', rows, cols, 0, 0)
-        fcntl.ioctl(self.master_fd, termios.TIOCSWINSZ, size)
+        with self.lock:
+            item['run_id'] = run.run_id
+            item['run_ids'].append(run.run_id)
+            self._by_run[run.run_id] = (batch, item)
+        self._notify(batch, item)
+        self.run_manager.submit(run)
 
-    def stop(self):
-        self.alive = False
-        if self.system == 'Windows' and self.winpty:
+    def _on_run(self, run):
+        with self.lock:
+            entry = self._by_run.get(run.run_id)
+            if entry is None:
+                return
+            batch, item = entry
+            if run.status == 'running' and item['started'] is None:
+                item['status'] = 'running'
+                item['started'] = time.monotonic()
+            elif not run.finished:
+                return
+            else:
+                del self._by_run[run.run_id]
+                batch.active -= 1
+                if item['started'] is not None:
+                    item['duration'] = time.monotonic() - item['started']
+                item['started'] = None
+                item['exit_code'] = run.exit_code
+                item['error'] = run.error
+                if run.status == 'cancelled' or batch.cancelled:
+                    item['status'] = 'cancelled'
+                elif run.exit_code == 0:
+                    item['status'] = 'succeeded'
+                elif item['attempts'] <= batch.retries:
+                    item['status'] = 'pending'  # 重试：序号最小的待运行项最先启动
+                else:
+                    item['status'] = 'failed'
+        self._notify(batch, item)
+        if run.finished:
+            self._fill(batch)
+
+    def _check_done(self, batch):
+        with self.lock:
+            if batch.status != 'running' or any(item['status'] not in self.FINAL for item in batch.items):
+                return
+            batch.status = 'cancelled' if batch.cancelled else 'finished'
+            batch.finished_at = datetime.now().isoformat(timespec='seconds')
+            batch.elapsed = time.monotonic() - batch.started
+        self._notify(batch, None)
+
+    def _notify(self, batch, item):
+        for callback in list(self.listeners):
             try:
-                self.winpty.close()
+                callback(batch, item)
             except Exception:
                 pass
-        if self.process and self.process.poll() is None:
-            self.process.terminate()
-        if self.master_fd is not None:
-            try:
-                os.close(self.master_fd)
-            except OSError:
-                pass
 
 
-def should_skip_directory(dir_name):
-    skip_patterns = {'.build', '__pycache__', '.git', '.svn', '.hg', 'node_modules', '.vscode', '.idea'}
-    return dir_name in skip_patterns or dir_name.endswith('.build')
+class AiJob:
+    """一次后台 AI 诊断：`<AI_COMMAND> run <prompt>` 子进程，输出增量累积。"""
 
+    FINAL = ('finished', 'failed', 'cancelled')
 
-def get_script_file_path(script_dir):
-    main_py = script_dir / 'main.py'
-    if main_py.exists():
-        return main_py
+    def __init__(self, job_id, kind, prompt, timeout=AI_TIMEOUT):
+        self.job_id = job_id
+        self.kind = kind
+        self.prompt = prompt
+        self.timeout = timeout
+        self.status = 'queued'          # queued / running / finished / failed / cancelled
+        self.error = ''
+        self.exit_code = None
+        self.chunks = []
+        self.length = 0                 # 已输出字符数
+        self.process = None
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def read(self, cursor=0):
+        """返回 (自 cursor 起的新输出, 新游标)；cursor 以字符计。"""
+        cursor = min(max(int(cursor or 0), 0), self.length)
+        text = ''.join(self.chunks)
+        return text[cursor:], len(text)
+
+    def result(self):
+        """与旧版同步接口一致的返回值。"""
+        review = ''.join(self.chunks)
+        if self.status == 'finished' and self.exit_code == 0:
+            return {'ok': True, 'error': '', 'data': {'review': review, 'exit_code': 0}}
+        if self.exit_code is not None and self.status == 'finished':
+            return {'ok': False, 'error': f'opencode 退出码: {self.exit_code}',
+                    'data': {'review': review, 'exit_code': self.exit_code}}
+        return {'ok': False, 'error': self.error or '已取消', 'data': {'review': review}}
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'exit_code': self.exit_code,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'length': self.length,
+        }
 
-    for file_path in script_dir.iterdir():
-        name = file_path.name
-        if (name.startswith('main.cpython-') or name.startswith('main.cp')) and name.endswith(('.so', '.pyd')):
-            return file_path
-    return None
 
+class AiJobManager:
+    """AI 诊断任务调度：最多 max_parallel 个子进程同时运行，其余 FIFO 排队。
 
-def has_script_file(script_dir):
-    return script_dir.is_dir() and get_script_file_path(script_dir) is not None
+    读线程把 stdout/stderr 增量交给 output_listeners，状态变化通知 listeners；超时或取消时
+    结束整个进程组。只保留最近 AI_KEEP_JOBS 个已结束任务。
+    """
 
+    def __init__(self, max_parallel=AI_MAX_JOBS, command=AI_COMMAND):
+        import shlex
 
-def has_valid_subdirs(dir_path):
-    try:
-        return any(p.is_dir() and not should_skip_directory(p.name) for p in dir_path.iterdir())
-    except OSError:
-        return False
+        self.max_parallel = max(1, int(max_parallel))
+        self.command = shlex.split(command, posix=os.name == 'posix')
+        self.jobs = OrderedDict()
+        self.queue = deque()
+        self.running = set()
+        self.lock = threading.Lock()
+        self.listeners = []             # 状态变化回调，参数为 AiJob
+        self.output_listeners = []      # 新输出回调，参数为 (AiJob, 文本)
+
+    def submit(self, job):
+        with self.lock:
+            self.jobs[job.job_id] = job
+            launch = not self.queue and len(self.running) < self.max_parallel
+            if launch:
+                self.running.add(job.job_id)
+            else:
+                self.queue.append(job)
+            self._prune()
+        self._notify(job)
+        if launch:
+            self._launch(job)
+        return job
+
+    def set_max_parallel(self, max_parallel):
+        with self.lock:
+            self.max_parallel = max(1, int(max_parallel))
+        self._drain_queue()
 
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job or job.status in AiJob.FINAL:
+            return job
+        with self.lock:
+            queued = job in self.queue
+            if queued:
+                self.queue.remove(job)
+            job.status = 'cancelled'
+        if queued:
+            self._finish(job, None)
+        else:
+            self._kill(job)
+        return job
 
-class ScriptRun:
-    def __init__(self, run_id, process, log_path, config_path, script_name, script_rel_path, config):
-        self.run_id = run_id
-        self.process = process
-        self.log_path = log_path
-        self.config_path = config_path
-        self.script_name = script_name
-        self.script_rel_path = script_rel_path
-        self.config = config or {}
-        self.created_at = datetime.now().isoformat(timespec='seconds')
-        self.finished = False
-        self.exit_code = None
-        self.file_offsets = {}
-        self.external_log = []
+    def list(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def _launch(self, job):
+        kwargs = {'start_new_session': True} if os.name == 'posix' else {}
+        try:
+            job.process = subprocess.Popen(
+                self.command + ['run', job.prompt],
+                cwd=str(BASE_DIR),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **kwargs,
+            )
+        except FileNotFoundError:
+            job.status = 'failed'
+            job.error = f'未找到 {self.command[0]} 命令，请先安装或配置 PATH'
+            self._finish(job, None)
+            return
+        except OSError as e:
+            job.status = 'failed'
+            job.error = str(e)
+            self._finish(job, None)
+            return
+        with self.lock:
+            if job.status == 'queued':
+                job.status = 'running'
+        job.started_at = datetime.now().isoformat(timespec='seconds')
+        if job.status == 'cancelled':  # 启动期间被取消
+            self._kill(job)
+        self._notify(job)
+        threading.Thread(target=self._reader, args=(job,), name='ai-job', daemon=True).start()
+
+    def _reader(self, job):
+        timer = threading.Timer(job.timeout, self._timeout, args=(job,))
+        timer.daemon = True
+        timer.start()
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        fd = job.process.stdout.fileno()
+        try:
+            while True:
+                data = os.read(fd, 8192)
+                text = decoder.decode(data, final=not data)
+                if text:
+                    job.chunks.append(text)
+                    job.length += len(text)
+                    for callback in list(self.output_listeners):
+                        try:
+                            callback(job, text)
+                        except Exception:
+                            pass
+                if not data:
+                    break
+        except OSError:
+            pass
+        finally:
+            timer.cancel()
+            job.process.stdout.close()
+        self._finish(job, job.process.wait())
+
+    def _timeout(self, job):
+        with self.lock:
+            if job.status != 'running':
+                return
+            job.status = 'failed'
+            job.error = 'opencode 分析超时'
+        self._kill(job)
+
+    def _kill(self, job, force=False):
+        """先 SIGTERM 整个进程组，3 秒后仍未退出则 SIGKILL。"""
+        process = job.process
+        if not process or process.poll() is not None:
+            return
+        try:
+            if os.name == 'posix':
+                import signal
+
+                os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+            elif force:
+                process.kill()
+            else:
+                process.terminate()
+        except OSError:
+            return
+        if not force:
+            timer = threading.Timer(3.0, self._kill, args=(job, True))
+            timer.daemon = True
+            timer.start()
+
+    def _finish(self, job, exit_code):
+        with self.lock:
+            job.exit_code = exit_code
+            if job.status in ('queued', 'running'):
+                job.status = 'finished'
+            job.finished_at = datetime.now().isoformat(timespec='seconds')
+            self.running.discard(job.job_id)
+        job.done.set()
+        self._notify(job)
+        self._drain_queue()
+
+    def _drain_queue(self):
+        while True:
+            with self.lock:
+                if not self.queue or len(self.running) >= self.max_parallel:
+                    return
+                job = self.queue.popleft()
+                self.running.add(job.job_id)
+            self._launch(job)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status in AiJob.FINAL]
+        for job_id in finished[:max(0, len(finished) - AI_KEEP_JOBS)]:
+            del self.jobs[job_id]
+
+    def _notify(self, job):
+        for callback in list(self.listeners):
+            try:
+                callback(job)
+            except Exception:
+                pass
 
 
 class Api:
     def __init__(self):
         LOG_DIR.mkdir(exist_ok=True)
-        self.runs = {}
+        self.log_watcher = LogWatcher(LOG_DIR).start()
+        self.script_tree = ScriptTreeCache(SCRIPTS_DIR, ScriptWatcher(SCRIPTS_DIR).start())
+        self.script_meta = ScriptMetaCache()
+        self.worker_pool = WarmWorkerPool()
+        self.history = LogHistory(HISTORY_DB_PATH, LOG_DIR)
+        self.search_index = LogSearchIndex(SEARCH_DB_PATH, LOG_DIR, self.log_watcher).start()
+        self.run_manager = RunManager()
+        self.run_manager.listeners.append(self._record_history)
+        self.runs = self.run_manager.runs
+        self.ai_jobs = AiJobManager()
+        self.batch_manager = BatchManager(
+            self.run_manager, lambda path, config: self._create_run(path, config, BATCH_BUFFER_BYTES))
+        self._line_indexes = OrderedDict()  # 路径 → LineIndex（LRU）
+        self._line_indexes_lock = threading.Lock()  # get_log_detail 在线程池中并发调用
         self.current_run = None
+        self.terminal_run = None  # 输出镜像到共享终端的运行；未结束时终端输入转给它的 PTY
         self.window = None
         self.terminal = None
 
@@ -196,86 +2802,68 @@ class Api:
         self.window = window
 
     def get_scripts(self):
-        """返回脚本树。只有包含 main.py/.pyd/.so 的节点可运行。"""
-        def build_node(path, rel_parts):
-            children = []
-            try:
-                entries = sorted(path.iterdir(), key=lambda p: p.name)
-            except OSError:
-                entries = []
-
-            for entry in entries:
-                if not entry.is_dir() or should_skip_directory(entry.name):
-                    continue
-                if has_script_file(entry) or has_valid_subdirs(entry):
-                    child = build_node(entry, rel_parts + [entry.name])
-                    if child['runnable'] or child['children']:
-                        children.append(child)
+        """返回脚本树。只有包含 main.py/.pyd/.so 的节点可运行。version 供 get_scripts_diff 增量刷新。"""
+        if not SCRIPTS_DIR.exists():
+            return {'ok': False, 'error': f'脚本目录不存在: {SCRIPTS_DIR}', 'data': []}
+        version, tree = self.script_tree.get()
+        return {'ok': True, 'data': tree, 'version': version}
 
-            script_file = get_script_file_path(path) if path.exists() else None
-            rel_path = '/'.join(rel_parts)
-            return {
-                'name': path.name if rel_parts else 'scripts',
-                'path': rel_path,
-                'runnable': script_file is not None,
-                'children': children,
-            }
+    def get_scripts_diff(self, since_version, validate=False):
+        """返回 since_version 之后脚本树的增量操作。
 
+        操作为 {'op': 'remove', 'path'}、{'op': 'add', 'parent', 'index', 'node'}、
+        {'op': 'update', 'path', 'runnable'}，按顺序应用。版本过旧时 reset 为 True 并附带整棵树。
+        validate 时按目录 mtime 完整校验（手动刷新用，网络共享上 inotify 收不到远端修改）。
+        """
         if not SCRIPTS_DIR.exists():
-            return {'ok': False, 'error': f'脚本目录不存在: {SCRIPTS_DIR}', 'data': []}
-        return {'ok': True, 'data': build_node(SCRIPTS_DIR, [])['children']}
+            return {'ok': False, 'error': f'脚本目录不存在: {SCRIPTS_DIR}'}
+        try:
+            since_version = int(since_version)
+        except (TypeError, ValueError):
+            since_version = -1
+        version, changes = self.script_tree.diff_since(since_version, validate=bool(validate))
+        if changes is None:
+            # 整树与其版本号同一次加锁取得，彼此一致
+            version, tree = self.script_tree.get()
+            return {'ok': True, 'data': {'version': version, 'reset': True, 'tree': tree, 'changes': []}}
+        return {'ok': True, 'data': {'version': version, 'reset': False, 'changes': changes}}
 
     def get_script_detail(self, script_rel_path):
         script_dir = self._safe_script_dir(script_rel_path)
         if not script_dir or not has_script_file(script_dir):
             return {'ok': False, 'error': '脚本不存在或不可运行'}
 
-        form_path = script_dir / 'form.yaml'
-        fields = []
-        if form_path.exists():
-            with form_path.open('r', encoding='utf-8') as f:
-                form_cfg = yaml.safe_load(f) or {}
-            fields = form_cfg.get('fields', []) or []
-
-        readme_path = script_dir / 'README.md'
-        doc = ''
-        if readme_path.exists():
-            doc = readme_path.read_text(encoding='utf-8').strip()
+        meta = self.script_meta.get(script_dir)
+        return {'ok': True, 'data': {'path': script_rel_path, 'fields': meta['fields'], 'doc': meta['doc']}}
 
-        return {'ok': True, 'data': {'path': script_rel_path, 'fields': fields, 'doc': doc}}
+    def get_recent_logs(self, limit=20, offset=0, script=None, date_from=None, date_to=None):
+        """返回最近的日志文件，用于运行历史视图。
 
-    def get_recent_logs(self, limit=20):
-        """返回 log/ 目录下最近的日志文件，用于运行历史视图。"""
+        由 log/history.db 索引支撑：支持分页（limit/offset）、按脚本名和日期范围
+        （ISO 日期，如 2024-07-03）过滤。
+        """
         try:
             limit = int(limit or 20)
+            offset = int(offset or 0)
         except (TypeError, ValueError):
-            limit = 20
+            limit, offset = 20, 0
         if not LOG_DIR.exists():
             return {'ok': True, 'data': []}
-        items = []
-        for path in LOG_DIR.rglob('*.log'):
-            try:
-                stat = path.stat()
-                preview = ''
-                try:
-                    text = path.read_text(encoding='utf-8', errors='ignore')
-                    preview = text[-300:].strip()
-                except OSError:
-                    preview = ''
-                items.append({
-                    'name': path.name,
-                    'path': str(path.relative_to(LOG_DIR)),
-                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
-                    'size': stat.st_size,
-                    'preview': preview,
-                })
-            except OSError:
-                continue
-        items.sort(key=lambda item: item['modified'], reverse=True)
-        return {'ok': True, 'data': items[:limit]}
-
-    def get_log_detail(self, log_rel_path, max_chars=120000):
-        """安全读取单个历史日志详情。"""
+        try:
+            self.history.sync(self.log_watcher)
+            return {'ok': True, 'data': self.history.query(limit, offset, script, date_from, date_to)}
+        except ValueError as e:
+            return {'ok': False, 'error': f'日期格式错误: {e}'}
+
+    def get_log_detail(self, log_rel_path, max_chars=120000, offset=None, length=None, line=None, lines=None,
+                       direction='forward'):
+        """安全读取单个历史日志详情，内存占用与文件大小无关。
+
+        - 默认：从文件末尾 seek，返回最后 max_chars 个字符；
+        - offset/length：字节区间，direction='backward' 时读取 offset 之前的 length 字节；
+        - line/lines：行区间（行号从 0 开始），direction='backward' 时读取 line 之前的 lines 行。
+        返回的 offset_start/offset_end、line_start/line_end 可作为翻页游标。
+        """
         if not log_rel_path:
             return {'ok': False, 'error': '日志路径为空'}
         try:
@@ -289,98 +2877,448 @@ class Api:
             return {'ok': False, 'error': '非法日志路径'}
         if not log_path.exists() or not log_path.is_file():
             return {'ok': False, 'error': '日志文件不存在'}
+        backward = direction == 'backward'
         try:
             stat = log_path.stat()
-            text = log_path.read_text(encoding='utf-8', errors='ignore')
-            clipped = len(text) > max_chars
-            if clipped:
-                text = text[-max_chars:]
-            return {
-                'ok': True,
-                'data': {
-                    'name': log_path.name,
-                    'path': str(log_path.relative_to(LOG_DIR)),
-                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
-                    'size': stat.st_size,
-                    'content': text,
-                    'clipped': clipped,
-                },
+            data = {
+                'name': log_path.name,
+                'path': str(log_path.relative_to(LOG_DIR)),
+                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
+                'size': stat.st_size,
             }
-        except OSError as e:
+            if line is not None:
+                index = self._line_index(log_path)
+                count = int(lines or LOG_PAGE_LINES)
+                first = max(0, int(line) - count) if backward else max(0, int(line))
+                last = min(first + count, index.total_lines)
+                text, start, stop, _ = read_byte_range(log_path, index.offset_of_line(first), index.offset_of_line(last))
+                data.update(content=text, clipped=first > 0 or last < index.total_lines,
+                            line_start=first, line_end=last, total_lines=index.total_lines,
+                            offset_start=start, offset_end=stop)
+            elif offset is not None:
+                length = int(length or LOG_PAGE_BYTES)
+                start = max(0, int(offset) - length) if backward else int(offset)
+                text, start, stop, size = read_byte_range(log_path, start, start + length)
+                data.update(content=text, clipped=start > 0 or stop < size, offset_start=start, offset_end=stop)
+            else:
+                text, start, stop, size = read_byte_range(log_path, stat.st_size - max_chars * 4, stat.st_size)
+                clipped = start > 0 or len(text) > max_chars
+                if len(text) > max_chars:
+                    start = stop - len(text[-max_chars:].encode('utf-8'))
+                    text = text[-max_chars:]
+                data.update(content=text, clipped=clipped, offset_start=start, offset_end=stop)
+            return {'ok': True, 'data': data}
+        except (OSError, ValueError) as e:
             return {'ok': False, 'error': str(e)}
 
-    def run_script(self, script_rel_path, config):
+    def search_logs(self, query, script=None, date_from=None, date_to=None, limit=50):
+        """在 log/ 归档中全文搜索（缺陷 ID、文件路径、异常堆栈等）。
+
+        可按脚本名（log/<script_name>/）和日期范围过滤；结果中的 offset 为匹配处
+        的字节偏移，可直接传给 get_log_detail(path, offset=...) 定位。
+        """
+        query = (query or '').strip()
+        if not query:
+            return {'ok': False, 'error': '搜索内容为空'}
+        try:
+            limit = int(limit or 50)
+        except (TypeError, ValueError):
+            limit = 50
+        self.search_index.request_sync()
+        try:
+            results = self.search_index.search(query, script, date_from, date_to, limit)
+        except ValueError as e:
+            return {'ok': False, 'error': f'日期格式错误: {e}'}
+        except sqlite3.Error as e:
+            return {'ok': False, 'error': f'搜索失败: {e}'}
+        return {'ok': True, 'data': {'results': results, 'indexing': self.search_index.indexing}}
+
+    def _line_index(self, log_path):
+        key = str(log_path)
+        with self._line_indexes_lock:
+            index = self._line_indexes.pop(key, None) or LineIndex(log_path)
+            self._line_indexes[key] = index
+            while len(self._line_indexes) > LINE_INDEX_CACHE_SIZE:
+                self._line_indexes.popitem(last=False)
+        index.refresh()  # LineIndex 自带锁，扫描不占用 LRU 锁
+        return index
+
+    def run_script(self, script_rel_path, config, profile=False):
+        """在独立 PTY 中运行脚本，输出同步显示到共享终端，并登记运行记录。
+
+        profile 为真时在 cProfile 下运行，结束后用 get_run_profile 查看热点。
+        """
+        run = self._create_run(script_rel_path, config, profile=profile)
+        if isinstance(run, dict):
+            return run
+        started = self.terminal_start()
+        if not started.get('ok'):
+            return started
+        terminal = self.terminal
+        cmd = ' '.join('<启动器>' if '\n' in arg else self._shell_quote(arg) for arg in run.session.argv)
+
+        def mirror():
+            text = run.session.read(reader='terminal')
+            if text:
+                terminal._append_output(text)
+
+        terminal._append_output(f'\r\n$ {cmd}\r\n')
+        run.session.add_listener(mirror)
+        self.run_manager.submit(run)
+        self.current_run = run.run_id
+        self.terminal_run = run
+        # 排队中的运行尚未创建配置管道，路径还是占位符
+        config_file = None if run.config_path == ConfigHandoff.PLACEHOLDER else run.config_path
+        return {'ok': True, 'data': {'command': cmd, 'config_file': config_file, **run.to_dict()}}
+
+    def start_run(self, script_rel_path, config, profile=False):
+        """在独立 PTY 中运行脚本；超出并发上限时排队，返回运行记录。profile 同 run_script。"""
+        run = self._create_run(script_rel_path, config, profile=profile)
+        if isinstance(run, dict):
+            return run
+        self.run_manager.submit(run)
+        self.current_run = run.run_id
+        return {'ok': True, 'data': run.to_dict()}
+
+    def _create_run(self, script_rel_path, config, buffer_bytes=TERMINAL_BUFFER_BYTES, profile=False):
         script_dir = self._safe_script_dir(script_rel_path)
         if not script_dir or not has_script_file(script_dir):
             return {'ok': False, 'error': '脚本不存在或不可运行'}
+        if config is None:
+            config = {}  # 与旧版 json.dump(config or {}) 一致：未传配置视为空对象
+        try:
+            errors = self.script_meta.validate(script_dir, config)
+        except (OSError, yaml.YAMLError) as e:
+            return {'ok': False, 'error': f'读取 form.yaml 失败: {e}'}
+        if errors:
+            return {'ok': False, 'error': '配置校验失败：' + '；'.join(errors)}
+
+        meta = self.script_meta.get(script_dir)
+        handoff = ConfigHandoff(config, CONFIG_HANDOFF if meta['config_handoff'] != 'file' else 'file')
+        run_id = uuid.uuid4().hex[:12]
+        profile_path = RUN_LOG_DIR / f'{run_id}.prof' if profile else None
+        argv = self._prepare_command(script_dir, handoff.path, profile_path)
+        env = os.environ.copy()
+        env['CEDAR_BASE_DIR'] = str(BASE_DIR)
+        # 并行运行（含批量运行同一脚本）各自写入独立目录，外部日志按目录归属到运行
+        run_log_dir = LOG_DIR / script_dir.name / run_id
+        env['CEDAR_RUN_LOG_DIR'] = str(run_log_dir)
+        env['PYTHONIOENCODING'] = 'utf-8'
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (str(SDK_DIR), env.get('PYTHONPATH')) if p)
+        spawner = None
+        if self.worker_pool.enabled and meta['warm_worker']:
+            def spawner(argv, cwd, env, slave_fd, pass_fds):
+                process = self.worker_pool.spawn(argv, cwd, env, slave_fd, pass_fds)
+                if process is not None:
+                    session._append_output(f'[预热进程] 跳过解释器启动与模块导入，约节省 {process.time_saved:.2f}s\r\n')
+                return process
+        session = TerminalSession(script_dir, buffer_bytes, argv=argv, env=env, spawner=spawner)
+        run = ScriptRun(
+            run_id, None, RUN_LOG_DIR / f'{run_id}.log', handoff.path,
+            script_dir.name, script_rel_path, config,
+            session=session, handoff=handoff,
+        )
+        run.profile_path = profile_path
+        run.log_dir = run_log_dir
+        run.progress_channel = ProgressChannel(lambda state: self.run_manager.report_progress(run, state))
+        self._init_log_offsets(run)
+        return run
 
-        script_path = get_script_file_path(script_dir)
-        config_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8')
-        json.dump(config or {}, config_file, ensure_ascii=False, indent=2)
-        config_file.close()
-
-        if str(script_path).endswith(('.so', '.pyd')):
-            runner = self._compiled_runner_code(script_dir, config_file.name)
-            runner_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.py', encoding='utf-8')
-            runner_file.write(runner)
-            runner_file.close()
-            cmd = f'{self._shell_quote(sys.executable)} {self._shell_quote(runner_file.name)}'
+    def list_runs(self):
+        return {'ok': True, 'data': self.run_manager.list()}
+
+    def get_run_metrics(self, run_id, compare=5):
+        """返回运行的资源采样：汇总 summary、采样间隔 interval、时间序列 series。
+
+        运行中返回截至目前的采样；已不在内存中的运行从历史索引读取。previous 为同一脚本
+        最近 compare 次运行的汇总，便于发现版本间的性能回退。
+        """
+        run = self.runs.get(run_id)
+        if run:
+            script, report = run.script_name, run.metrics_report()
         else:
-            cmd = f'{self._shell_quote(sys.executable)} {self._shell_quote(str(script_path))} {self._shell_quote(config_file.name)}'
+            found = self.history.run_metrics(run_id)
+            script, report = found if found else (None, None)
+        if not report:
+            message = '该运行没有资源采样数据' if run or script else '运行记录不存在'
+            return {'ok': False, 'error': message}
+        previous = self.history.script_metrics(script, compare, exclude=run_id) if compare else []
+        return {
+            'ok': True,
+            'data': {
+                'run_id': run_id,
+                'script': script,
+                'finished': run.finished if run else True,
+                **report,
+                'previous': previous,
+            },
+        }
 
-        self.terminal_start()
-        terminal_cmd = (
-            f'cd {self._shell_quote(str(script_dir))}\n'
-            f'export CEDAR_BASE_DIR={self._shell_quote(str(BASE_DIR))}\n'
-            f'{cmd}\n'
-        )
-        self.terminal.write(terminal_cmd)
-        return {'ok': True, 'data': {'command': cmd, 'config_file': config_file.name}}
+    def get_run_profile(self, run_id, limit=PROFILE_TOP):
+        """返回性能分析结果：按累计耗时（by_cumulative）和自身耗时（by_self）排序的前 limit 个函数。
+
+        统计文件为运行日志旁的 log/runs/<run_id>.prof（可用 snakeviz 等工具打开）；首次查询时在旁边
+        生成 flamegraph 折叠栈 <run_id>.collapsed.txt（flamegraph.pl / speedscope 可直接读取）。
+        """
+        import pstats
+
+        run = self.runs.get(run_id)
+        if run and not run.finished:
+            return {'ok': False, 'error': '运行尚未结束'}
+        if run and run.profile_path is None:
+            return {'ok': False, 'error': '该运行未开启性能分析'}
+        if not str(run_id).isalnum():
+            return {'ok': False, 'error': '运行记录不存在'}
+        path = RUN_LOG_DIR / f'{run_id}.prof'
+        if not path.exists():
+            return {'ok': False, 'error': '没有性能分析结果（脚本可能被强制结束）'}
+        try:
+            stats = pstats.Stats(str(path))
+        except Exception as e:
+            return {'ok': False, 'error': f'读取性能分析结果失败: {e}'}
+        collapsed_path = path.with_suffix('.collapsed.txt')
+        if not collapsed_path.exists() or collapsed_path.stat().st_mtime < path.stat().st_mtime:
+            stacks = collapse_profile(stats)
+            tmp = collapsed_path.with_name(collapsed_path.name + '.tmp')
+            with tmp.open('w', encoding='utf-8') as f:
+                for stack, micros in sorted(stacks.items()):
+                    f.write(f'{stack} {micros}\n')
+            os.replace(tmp, collapsed_path)
+        by_cumulative, by_self = profile_top(stats, limit)
+        return {
+            'ok': True,
+            'data': {
+                'run_id': run_id,
+                'total_time': round(stats.total_tt, 6),
+                'total_calls': stats.total_calls,
+                'by_cumulative': by_cumulative,
+                'by_self': by_self,
+                'stats_path': path.relative_to(LOG_DIR).as_posix(),
+                'collapsed_path': collapsed_path.relative_to(LOG_DIR).as_posix(),
+            },
+        }
+
+    def run_batch(self, script_rel_path, configs=None, grid=None, base_config=None, parallel=2, retries=0):
+        """用多组配置批量运行同一脚本。
+
+        configs 为配置列表；或 grid 为 {字段名: 取值列表}，按 form.yaml 字段做笛卡尔积。
+        每项配置以 form.yaml 默认值和 base_config 为底。批内最多 parallel 项同时运行，
+        非零退出的项最多重试 retries 次。返回带逐项状态、耗时、退出码的状态表。
+        """
+        script_dir = self._safe_script_dir(script_rel_path)
+        if not script_dir or not has_script_file(script_dir):
+            return {'ok': False, 'error': '脚本不存在或不可运行'}
+        try:
+            fields = self.script_meta.get(script_dir)['fields']
+        except (OSError, yaml.YAMLError) as e:
+            return {'ok': False, 'error': f'读取 form.yaml 失败: {e}'}
+        defaults = {f['name']: f.get('default') for f in fields if isinstance(f, dict) and f.get('name')}
+        base = {**defaults, **(base_config or {})}
+
+        if configs:
+            if not isinstance(configs, list) or not all(isinstance(c, dict) for c in configs):
+                return {'ok': False, 'error': 'configs 必须是配置对象列表'}
+            items = [{**base, **config} for config in configs]
+        elif grid:
+            if not isinstance(grid, dict):
+                return {'ok': False, 'error': 'grid 必须是 {字段名: 取值列表}'}
+            unknown = [key for key in grid if key not in defaults]
+            if unknown:
+                return {'ok': False, 'error': f'form.yaml 中没有字段: {", ".join(unknown)}'}
+            keys = list(grid)
+            values = [value if isinstance(value, list) else [value] for value in grid.values()]
+            count = 1
+            for value in values:
+                count *= len(value)
+            if count > BATCH_MAX_ITEMS:
+                return {'ok': False, 'error': f'参数组合共 {count} 项，超过上限 {BATCH_MAX_ITEMS}'}
+            items = [{**base, **dict(zip(keys, combo))} for combo in itertools.product(*values)]
+        else:
+            return {'ok': False, 'error': '需要提供 configs 或 grid'}
+        if not items:
+            return {'ok': False, 'error': '没有可运行的配置'}
+        if len(items) > BATCH_MAX_ITEMS:
+            return {'ok': False, 'error': f'配置共 {len(items)} 项，超过上限 {BATCH_MAX_ITEMS}'}
+
+        for index, config in enumerate(items):
+            errors = self.script_meta.validate(script_dir, config)
+            if errors:
+                return {'ok': False, 'error': f'第 {index + 1} 项配置校验失败：' + '；'.join(errors)}
+        try:
+            parallel = max(1, int(parallel or 1))
+            retries = min(max(0, int(retries or 0)), BATCH_MAX_RETRIES)
+        except (TypeError, ValueError):
+            return {'ok': False, 'error': 'parallel/retries 必须是整数'}
+        batch = BatchRun(uuid.uuid4().hex[:12], script_rel_path, items, parallel, retries)
+        self.batch_manager.submit(batch)
+        return {'ok': True, 'data': batch.to_dict()}
+
+    def get_batch(self, batch_id):
+        batch = self.batch_manager.batches.get(batch_id)
+        if not batch:
+            return {'ok': False, 'error': '批量运行不存在'}
+        return {'ok': True, 'data': batch.to_dict()}
+
+    def list_batches(self):
+        return {'ok': True, 'data': self.batch_manager.list()}
+
+    def cancel_batch(self, batch_id):
+        batch = self.batch_manager.cancel(batch_id)
+        if not batch:
+            return {'ok': False, 'error': '批量运行不存在'}
+        return {'ok': True, 'data': batch.to_dict()}
+
+    def attach_run(self, run_id, cursor=0, max_bytes=None):
+        """按游标读取某次运行的终端输出，可多次调用增量获取。"""
+        run = self.runs.get(run_id)
+        if not run:
+            return {'ok': False, 'error': '运行记录不存在'}
+        text, cursor = run.session.read_from(cursor, max_bytes)
+        return {'ok': True, 'data': {**run.to_dict(), 'text': text, 'cursor': cursor}}
 
-    def get_run_status(self, run_id):
+    def run_write(self, run_id, data):
+        """向运行中的脚本 PTY 写入输入。"""
         run = self.runs.get(run_id)
         if not run:
             return {'ok': False, 'error': '运行记录不存在'}
-        exit_code = run.process.poll()
-        if exit_code is not None:
-            run.finished = True
-            run.exit_code = exit_code
-        self._collect_external_logs(run)
-        own_log = run.log_path.read_text(encoding='utf-8') if run.log_path.exists() else ''
-        external_log = ''.join(run.external_log)
-        log = own_log + ('\n' if own_log and external_log else '') + external_log
-        return {'ok': True, 'data': {'finished': run.finished, 'exit_code': run.exit_code, 'log': log}}
+        run.session.write(data or '')
+        return {'ok': True}
 
-    def analyze_run_with_opencode(self, run_id):
+    def cancel_run(self, run_id):
+        run = self.run_manager.cancel(run_id)
+        if not run:
+            return {'ok': False, 'error': '运行记录不存在'}
+        return {'ok': True, 'data': run.to_dict()}
+
+    def set_run_parallelism(self, max_parallel):
+        self.run_manager.set_max_parallel(max_parallel)
+        return {'ok': True, 'data': {'max_parallel': self.run_manager.max_parallel}}
+
+    def get_worker_pool(self):
+        """预热进程状态：是否可用、已预加载的模块、冷启动耗时、累计节省时间。"""
+        return {'ok': True, 'data': self.worker_pool.status()}
+
+    def configure_worker_pool(self, enabled=None, preload=None):
+        """开关预热进程或修改预加载模块（逗号分隔）；preload 变化时重启 fork server。"""
+        if enabled and not hasattr(os, 'fork'):
+            return {'ok': False, 'error': '当前平台不支持预热进程'}
+        self.worker_pool.configure(enabled, preload)
+        return {'ok': True, 'data': self.worker_pool.status()}
+
+    def get_run_status(self, run_id, cursor=0, external_cursor=0, max_bytes=RUN_STATUS_MAX_BYTES):
+        """返回运行状态及自 cursor 以来新增的日志。
+
+        cursor 为运行日志文件的字节偏移，external_cursor 为外部日志片段序号；
+        调用方把返回的新游标带入下次调用，轮询开销只与新增输出成正比。
+        """
         run = self.runs.get(run_id)
         if not run:
             return {'ok': False, 'error': '运行记录不存在'}
-        status = self.get_run_status(run_id)
-        if not status.get('ok'):
-            return status
-        log = status['data']['log'] or ''
-        prompt = self._build_opencode_review_prompt(run, log)
+        self._collect_external_logs(run)
+        log, next_cursor, size = '', int(cursor or 0), 0
+        if run.log_path.exists():
+            log, next_cursor, size = read_text_range(run.log_path, cursor, max_bytes)
+        external_cursor = min(max(int(external_cursor or 0), 0), len(run.external_log))
+        external_log = ''.join(run.external_log[external_cursor:])
+        return {
+            'ok': True,
+            'data': {
+                **run.to_dict(),
+                'finished': run.finished,
+                'log': log,
+                'cursor': next_cursor,
+                'log_size': size,
+                'external_log': external_log,
+                'external_cursor': len(run.external_log),
+            },
+        }
+
+    def start_ai_job(self, kind, params=None):
+        """后台启动 AI 诊断，立即返回任务记录（含 job_id）。
+
+        kind 为 run（params: run_id）、terminal（params: script_path, config, terminal_log）
+        或 assist（params 同 ai_assist 的 payload）。输出以 ai_output 通知增量推送，也可用
+        get_ai_job 按游标轮询；同时运行的任务数受 set_ai_parallelism 限制。
+        """
+        job = self._submit_ai_job(kind, params or {})
+        if isinstance(job, dict):
+            return job
+        return {'ok': True, 'data': job.to_dict()}
+
+    def get_ai_job(self, job_id, cursor=0):
+        """返回任务状态及自 cursor（字符数）以来的新输出。"""
+        job = self.ai_jobs.jobs.get(job_id)
+        if not job:
+            return {'ok': False, 'error': 'AI 任务不存在'}
+        output, next_cursor = job.read(cursor)
+        return {'ok': True, 'data': {**job.to_dict(), 'output': output, 'cursor': next_cursor}}
+
+    def list_ai_jobs(self):
+        return {'ok': True, 'data': self.ai_jobs.list()}
+
+    def cancel_ai_job(self, job_id):
+        job = self.ai_jobs.cancel(job_id)
+        if not job:
+            return {'ok': False, 'error': 'AI 任务不存在'}
+        return {'ok': True, 'data': job.to_dict()}
+
+    def set_ai_parallelism(self, max_parallel):
         try:
-            result = subprocess.run(
-                ['opencode', 'run', prompt],
-                cwd=str(BASE_DIR),
-                capture_output=True,
-                text=True,
-                timeout=180,
-            )
-            output = (result.stdout or '') + (result.stderr or '')
-            return {'ok': result.returncode == 0, 'error': '' if result.returncode == 0 else f'opencode 退出码: {result.returncode}', 'data': {'review': output, 'exit_code': result.returncode}}
-        except FileNotFoundError:
-            return {'ok': False, 'error': '未找到 opencode 命令，请先安装或配置 PATH'}
-        except subprocess.TimeoutExpired as e:
-            output = ((e.stdout or '') if isinstance(e.stdout, str) else '') + ((e.stderr or '') if isinstance(e.stderr, str) else '')
-            return {'ok': False, 'error': 'opencode 分析超时', 'data': {'review': output}}
+            self.ai_jobs.set_max_parallel(max_parallel)
+        except (TypeError, ValueError):
+            return {'ok': False, 'error': '并发数必须是正整数'}
+        return {'ok': True, 'data': {'max_parallel': self.ai_jobs.max_parallel}}
+
+    def analyze_run_with_opencode(self, run_id):
+        return self._wait_ai_job('run', {'run_id': run_id})
 
     def analyze_terminal_with_opencode(self, script_rel_path, config, terminal_log):
         """基于当前终端内容做轻量 AI 诊断。"""
+        return self._wait_ai_job('terminal', {'script_path': script_rel_path, 'config': config,
+                                              'terminal_log': terminal_log})
+
+    def ai_assist(self, payload):
+        return self._wait_ai_job('assist', payload)
+
+    def _wait_ai_job(self, kind, params):
+        """同步接口（兼容 pywebview 界面）：提交后台任务并等待结束。"""
+        job = self._submit_ai_job(kind, params)
+        if isinstance(job, dict):
+            return job
+        job.done.wait()
+        return job.result()
+
+    def _submit_ai_job(self, kind, params):
+        builders = {'run': self._run_review_prompt, 'terminal': self._terminal_review_prompt,
+                    'assist': self._ai_assist_prompt}
+        if kind not in builders:
+            return {'ok': False, 'error': f'未知的 AI 任务类型: {kind}'}
+        prompt = builders[kind](params or {})
+        if isinstance(prompt, dict):
+            return prompt
+        return self.ai_jobs.submit(AiJob(uuid.uuid4().hex[:12], kind, prompt))
+
+    def _run_review_prompt(self, params):
+        run_id = params.get('run_id')
+        run = self.runs.get(run_id)
+        if not run:
+            return {'ok': False, 'error': '运行记录不存在'}
+        # 游标置于末尾只取状态与日志大小，不读取日志正文
+        status = self.get_run_status(run_id, sys.maxsize)
+        if not status.get('ok'):
+            return status
+        # 只取日志末尾用于诊断，避免读取整个大文件
+        size = status['data']['log_size']
+        log = read_byte_range(run.log_path, size - 96 * 1024, size)[0] if size else ''
+        return self._build_opencode_review_prompt(run, log + status['data']['external_log'][-24000:])
+
+    def _terminal_review_prompt(self, params):
+        script_rel_path = params.get('script_path')
+        config = params.get('config')
+        terminal_log = params.get('terminal_log')
         max_chars = 24000
         log = (terminal_log or '')[-max_chars:]
-        prompt = f"""
+        return f"""
 你是 CedarEx 本地脚本运行诊断助手。请只分析当前终端内容，不要修改文件，不要执行命令。
 
 请用中文输出：
@@ -400,23 +3338,8 @@ class Api:
 {log}
 ```
 """.strip()
-        try:
-            result = subprocess.run(
-                ['opencode', 'run', prompt],
-                cwd=str(BASE_DIR),
-                capture_output=True,
-                text=True,
-                timeout=180,
-            )
-            output = (result.stdout or '') + (result.stderr or '')
-            return {'ok': result.returncode == 0, 'error': '' if result.returncode == 0 else f'opencode 退出码: {result.returncode}', 'data': {'review': output, 'exit_code': result.returncode}}
-        except FileNotFoundError:
-            return {'ok': False, 'error': '未找到 opencode 命令，请先安装或配置 PATH'}
-        except subprocess.TimeoutExpired as e:
-            output = ((e.stdout or '') if isinstance(e.stdout, str) else '') + ((e.stderr or '') if isinstance(e.stderr, str) else '')
-            return {'ok': False, 'error': 'opencode 分析超时', 'data': {'review': output}}
 
-    def ai_assist(self, payload):
+    def _ai_assist_prompt(self, payload):
         payload = payload or {}
         action = payload.get('action') or 'diagnose_log'
         action_map = {
@@ -428,7 +3351,7 @@ class Api:
         task = action_map.get(action, action_map['diagnose_log'])
         terminal_log = (payload.get('terminal_log') or '')[-16000:]
         doc = (payload.get('doc') or '')[:8000]
-        prompt = f"""
+        return f"""
 你是 CedarEx 脚本工作台内置 AI 助手。请只基于给定上下文回答，不要修改文件，不要执行命令。
 
 任务：
@@ -462,21 +3385,6 @@ README/说明摘要：
 {terminal_log}
 ```
 """.strip()
-        try:
-            result = subprocess.run(
-                ['opencode', 'run', prompt],
-                cwd=str(BASE_DIR),
-                capture_output=True,
-                text=True,
-                timeout=180,
-            )
-            output = (result.stdout or '') + (result.stderr or '')
-            return {'ok': result.returncode == 0, 'error': '' if result.returncode == 0 else f'opencode 退出码: {result.returncode}', 'data': {'review': output, 'exit_code': result.returncode}}
-        except FileNotFoundError:
-            return {'ok': False, 'error': '未找到 opencode 命令，请先安装或配置 PATH'}
-        except subprocess.TimeoutExpired as e:
-            output = ((e.stdout or '') if isinstance(e.stdout, str) else '') + ((e.stderr or '') if isinstance(e.stderr, str) else '')
-            return {'ok': False, 'error': 'opencode 分析超时', 'data': {'review': output}}
 
     def _build_opencode_review_prompt(self, run, log):
         max_chars = 24000
@@ -510,6 +3418,10 @@ README/说明摘要：
 """.strip()
 
     def stop_current(self):
+        run = self.runs.get(self.current_run)
+        if run and not run.finished:
+            self.run_manager.cancel(run.run_id)
+            return {'ok': True, 'data': '已终止当前脚本'}
         if self.terminal:
             self.terminal.write('\x03')
             return {'ok': True, 'data': '已向终端发送 Ctrl+C'}
@@ -571,7 +3483,19 @@ README/说明摘要：
             return {'ok': True, 'data': ''}
         return {'ok': True, 'data': self.terminal.read()}
 
+    def terminal_read_from(self, cursor=0, max_bytes=None):
+        """按游标读取终端输出（AI 诊断、日志归档等独立读者使用）。"""
+        if not self.terminal:
+            return {'ok': True, 'data': {'text': '', 'cursor': 0}}
+        text, cursor = self.terminal.read_from(cursor, max_bytes)
+        return {'ok': True, 'data': {'text': text, 'cursor': cursor}}
+
     def terminal_write(self, data):
+        """终端输入：有脚本正在共享终端中显示时转给脚本的 PTY（含 Ctrl+C），否则交给 shell。"""
+        run = self.terminal_run
+        if run is not None and not run.finished:
+            run.session.write(data or '')
+            return {'ok': True}
         if not self.terminal:
             self.terminal_start()
         self.terminal.write(data or '')
@@ -604,59 +3528,48 @@ README/说明摘要：
         result = self.window.create_file_dialog(webview.OPEN_DIALOG)
         return {'ok': True, 'data': result[0] if result else ''}
 
-    def _pipe_output(self, run):
-        try:
-            with run.log_path.open('a', encoding='utf-8') as log_file:
-                for line in run.process.stdout:
-                    log_file.write(line)
-                    log_file.flush()
-                exit_code = run.process.wait()
-                run.finished = True
-                run.exit_code = exit_code
-                log_file.write(f'\n脚本结束，退出码: {exit_code}\n')
-        finally:
-            try:
-                os.unlink(run.config_path)
-            except OSError:
-                pass
+    def _record_history(self, run):
+        """运行结束后把运行日志及本次运行写入的外部日志记入历史索引。"""
+        if not run.finished:
+            return
+        self.history.record_run(run, [str(run.log_path)] + self._run_log_files(run))
+
+    def _run_log_files(self, run):
+        """运行开始后有写入、且属于本次运行的外部日志。
+
+        归属依据：位于运行专属目录 CEDAR_RUN_LOG_DIR 下，或曾被运行的进程树打开（RunSampler 采集）。
+        同时进行的其他运行写入的日志不会混入。
+        """
+        run_dir = str(run.log_dir) + os.sep if run.log_dir else None
+        opened = run.sampler.logs() if run.sampler else set()
+        return [
+            path for path in self.log_watcher.changed_since(run.watch_since)
+            if (run_dir and path.startswith(run_dir)) or path in opened
+        ]
 
     def _init_log_offsets(self, run):
         """记录已有日志文件大小，后续只读取脚本运行期间新增内容。"""
-        if not LOG_DIR.exists():
-            return
-        for path in LOG_DIR.rglob('*.log'):
-            try:
-                run.file_offsets[str(path)] = path.stat().st_size
-            except OSError:
-                run.file_offsets[str(path)] = 0
+        run.watch_since = time.monotonic()
+        run.file_offsets = self.log_watcher.snapshot()
 
     def _collect_external_logs(self, run):
         """读取脚本自行写入 log/ 目录的新增内容。
 
         现有脚本通常通过 cedar.utils.print 写入 LOG_PATH 指向的文件，
         不一定输出到 stdout；因此仅监听 subprocess stdout 会导致运行中无日志。
+        只检查 LogWatcher 报告的、运行开始后有写入且属于本次运行的文件（见 _run_log_files）。
         """
-        if not LOG_DIR.exists():
-            return
-        for path in sorted(LOG_DIR.rglob('*.log'), key=lambda p: str(p)):
-            if path.resolve() == run.log_path.resolve():
-                continue
-            key = str(path)
+        for key in self._run_log_files(run):
             try:
                 last_offset = run.file_offsets.get(key, 0)
-                size = path.stat().st_size
-                if size < last_offset:
+                if os.path.getsize(key) < last_offset:
                     last_offset = 0
-                if size == last_offset:
-                    continue
-                with path.open('r', encoding='utf-8') as f:
-                    f.seek(last_offset)
-                    content = f.read()
-                run.file_offsets[key] = size
+                content, offset, _ = read_text_range(key, last_offset)
+                run.file_offsets[key] = offset
                 if content:
-                    rel_path = path.relative_to(LOG_DIR)
+                    rel_path = Path(key).relative_to(LOG_DIR)
                     run.external_log.append(f'\n--- {rel_path} ---\n{content}')
-            except (OSError, UnicodeDecodeError):
+            except (OSError, ValueError):
                 continue
 
     def _safe_script_dir(self, script_rel_path):
@@ -674,17 +3587,71 @@ README/说明摘要：
 
         return shlex.quote(str(value))
 
-    def _compiled_runner_code(self, script_dir, config_path):
+    def _prepare_command(self, script_dir, config_path, profile_path=None):
+        """返回运行脚本的命令行；编译脚本用 python -c 内联启动器，不写临时文件。
+
+        给出 profile_path 时外包一层 cProfile 启动器，脚本结束（含异常、被终止）后写出统计。
+        """
+        script_path = get_script_file_path(script_dir)
+        compiled = str(script_path).endswith(('.so', '.pyd'))
+        if profile_path:
+            target = self._compiled_runner_code(script_dir) if compiled else None
+            return [sys.executable, '-c', self._profile_runner_code(script_path, target, profile_path), config_path]
+        if compiled:
+            return [sys.executable, '-c', self._compiled_runner_code(script_dir), config_path]
+        return [sys.executable, str(script_path), config_path]
+
+    def _profile_runner_code(self, script_path, runner_code, profile_path):
+        """cProfile 启动器：runner_code 为 None 时按 `python main.py` 语义运行脚本，否则执行编译脚本启动器。"""
+        return f"""
+import cProfile, os, runpy, signal, sys
+def _stop(signum, frame):
+    sys.exit(128 + signum)
+signal.signal(signal.SIGTERM, _stop)
+if hasattr(signal, 'SIGHUP'):
+    signal.signal(signal.SIGHUP, _stop)
+_runner = {runner_code!r}
+_profiler = cProfile.Profile()
+_profiler.enable()
+try:
+    if _runner is None:
+        sys.argv = [{str(script_path)!r}] + sys.argv[1:]
+        sys.path[0] = {str(script_path.parent)!r}
+        runpy.run_path({str(script_path)!r}, run_name='__main__')
+    else:
+        exec(compile(_runner, '<string>', 'exec'), {{'__name__': '__main__', '__builtins__': __builtins__}})
+finally:
+    _profiler.disable()
+    os.makedirs({str(profile_path.parent)!r}, exist_ok=True)
+    _profiler.dump_stats({str(profile_path)!r})
+"""
+
+    def _compiled_runner_code(self, script_dir):
         return f"""
 import os, sys
+config_path = sys.argv[1]
 os.chdir({str(script_dir)!r})
 sys.path.insert(0, {str(script_dir)!r})
-os.environ['SCRIPT_CONFIG_FILE'] = {str(config_path)!r}
+os.environ['SCRIPT_CONFIG_FILE'] = config_path
 import main
 if hasattr(main, 'main'):
+    # 配置可能是只能读一次的管道，不能在 main 出错后重跑：先按签名判断是否接受参数
+    import inspect
     try:
-        main.main({str(config_path)!r})
-    except TypeError:
+        params = inspect.signature(main.main).parameters.values()
+        accepts = any(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD, p.VAR_POSITIONAL) for p in params)
+    except (TypeError, ValueError):
+        accepts = None  # 取不到签名（部分编译扩展）
+    if accepts is None:
+        try:
+            main.main(config_path)
+        except TypeError as e:
+            if e.__traceback__.tb_next is not None:
+                raise  # 异常来自 main 内部，不是参数个数不符
+            main.main()
+    elif accepts:
+        main.main(config_path)
+    else:
         main.main()
 else:
     print('脚本模块已加载，但未找到 main 函数')
@@ -19,9 +19,10 @@ def init(config_file_path):
         print(f'从命令行参数获取配置文件路径: {config_file_path}')
     cedar_base_dir = os.environ.get('CEDAR_BASE_DIR', './')
     script_name = osp.basename(osp.dirname(__file__))
-    log_dir = osp.join(cedar_base_dir, 'log', script_name)
+    # CedarEx 为每次运行指定独立的日志目录，并行运行的日志互不混淆
+    log_dir = os.environ.get('CEDAR_RUN_LOG_DIR') or osp.join(cedar_base_dir, 'log', script_name)
     os.makedirs(log_dir, exist_ok=True)
-    log_path = osp.join(cedar_base_dir, 'log', script_name, create_name() + '.log')  # 获取日志文件路径
+    log_path = osp.join(log_dir, create_name() + '.log')  # 获取日志文件路径
     os.environ['LOG_PATH'] = log_path  # 设置日志文件为环境变量
     print(f'日志文件保存路径: {log_path}')
     # 加载配置
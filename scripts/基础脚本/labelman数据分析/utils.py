@@ -10,6 +10,11 @@ from collections import defaultdict
 from cedar.image import imread, array_to_base64, path_to_url
 from cedar.utils import split_filename, print
 
+try:
+    from cedarex import Progress  # CedarEx 运行时提供的结构化进度通道
+except ImportError:
+    Progress = None
+
 
 class ImageProcessing:
     def __init__(self, img_cv2: np.ndarray, points: np.ndarray):
@@ -150,13 +155,17 @@ class DataProcessor:
 
         """
         print(f'开始处理目录: {self.input_dir}')
-        for root, dirs, files in os.walk(self.input_dir):
-            total_files = len(files)
-            for idx, file in enumerate(files, 1):
-                self.process_file(root, file)
-                print(f'已处理进度: {idx}/{total_files}')
-                if idx % 10 == 0 or idx == total_files:
-                    print(f'已处理进度: {idx}/{total_files}')
+        entries = [(root, file) for root, dirs, files in os.walk(self.input_dir) for file in files]
+        progress = Progress(total=len(entries)) if Progress else None
+        for idx, (root, file) in enumerate(entries, 1):
+            self.process_file(root, file)
+            if progress:
+                progress.update(idx)
+            elif idx % 100 == 0:
+                print(f'已处理进度: {idx}/{len(entries)}')
+        if progress:
+            progress.close()
+        print(f'已处理 {len(entries)} 个文件')
 
     def process_file(self, root: str, file: str):
         file_path = osp.join(root, file)
@@ -2,13 +2,24 @@ import os
 import os.path as osp
 import sys
 import json
+import functools
+import hashlib
+import struct
 import time
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 from cedar.image import imread, imwrite
 from cedar.draw import putText, color_list
 from cedar.utils import print, create_name, try_except, rmtree_makedirs
 
+try:
+    from cedarex import Progress  # CedarEx 运行时提供的结构化进度通道
+except ImportError:
+    Progress = None
+
 
 def init(config_file_path):
     """初始化配置和日志"""
@@ -24,9 +35,10 @@ def init(config_file_path):
 
     cedar_base_dir = os.environ.get('CEDAR_BASE_DIR', './')
     script_name = osp.basename(osp.dirname(__file__))
-    log_dir = osp.join(cedar_base_dir, 'log', script_name)
+    # CedarEx 为每次运行指定独立的日志目录，并行运行的日志互不混淆
+    log_dir = os.environ.get('CEDAR_RUN_LOG_DIR') or osp.join(cedar_base_dir, 'log', script_name)
     os.makedirs(log_dir, exist_ok=True)
-    log_path = osp.join(cedar_base_dir, 'log', script_name, create_name() + '.log')
+    log_path = osp.join(log_dir, create_name() + '.log')
     os.environ['LOG_PATH'] = log_path
     print(f'日志文件保存路径: {log_path}')
 
@@ -38,9 +50,175 @@ def init(config_file_path):
     return config
 
 
+def fit_tile(img: np.ndarray, cell: np.ndarray) -> None:
+    """把单图写入格子：尺寸一致时直接拷贝，不一致时等比缩放后居中（信箱式留黑边）
+
+    Args:
+        img: 单图
+        cell: 画布上的格子区域（视图，原地写入）
+    """
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    cell_h, cell_w = cell.shape[:2]
+    h, w = img.shape[:2]
+    if (h, w) == (cell_h, cell_w):
+        cell[:] = img
+        return
+    ratio = min(cell_h / h, cell_w / w)
+    new_h, new_w = min(cell_h, max(1, round(h * ratio))), min(cell_w, max(1, round(w * ratio)))
+    y, x = (cell_h - new_h) // 2, (cell_w - new_w) // 2
+    cell[:] = 0
+    cell[y : y + new_h, x : x + new_w] = cv2.resize(
+        img, (new_w, new_h), interpolation=cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+    )
+
+
+class PngStripWriter:
+    """按行条追加写入 PNG（8 位 RGB，Sub 滤波 + zlib 流式压缩），无需整图驻留内存"""
+
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+    def __init__(self, path: str, width: int, height: int, level: int = 1):
+        self.width = width
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(level)
+        self.file.write(self.SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def write(self, rows: np.ndarray) -> None:
+        """追加若干行 BGR 像素"""
+        rgb = rows[:, :, ::-1].reshape(rows.shape[0], -1)
+        data = np.empty((rows.shape[0], rgb.shape[1] + 1), dtype=np.uint8)
+        data[:, 0] = 1  # Sub 滤波：每个字节减去左侧同通道字节
+        data[:, 1:4] = rgb[:, :3]
+        np.subtract(rgb[:, 3:], rgb[:, :-3], out=data[:, 4:])
+        chunk = self.compressor.compress(data.tobytes())
+        if chunk:
+            self._chunk(b'IDAT', chunk)
+
+    def close(self) -> None:
+        try:
+            self._chunk(b'IDAT', self.compressor.flush())
+            self._chunk(b'IEND', b'')
+        finally:
+            self.file.close()
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        self.file.write(struct.pack('>I', len(data)) + kind + data)
+        self.file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+class MosaicWriter:
+    """按固定格子尺寸预分配的拼接图，单图产出后即可写入对应位置
+
+    put/skip 可在多个线程中并发调用（不同位置互不重叠）。stream 为真时不分配整张画布，
+    只为尚未写完的行分配行条，某行全部到齐后按顺序压缩追加到 PNG，内存占用与在途行数成正比。
+
+    Args:
+        count: 单图数量
+        num_per_row: 每行的图像数量
+        tile_size: 格子尺寸 (高, 宽)，尺寸不同的单图等比缩放后居中
+        path: 保存路径，close() 时写盘；为 None 时只在内存中拼接
+        stream: 是否按行条流式写盘
+    """
+
+    def __init__(self, count: int, num_per_row: int, tile_size: tuple, path: str = None, stream: bool = False):
+        self.count = count
+        self.num_per_row = num_per_row
+        self.cell_h, self.cell_w = tile_size[:2]
+        self.num_rows = (count + num_per_row - 1) // num_per_row
+        self.width = self.cell_w * num_per_row
+        self.height = self.cell_h * self.num_rows
+        self.path = path
+        self.stream = stream and path is not None
+        self.placed = 0
+        self.filled = [0] * self.num_rows
+        self.lock = threading.Lock()
+        if self.stream:
+            self.canvas = None
+            self.strips = {}
+            self.next_row = 0
+            self.io_lock = threading.Lock()
+            self.part_path = path + '.part'
+            self.png = PngStripWriter(self.part_path, self.width, self.height)
+        else:
+            self.canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+
+    def put(self, pos: int, img: np.ndarray) -> None:
+        """把第 pos 张单图写入画布"""
+        row, col = divmod(pos, self.num_per_row)
+        with self.lock:
+            if self.stream:
+                strip = self.strips.get(row)
+                if strip is None:
+                    strip = self.strips[row] = np.zeros((self.cell_h, self.width, 3), dtype=np.uint8)
+            else:
+                strip = self.canvas[row * self.cell_h : (row + 1) * self.cell_h]
+        try:
+            fit_tile(img, strip[:, col * self.cell_w : (col + 1) * self.cell_w])
+        except Exception:
+            self._mark(row, placed=False)  # 该格仍需计数，否则流式写盘时此行永远不会到齐
+            raise
+        self._mark(row, placed=True)
+
+    def skip(self, pos: int) -> None:
+        """第 pos 张单图处理失败，对应格子留空"""
+        self._mark(pos // self.num_per_row, placed=False)
+
+    def _mark(self, row: int, placed: bool) -> None:
+        with self.lock:
+            self.filled[row] += 1
+            self.placed += placed
+        if self.stream:
+            self._flush_rows()
+
+    def _row_size(self, row: int) -> int:
+        return min(self.num_per_row, self.count - row * self.num_per_row)
+
+    def _flush_rows(self, force: bool = False) -> None:
+        """按顺序写出已到齐的行；force 时写出全部剩余行"""
+        with self.io_lock:
+            while True:
+                with self.lock:
+                    row = self.next_row
+                    if row >= self.num_rows or (not force and self.filled[row] < self._row_size(row)):
+                        return
+                    self.next_row += 1
+                    strip = self.strips.pop(row, None)
+                if strip is None:
+                    strip = np.zeros((self.cell_h, self.width, 3), dtype=np.uint8)
+                self.png.write(strip)
+
+    def close(self) -> bool:
+        """写盘（没有任何单图成功时不生成文件）；流式写盘出错时关闭文件并删除 .part 后再抛出
+
+        Returns:
+            是否生成了拼接图
+        """
+        if not self.stream:
+            if self.placed and self.path is not None:
+                imwrite(self.path, self.canvas)
+            return bool(self.placed)
+        try:
+            self._flush_rows(force=True)
+            self.png.close()
+            if self.placed:
+                os.replace(self.part_path, self.path)
+                return True
+        finally:
+            self.png.file.close()
+            if osp.exists(self.part_path):
+                os.remove(self.part_path)
+        return False
+
+
 def stack_images_with_fixed_num_per_row(imgs: list, num_per_row: int) -> np.ndarray:
     """将 NumPy 矩阵形式的图像列表拼接成一个大图像
 
+    格子尺寸取第一张图，尺寸不同的图像等比缩放后居中。
+
     Args:
         imgs: 图像列表（每个图像为一个 NumPy 矩阵）
         num_per_row: 每行的图像数量
@@ -48,29 +226,10 @@ def stack_images_with_fixed_num_per_row(imgs: list, num_per_row: int) -> np.ndar
     Returns:
         拼接后的图像
     """
-    # 检查所有图像的大小是否一致
-    img_height, img_width = imgs[0].shape[:2]
-    for img in imgs:
-        if img.shape[:2] != (img_height, img_width):
-            raise ValueError('所有图像的大小必须一致！')
-
-    # 计算总行数
-    num_rows = (len(imgs) + num_per_row - 1) // num_per_row
-
-    # 创建一个空白画布
-    canvas_width = img_width * num_per_row
-    canvas_height = img_height * num_rows
-    canvas = np.zeros((canvas_height, canvas_width, 3), dtype=np.uint8)
-
-    # 将图像逐行拼接到画布上
+    mosaic = MosaicWriter(len(imgs), num_per_row, imgs[0].shape)
     for i, img in enumerate(imgs):
-        row = i // num_per_row
-        col = i % num_per_row
-        x_offset = col * img_width
-        y_offset = row * img_height
-        canvas[y_offset : y_offset + img_height, x_offset : x_offset + img_width] = img
-
-    return canvas
+        mosaic.put(i, img)
+    return mosaic.canvas
 
 
 def parse_b698_filepath_mp(filepath: str) -> dict:
@@ -96,6 +255,411 @@ def parse_b698_filepath_mp(filepath: str) -> dict:
     return fileinfo
 
 
+IMAGE_SUFFIXES = ('.jpg', '.png', '.bmp')
+INDEX_CACHE_VERSION = 1
+
+
+class DirectoryListingCache:
+    """按目录 mtime 缓存每个目录的列举结果（子目录名、按索引分组的图像文件名），持久化为 JSON
+
+    目录内文件增删、改名都会改变该目录的 mtime，只有这些目录需要重新 scandir；
+    其余目录只需一次 stat。文件名在列举时即按后缀过滤并解析出索引。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.dirs = {}  # 目录 → {'mtime_ns', 'subdirs', 'files': {索引: [文件名]}, 'bad': [文件名]}
+        self.seen = set()
+        self.scanned = 0
+        if path and osp.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == INDEX_CACHE_VERSION:
+                    self.dirs = data.get('dirs', {})
+            except (OSError, ValueError) as e:
+                print(f'索引缓存读取失败，将重新扫描: {e}')
+
+    def listing(self, directory: str) -> dict:
+        """返回目录的列举结果；目录不存在或不可读时返回空结果"""
+        self.seen.add(directory)
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return {'mtime_ns': 0, 'subdirs': [], 'files': {}, 'bad': []}
+        cached = self.dirs.get(directory)
+        if cached is not None and cached['mtime_ns'] == mtime_ns:
+            return cached
+        subdirs, files, bad = [], {}, []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                            continue
+                    except OSError:
+                        continue
+                    if osp.splitext(entry.name)[1].lower() not in IMAGE_SUFFIXES:
+                        continue
+                    try:
+                        files.setdefault(parse_b698_filepath_mp(entry.name)['index'], []).append(entry.name)
+                    except Exception:
+                        bad.append(entry.name)
+        except OSError as e:
+            print(f'无法读取目录: {directory}, 错误: {e}')
+        listing = {'mtime_ns': mtime_ns, 'subdirs': sorted(subdirs), 'files': files, 'bad': sorted(bad)}
+        self.dirs[directory] = listing
+        self.scanned += 1
+        return listing
+
+    def collect(self, directory: str, images: dict, bad: list) -> None:
+        """递归收集目录下的图像，追加到 images（索引 → [路径]）与 bad（无法解析的路径）"""
+        listing = self.listing(directory)
+        for idx, names in listing['files'].items():
+            images.setdefault(idx, []).extend(osp.join(directory, name) for name in names)
+        bad.extend(osp.join(directory, name) for name in listing['bad'])
+        for name in listing['subdirs']:
+            self.collect(osp.join(directory, name), images, bad)
+
+    def save(self) -> None:
+        """丢弃本次未访问的目录，有重新扫描或丢弃时写回缓存文件"""
+        stale = [d for d in self.dirs if d not in self.seen]
+        for d in stale:
+            del self.dirs[d]
+        if not self.path or not (self.scanned or stale):
+            return
+        try:
+            os.makedirs(osp.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_CACHE_VERSION, 'dirs': self.dirs}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f'索引缓存写入失败: {e}')
+
+
+def index_sort_key(idx: str):
+    """数字索引按数值排序，其余按字符串排在后面"""
+    return (0, int(idx), '') if idx.isdigit() else (1, 0, idx)
+
+
+def build_image_index(input_dir: str, cache_path: str = None) -> dict:
+    """一次遍历输入目录，建立 相机 × 索引 的图像矩阵
+
+    相机为 input_dir 下两级子目录（工位/相机），每个相机目录递归收集图像。
+
+    Args:
+        input_dir: 输入目录
+        cache_path: 目录列举缓存文件路径，为 None 时不使用缓存
+
+    Returns:
+        {'cameras': 相机列表, 'indices': 索引列表, 'images': {相机: {索引: 路径}},
+         'missing': {相机: [缺少的索引]}, 'duplicates': {相机: {索引: [路径]}}, 'bad': [无法解析的路径],
+         'scanned': 重新列举的目录数}
+    """
+    cache = DirectoryListingCache(cache_path)
+    cameras, images, duplicates, bad = [], {}, {}, []
+    for station in cache.listing(input_dir)['subdirs']:
+        station_dir = osp.join(input_dir, station)
+        for name in cache.listing(station_dir)['subdirs']:
+            camera = station + '/' + name
+            found = {}
+            cache.collect(osp.join(station_dir, name), found, bad)
+            cameras.append(camera)
+            images[camera] = {}
+            for idx, paths in found.items():
+                paths.sort()
+                images[camera][idx] = paths[0]
+                if len(paths) > 1:
+                    duplicates.setdefault(camera, {})[idx] = paths
+    cache.save()
+
+    indices = sorted({idx for found in images.values() for idx in found}, key=index_sort_key)
+    missing = {}
+    for camera in cameras:
+        lacking = [idx for idx in indices if idx not in images[camera]]
+        if lacking:
+            missing[camera] = lacking
+    return {
+        'cameras': cameras,
+        'indices': indices,
+        'images': images,
+        'missing': missing,
+        'duplicates': duplicates,
+        'bad': bad,
+        'scanned': cache.scanned,
+    }
+
+
+def report_image_index(index: dict, limit: int = 20) -> None:
+    """打印相机 × 索引矩阵的概况以及缺失、重复、无法解析的单元"""
+
+    def brief(items):
+        items = list(items)
+        return ', '.join(items[:limit]) + (f' 等共 {len(items)} 个' if len(items) > limit else '')
+
+    print(f'相机列表: {index["cameras"]}')
+    print(f'索引数: {len(index["indices"])}，重新列举目录数: {index["scanned"]}')
+    for camera, lacking in index['missing'].items():
+        print(f'相机 {camera} 缺少 {len(lacking)} 个索引: {brief(lacking)}')
+    for camera, cells in index['duplicates'].items():
+        for idx, paths in cells.items():
+            print(f'相机 {camera} 索引 {idx} 有 {len(paths)} 张图像，使用 {paths[0]}，忽略: {brief(paths[1:])}')
+    if index['bad']:
+        print(f'名字解析问题 {len(index["bad"])} 个文件: {brief(index["bad"])}')
+
+
+def read_bmp_reduced(file_path: str, factor: int):
+    """按行条读取未压缩 BMP（8/24/32 位）并按 factor 倍面积平均缩小
+
+    文件以内存映射方式访问，每次只展开一个行条，峰值内存约为输出图加一个行条。
+
+    Args:
+        file_path: BMP 文件路径
+        factor: 缩小倍数
+
+    Returns:
+        BGR 图像；压缩、其他位深、非 BITMAPINFOHEADER 或被截断的 BMP 返回 None，由调用方改用通用解码
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(54)
+    if len(header) < 54 or header[:2] != b'BM':
+        return None
+    offset, dib_size = struct.unpack_from('<II', header, 10)
+    if dib_size < 40:  # OS/2 BITMAPCOREHEADER 等字段布局不同，交给通用解码
+        return None
+    width, height, _, bits, compression = struct.unpack_from('<iiHHI', header, 18)
+    if compression != 0 or bits not in (8, 24, 32) or width <= 0 or height == 0:
+        return None
+    channels = bits // 8
+    rows = abs(height)
+    stride = (width * channels + 3) & ~3
+    if os.path.getsize(file_path) < offset + rows * stride:  # 文件被截断
+        return None
+    palette = None
+    if bits == 8:
+        colors = struct.unpack_from('<I', header, 46)[0] or 256
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        entries = np.fromfile(file_path, dtype=np.uint8, count=colors * 4, offset=14 + dib_size)
+        palette[:colors] = entries.reshape(-1, 4)[:, :3]  # 调色板为 BGRA
+
+    out_w, out_h = width // factor, rows // factor
+    data = np.memmap(file_path, dtype=np.uint8, mode='r', offset=offset, shape=(rows, stride))
+    out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+    strip = factor * max(1, 512 // factor)
+    for y0 in range(0, out_h * factor, strip):
+        y1 = min(y0 + strip, out_h * factor)
+        # 高度为正时行从下往上存储
+        block = data[rows - y1 : rows - y0][::-1] if height > 0 else data[y0:y1]
+        pixels = block[:, : width * channels].reshape(y1 - y0, width, channels)[:, : out_w * factor]
+        if palette is not None:
+            pixels = palette[pixels[:, :, 0]]
+        elif channels == 4:
+            pixels = pixels[:, :, :3]
+        out[y0 // factor : y1 // factor] = cv2.resize(
+            np.ascontiguousarray(pixels), (out_w, (y1 - y0) // factor), interpolation=cv2.INTER_AREA
+        )
+    del data
+    return out
+
+
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def imread_reduced(file_path: str, level: int):
+    """直接按 2**level 倍缩小解码
+
+    JPEG 由 libjpeg 在 DCT 阶段缩小（最多 8 倍），解码耗时与内存都按倍数下降；
+    未压缩 BMP 按行条读取缩小；PNG 等格式由 OpenCV 解码后缩小，省去全分辨率标注与逐级 pyrDown。
+
+    Args:
+        file_path: 图像路径
+        level: 下采样级别
+
+    Returns:
+        (图像, 剩余需 pyrDown 的级数)
+    """
+    used = min(level, 3)
+    factor = 1 << used
+    img = read_bmp_reduced(file_path, factor) if file_path.lower().endswith('.bmp') and factor > 1 else None
+    if img is None:
+        img = cv2.imdecode(np.fromfile(file_path, dtype=np.uint8), REDUCED_FLAGS[factor])
+        if img is None:
+            raise ValueError(f'无法解码图像: {file_path}')
+    return img, level - used
+
+
+def process_tile(file_path: str, category: str, idx: str, config: dict) -> np.ndarray:
+    """解码单张图像，标注相机与索引后下采样
+
+    reduced_decode 开启时先按目标尺寸解码，再以同比例缩小的字号与位置标注，
+    单图峰值内存与解码时间随下采样倍数下降。
+
+    Args:
+        file_path: 图像路径
+        category: 相机目录名
+        idx: 图像索引
+        config: 配置字典
+
+    Returns:
+        处理后的图像
+    """
+    downsample_level = config.get('downsample_level', 2)
+    scale = 1
+    if config.get('reduced_decode', False) and downsample_level > 0:
+        img, remaining = imread_reduced(file_path, downsample_level)
+        for _ in range(remaining):
+            img = cv2.pyrDown(img)
+        scale, downsample_level = 1 << downsample_level, 0
+    else:
+        img = imread(file_path)
+    img = putText(
+        img,
+        'xj:' + category,
+        (10 // scale, 10 // scale),
+        text_color=tuple(color_list[2]),
+        text_size=max(1, round(config.get('text_size', 80) / scale)),
+    )
+    img = putText(
+        img,
+        'idx:' + str(idx),
+        (10 // scale, 200 // scale),
+        text_color=tuple(color_list[2]),
+        text_size=max(1, round(config.get('index_text_size', 120) / scale)),
+    )
+    for _ in range(downsample_level):
+        img = cv2.pyrDown(img)
+    return img
+
+
+RENDER_SETTINGS = ('num_per_row', 'text_size', 'index_text_size', 'downsample_level', 'reduced_decode')
+MANIFEST_VERSION = 1
+
+
+def render_fingerprint(jobs: list, cameras: list, tile_size: tuple, config: dict):
+    """计算一张拼接图的输入指纹：各单图的路径、大小、mtime，相机布局、格子尺寸与影响画面的配置
+
+    Returns:
+        指纹字符串；有输入文件无法 stat 时返回 None（视为需要重新生成）
+    """
+    inputs = []
+    for pos, _, path in jobs:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        inputs.append([pos, path, st.st_size, st.st_mtime_ns])
+    payload = {
+        'version': MANIFEST_VERSION,
+        'settings': {key: config.get(key) for key in RENDER_SETTINGS},
+        'cameras': cameras,
+        'tile_size': list(tile_size),
+        'inputs': inputs,
+    }
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class RenderManifest:
+    """增量模式下记录每张输出拼接图对应的输入指纹
+
+    清单为保存目录下的 JSONL 文件，每写完一张拼接图追加一行并立即落盘，
+    进程中途崩溃时已完成的索引仍有记录，重跑即从未完成处继续。运行结束时压缩为每个索引一行。
+    """
+
+    FILE_NAME = '.compare_manifest.jsonl'
+
+    def __init__(self, save_dir: str):
+        self.save_dir = save_dir
+        self.path = osp.join(save_dir, self.FILE_NAME)
+        self.entries = {}  # 索引 → {'idx', 'key', 'size'}
+        self.lock = threading.Lock()
+        self.file = None
+        if osp.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['idx']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # 崩溃时写了一半的行
+
+    def output_path(self, idx: str) -> str:
+        return osp.join(self.save_dir, f'{idx}.png')
+
+    def is_current(self, idx: str, key: str) -> bool:
+        """输出文件存在、大小与记录一致且指纹未变"""
+        entry = self.entries.get(idx)
+        if key is None or entry is None or entry.get('key') != key:
+            return False
+        try:
+            return os.path.getsize(self.output_path(idx)) == entry.get('size')
+        except OSError:
+            return False
+
+    def record(self, idx: str, key: str) -> None:
+        entry = {'idx': idx, 'key': key, 'size': os.path.getsize(self.output_path(idx))}
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.file.flush()
+            self.entries[idx] = entry
+
+    def compact(self, keep) -> None:
+        """只保留 keep 中的索引，重写为每个索引一行"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for idx in keep:
+                    if idx in self.entries:
+                        f.write(json.dumps(self.entries[idx], ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+
+
+class ThroughputMeter:
+    """统计已完成的拼接图与单图数量，定期打印吞吐量"""
+
+    def __init__(self, total: int, interval: float = 5.0):
+        self.total = total
+        self.interval = interval
+        self.mosaics = 0
+        self.tiles = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+        self.lock = threading.Lock()
+        self.progress = Progress(total=total) if Progress else None
+
+    def add(self, tiles: int) -> None:
+        with self.lock:
+            self.mosaics += 1
+            self.tiles += tiles
+            now = time.perf_counter()
+            due = now - self.last_report >= self.interval
+            if due:
+                self.last_report = now
+        if self.progress:
+            self.progress.update(self.mosaics, message=f'{self.tile_rate():.1f} 张/秒')
+        if due:
+            print(f'进度: {self.mosaics}/{self.total} 张对比图，{self.tile_rate():.1f} 张单图/秒')
+
+    def tile_rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.tiles / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        if self.progress:
+            self.progress.close()
+        return (
+            f'共生成 {self.mosaics} 张对比图（{self.tiles} 张单图），耗时 {elapsed:.1f} 秒，'
+            f'{self.tile_rate():.1f} 张单图/秒'
+        )
+
+
 def compare_images(input_dir: str, save_dir: str, config: dict) -> bool:
     """比较图像一致性
 
@@ -111,77 +675,126 @@ def compare_images(input_dir: str, save_dir: str, config: dict) -> bool:
     print(f'输入目录: {input_dir}')
     print(f'保存目录: {save_dir}')
 
-    all_images = {}
-    camera_key_list = []
-    _camera_key_list = os.listdir(input_dir)
-
-    for _camera in _camera_key_list:
-        __camera_key_list = os.listdir(osp.join(input_dir, _camera))
-        for __camera in __camera_key_list:
-            camera_key_list.append(_camera + '/' + __camera)
-
-    print(f'发现相机目录: {camera_key_list}')
-
-    # 收集所有图像
-    for camera in camera_key_list:
-        img_dic = {}
-        idx_key_list = []
-        for root, dirs, files in os.walk(osp.join(input_dir, camera)):
-            for file in files:
-                try:
-                    file_path = osp.join(root, file)
-                    names = osp.basename(file_path)
-                    name, suffix = osp.splitext(names)
-                    key = parse_b698_filepath_mp(file_path)['index']
-                    idx_key_list.append(key)
-                    if suffix not in ['.jpg', '.png', '.bmp']:
-                        continue
-                    img_dic[key] = file_path
-                except Exception as e:
-                    print(f'名字解析问题: {file_path}, 错误: {e}')
-        all_images[camera] = img_dic
-
-    print(f'索引列表: {idx_key_list}')
-    print(f'相机列表: {camera_key_list}')
-
-    # 生成对比图像
-    for idx in idx_key_list:
-        imgs = []
-        for category in all_images.keys():
+    # 单次遍历建立 相机 × 索引 矩阵，目录列举按 mtime 缓存，重跑时只需 stat 各目录
+    script_name = osp.basename(osp.dirname(osp.abspath(__file__)))
+    cache_key = hashlib.sha1(osp.abspath(input_dir).encode('utf-8')).hexdigest()[:16]
+    cache_path = osp.join(os.environ.get('CEDAR_BASE_DIR', './'), 'cache', script_name, cache_key + '.json')
+    index = build_image_index(input_dir, cache_path)
+    report_image_index(index)
+    all_images = index['images']
+
+    # 生成对比图像：线程池并行解码、标注、下采样（cv2 运算期间释放 GIL），
+    # 每张单图完成后立即写入预分配的拼接图，某个索引的全部单图到齐后写盘
+    workers = config.get('workers') or os.cpu_count() or 1
+    if workers > 1:
+        cv2.setNumThreads(1)  # 由线程池并行，避免 OpenCV 内部线程过量竞争
+    num_per_row = config.get('num_per_row', 10)
+    stream = config.get('stream_mosaic', False)
+    os.makedirs(save_dir, exist_ok=True)
+    print(f'并行线程数: {workers}')
+
+    # 每张拼接图中相机位置固定，缺失的单元留空
+    cameras = index['cameras']
+    tasks = []
+    for idx in index['indices']:
+        jobs = [(pos, camera, all_images[camera][idx]) for pos, camera in enumerate(cameras) if idx in all_images[camera]]
+        tasks.append((idx, jobs))
+    if not tasks:
+        print('没有可拼接的图像')
+        return True
+
+    # 格子尺寸以第一张能处理的单图为准，其他尺寸的单图在拼接时等比缩放居中
+    tile_size = None
+    for idx, jobs in tasks:
+        for _, category, path in jobs:
             try:
-                if category not in all_images.keys():
-                    print(f'category:{category} not in all_images')
-                if idx not in all_images[category].keys():
-                    print(f'idx:{idx} not in {category}')
-                print(f'category:{category},idx:{idx}')
-                file_path = all_images[category][idx]
-                img = imread(file_path)
-                img = putText(
-                    img,
-                    'xj:' + category,
-                    (10, 10),
-                    text_color=tuple(color_list[2]),
-                    text_size=config.get('text_size', 80),
-                )
-                img = putText(
-                    img,
-                    'idx:' + str(idx),
-                    (10, 200),
-                    text_color=tuple(color_list[2]),
-                    text_size=config.get('index_text_size', 120),
+                tile_size = process_tile(path, category, idx, config).shape[:2]
+                break
+            except Exception as e:
+                print(f'处理图像时出错: category:{category}, idx:{idx}, {e}')
+        if tile_size is not None:
+            break
+    if tile_size is None:
+        print('没有可处理的图像')
+        return False
+    print(f'拼接格子尺寸: {tile_size[1]}x{tile_size[0]}' + ('，按行条流式写盘' if stream else ''))
+
+    # 增量模式：跳过输入与画面设置都未变化的拼接图
+    manifest = None
+    keys = {}
+    if config.get('incremental', False):
+        manifest = RenderManifest(save_dir)
+        pending = []
+        for idx, jobs in tasks:
+            keys[idx] = render_fingerprint(jobs, cameras, tile_size, config)
+            if not manifest.is_current(idx, keys[idx]):
+                pending.append((idx, jobs))
+        print(f'增量模式: {len(tasks) - len(pending)} 张对比图未变化已跳过，需生成 {len(pending)} 张')
+        manifest_keep = [idx for idx, _ in tasks]
+        tasks = pending
+
+    meter = ThroughputMeter(len(tasks))
+    window = threading.Semaphore(workers * 2)  # 同时在途的索引数，限制内存占用
+
+    def finish_mosaic(idx, mosaic, tiles):
+        try:
+            mosaic.close()
+            meter.add(mosaic.placed)
+            # 有单图失败的拼接图不记录，下次重跑时重新生成
+            if manifest is not None and mosaic.placed == tiles:
+                manifest.record(idx, keys[idx])
+        except Exception as e:
+            print(f'拼接图像时出错: idx:{idx}, {e}')
+        finally:
+            window.release()
+
+    def on_done(idx, pos, category, mosaic, tiles, remaining, lock, future):
+        try:
+            img = future.result()
+        except Exception as e:
+            print(f'处理图像时出错: category:{category}, idx:{idx}, {e}')
+            img = None
+        try:
+            # put 在写入格子前失败时自行登记该格，这里不能再 skip，否则同一格被计数两次
+            if img is None:
+                mosaic.skip(pos)
+            else:
+                mosaic.put(pos, img)
+        except Exception as e:
+            print(f'拼接图像时出错: category:{category}, idx:{idx}, {e}')
+        with lock:
+            remaining[0] -= 1
+            ready = remaining[0] == 0
+        if ready:
+            pool.submit(finish_mosaic, idx, mosaic, tiles)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx, jobs in tasks:
+            window.acquire()
+            try:
+                mosaic = MosaicWriter(
+                    len(cameras), num_per_row, tile_size, path=osp.join(save_dir, f'{idx}.png'), stream=stream
                 )
-                downsample_level = config.get('downsample_level', 2)
-                for _ in range(downsample_level):
-                    img = cv2.pyrDown(img)
-                imgs.append(img)
+                present = {pos for pos, _, _ in jobs}
+                for pos in range(len(cameras)):
+                    if pos not in present:
+                        mosaic.skip(pos)
             except Exception as e:
-                print(f'处理图像时出错: {e}')
-
-        if imgs:
-            imgs = stack_images_with_fixed_num_per_row(imgs, num_per_row=config.get('num_per_row', 10))
-            os.makedirs(save_dir, exist_ok=True)
-            imwrite(osp.join(save_dir, f'{idx}.png'), imgs)
-
+                print(f'拼接图像时出错: idx:{idx}, {e}')
+                window.release()
+                continue
+            remaining = [len(jobs)]
+            lock = threading.Lock()
+            for pos, category, path in jobs:
+                future = pool.submit(process_tile, path, category, idx, config)
+                future.add_done_callback(functools.partial(on_done, idx, pos, category, mosaic, len(jobs), remaining, lock))
+        # 等待所有在途索引写盘完成后再关闭线程池
+        for _ in range(workers * 2):
+            window.acquire()
+
+    if manifest is not None:
+        manifest.compact(manifest_keep)
+    print(meter.summary())
     print(f'图像一致性比较完成，结果保存到: {save_dir}')
     return True
 
@@ -198,8 +811,10 @@ def main(config_file_path: str = None) -> None:
     # 获取输入和输出目录
     input_dir = config.get('input_dir')
     save_dir = config.get('save_dir')
-    # 清理输出目录
-    if config.get('clean_output', True):
+    # 清理输出目录（增量模式依赖已有结果，不清理）
+    if config.get('incremental', False):
+        print('增量模式: 保留已有输出，只重新生成输入或设置有变化的对比图')
+    elif config.get('clean_output', True):
         rmtree_makedirs(save_dir)
 
     # 执行图像比较
@@ -7,6 +7,11 @@ from tqdm import tqdm
 from cedar.image import is_image
 from cedar.utils import print, create_name, try_except, get_files_list, copy_file, find_duplicate_filenames
 
+try:
+    from cedarex import init_log, print  # CedarEx 运行时提供的后台缓冲日志写入
+except ImportError:
+    init_log = None
+
 
 def parse_filepath(filepath: str) -> dict:
     """解析文件路径获取点位信息"""
@@ -122,10 +127,13 @@ def init(config_file_path):
         print(f'从命令行参数获取配置文件路径: {config_file_path}')
     cedar_base_dir = os.environ.get('CEDAR_BASE_DIR', './')
     script_name = osp.basename(osp.dirname(__file__))
-    log_dir = osp.join(cedar_base_dir, 'log', script_name)
+    # CedarEx 为每次运行指定独立的日志目录，并行运行的日志互不混淆
+    log_dir = os.environ.get('CEDAR_RUN_LOG_DIR') or osp.join(cedar_base_dir, 'log', script_name)
     os.makedirs(log_dir, exist_ok=True)
-    log_path = osp.join(cedar_base_dir, 'log', script_name, create_name() + '.log')  # 获取日志文件路径
+    log_path = osp.join(log_dir, create_name() + '.log')  # 获取日志文件路径
     os.environ['LOG_PATH'] = log_path  # 设置日志文件为环境变量
+    if init_log:
+        init_log(log_path)  # 逐文件日志改由后台线程批量写入
     print(f'日志文件保存路径: {log_path}')
     # 加载配置
     print(f'加载配置文件: {config_file_path}')
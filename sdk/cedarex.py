@@ -0,0 +1,217 @@
+"""
+CedarEx 脚本运行时辅助（只依赖标准库）
+
+由 CedarEx 启动的脚本可直接 import（sidecar 把 sdk/ 加入 PYTHONPATH）：
+
+    from cedarex import Progress
+
+    progress = Progress(total=len(files))
+    for path in files:
+        handle(path)
+        progress.advance()
+    progress.close()
+
+进度写入 CEDAR_PROGRESS_FD 指向的管道，每行一个 JSON：{"done": 10, "total": 100, "message": ""}。
+写入按 min_interval 限频，管道满时丢弃本次更新，不会阻塞脚本；sidecar 负责计算 eta/throughput
+并以 run_progress 通知推送给界面。脱离 CedarEx 单独运行时退回每 fallback_interval 秒打印一行进度。
+
+逐文件打印日志的脚本可在 init() 中启用后台日志写入，print 用法与 cedar.utils.print 相同：
+
+    from cedarex import init_log, print
+
+    def init(config_file_path):
+        ...
+        os.environ['LOG_PATH'] = log_path
+        init_log(log_path)
+
+之后日志文件由后台线程按 flush_interval 批量追加，连续重复的行合并为一条计数，进程正常退出时写完剩余内容。
+"""
+
+import atexit
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+
+PROGRESS_FD_ENV = 'CEDAR_PROGRESS_FD'
+
+
+class Progress:
+    def __init__(self, total=None, min_interval=0.2, fallback_interval=5.0):
+        self.total = total
+        self.done = 0
+        self.message = ''
+        self.min_interval = min_interval
+        self.fallback_interval = fallback_interval
+        self._last = 0.0
+        self._fd = None
+        fd = os.environ.get(PROGRESS_FD_ENV)
+        if fd:
+            try:
+                self._fd = int(fd)
+                os.set_blocking(self._fd, False)
+            except (ValueError, OSError):
+                self._fd = None
+
+    def update(self, done=None, total=None, message=None, force=False):
+        """设置当前进度；done 省略时保持不变。"""
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        now = time.monotonic()
+        finished = self.total is not None and self.done >= self.total
+        interval = self.min_interval if self._fd is not None else self.fallback_interval
+        if force or finished or now - self._last >= interval:
+            self._last = now
+            self._emit()
+
+    def advance(self, step=1, message=None):
+        self.update(self.done + step, message=message)
+
+    def close(self):
+        """发送最终进度。通道 fd 由进程内所有 Progress 共用，随进程退出关闭。"""
+        self.update(force=True)
+
+    def _emit(self):
+        if self._fd is None:
+            total = '?' if self.total is None else self.total
+            sys.stdout.write(f'进度: {self.done}/{total} {self.message}'.rstrip() + '\n')
+            sys.stdout.flush()
+            return
+        line = json.dumps({'done': self.done, 'total': self.total, 'message': self.message[:200]},
+                          ensure_ascii=False) + '\n'
+        try:
+            os.write(self._fd, line.encode('utf-8'))
+        except BlockingIOError:
+            pass  # 管道已满（界面来不及消费），丢弃本次更新
+        except OSError:
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LogSink:
+    """后台缓冲的日志文件写入：write 只追加到内存缓冲，写线程每 flush_interval 秒或缓冲超过
+    max_bytes 时批量写入。collapse 为真时连续相同的行只写一次，随后补一行重复次数。
+
+    缓冲内容在 close()（已注册 atexit）时写完；进程被强制杀死时最多丢失最近 flush_interval 秒的日志。
+    """
+
+    def __init__(self, path, flush_interval=1.0, max_bytes=256 * 1024, collapse=True):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.collapse = collapse
+        self._file = open(path, 'a', encoding='utf-8')
+        self._pending = []
+        self._pending_bytes = 0
+        self._last_line = None
+        self._repeats = 0
+        self._cond = threading.Condition()  # 保护缓冲
+        self._io_lock = threading.Lock()  # 串行化写盘，保证批次顺序
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='cedarex-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, text):
+        with self._cond:
+            if self._closed:
+                return
+            for line in text.splitlines(keepends=True):
+                if self.collapse and line == self._last_line:
+                    self._repeats += 1
+                    continue
+                if self._repeats:
+                    self._pending.append(f'（上一行重复 {self._repeats} 次）\n')
+                    self._repeats = 0
+                self._last_line = line
+                self._pending.append(line)
+                self._pending_bytes += len(line)
+            if self._pending_bytes >= self.max_bytes:
+                self._cond.notify()
+
+    def flush(self):
+        with self._io_lock:
+            with self._cond:
+                chunk = self._take()
+            self._write(chunk)
+
+    def close(self):
+        with self._io_lock:
+            with self._cond:
+                if self._closed:
+                    return
+                self._closed = True
+                chunk = self._take()
+                self._cond.notify()
+            self._write(chunk)
+            self._file.close()
+
+    def _take(self):
+        """取出待写内容（调用方持有 _cond）。"""
+        if self._repeats:
+            self._pending.append(f'（上一行重复 {self._repeats} 次）\n')
+            self._repeats = 0
+        chunk = ''.join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        return chunk
+
+    def _write(self, chunk):
+        """写文件（调用方持有 _io_lock），不占用 _cond，写盘期间脚本仍可继续 write。"""
+        if chunk and not self._file.closed:
+            self._file.write(chunk)
+            self._file.flush()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+
+_log_sink = None
+
+
+def init_log(path=None, flush_interval=1.0, collapse=True):
+    """在脚本 init() 中调用，之后 cedarex.print 通过 LogSink 写入 path（默认为环境变量 LOG_PATH）。"""
+    global _log_sink
+    path = path or os.environ.get('LOG_PATH')
+    if not path:
+        raise ValueError('未提供日志文件路径（LOG_PATH）')
+    if _log_sink is not None:
+        _log_sink.close()
+    _log_sink = LogSink(path, flush_interval=flush_interval, collapse=collapse)
+    return _log_sink
+
+
+def print(*args, sep=' ', end='\n', file=None, flush=False):
+    """输出到终端并追加到日志文件（LOG_PATH）。
+
+    调用过 init_log 时经后台缓冲写入，否则每次直接追加（与 cedar.utils.print 相同）；
+    指定 file 时只写入该文件。
+    """
+    builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+    if file is not None and file is not sys.stdout:
+        return
+    text = sep.join(str(arg) for arg in args) + end
+    if _log_sink is not None:
+        _log_sink.write(text)
+        return
+    path = os.environ.get('LOG_PATH')
+    if path:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(text)
@@ -6,16 +6,48 @@ Electron 主进程通过 stdin/stdout 与本进程通信
 用法：
     python3 sidecar.py --stdio
 
-支持的方法：get_scripts, get_script_detail, run_script,
-terminal_start, terminal_read, terminal_write, terminal_resize, terminal_stop,
+支持的方法：get_scripts, get_scripts_diff, get_script_detail, run_script,
+terminal_start, terminal_subscribe, terminal_read, terminal_read_from, terminal_ack, terminal_write, terminal_resize, terminal_stop,
 stop_current, analyze_run_with_opencode, analyze_terminal_with_opencode, ai_assist,
-get_recent_logs, get_log_detail
+start_ai_job, get_ai_job, list_ai_jobs, cancel_ai_job, set_ai_parallelism,
+get_recent_logs, get_log_detail, search_logs, get_dispatch_stats,
+start_run, list_runs, attach_run, run_write, cancel_run, set_run_parallelism, get_run_metrics, get_run_profile,
+get_worker_pool, configure_worker_pool, run_batch, get_batch, list_batches, cancel_batch,
+stream_run, unstream_run, run_ack
+
+请求调度：终端 I/O 等快速方法在主线程内联执行；AI 诊断、日志读取等慢方法
+交给线程池，响应按 id 乱序写回 stdout（单一写锁保证每帧完整）。
+
+终端输出推送：sidecar 主动发送无 id 的通知帧
+    {"method": "terminal_output", "params": {"seq": 1, "data": "..."}}
+渲染端写入 xterm 后调用 terminal_ack(seq) 确认；未确认帧达到上限时暂停推送，
+输出留在 TerminalSession 缓冲中，形成背压。终端面板（重新）挂载时调用 terminal_subscribe
+清空未确认计数；terminal_start 与 run_script 不会清空，不绕过背压窗口。
+
+脚本运行：start_run 为每次运行分配独立 PTY，超出并发上限时 FIFO 排队；
+stream_run 后以 run_output 通知推送输出（run_ack 确认），状态变化推送 run_status。
+脚本经 sdk/cedarex.py 的 Progress 上报结构化进度，限频后推送 run_progress
+{run_id, done, total, throughput, eta, message}。
+运行期间按秒读取 /proc 采样进程树的 CPU、RSS、读写字节与线程数，结束后随运行记入历史索引，
+get_run_metrics 返回汇总、时间序列及同一脚本最近几次运行的汇总。
+run_script/start_run 的 profile 参数为真时在 cProfile 下运行，统计写到运行日志旁（log/runs/<run_id>.prof），
+get_run_profile 返回累计/自身耗时排行，并生成 flamegraph 折叠栈文件。
+AI 诊断：start_ai_job 立即返回 job_id，opencode（CEDAR_AI_COMMAND 可替换为本地桩程序）在后台运行，
+输出以 ai_output {job_id, data, cursor} 增量推送，状态推送 ai_status；同时运行数由 CEDAR_AI_MAX_JOBS
+或 set_ai_parallelism 限制。旧的同步方法（ai_assist 等）提交同样的任务并等待结束。
+run_batch 以多组配置批量运行同一脚本，批内限并发、失败重试，进度推送 batch_status。
+设置 CEDAR_WARM_WORKERS=1 后脚本由预热的 fork server（warm_worker.py）fork 执行，
+省去解释器启动和重型模块导入；form.yaml 顶层 warm_worker: false 的脚本仍冷启动。
 """
 
 import json
 import os
 import sys
+import threading
+import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -24,6 +56,190 @@ os.chdir(str(BASE_DIR))
 
 from main_webview import Api, TerminalSession
 
+# 慢方法 → 同时执行上限；未列出的方法在读取 stdin 的主线程内联执行
+POOLED_METHODS = {
+    'ai_assist': 2,
+    'analyze_terminal_with_opencode': 2,
+    'analyze_run_with_opencode': 2,
+    'execute_command': 2,
+    'get_scripts': 1,
+    'get_scripts_diff': 1,
+    'get_script_detail': 4,
+    'get_recent_logs': 1,
+    'get_run_metrics': 2,
+    'get_run_profile': 2,
+    'get_log_detail': 2,
+    'search_logs': 2,
+    'run_batch': 1,
+    'start_ai_job': 2,
+}
+DISPATCH_WORKERS = 8
+
+# 终端推送：合并窗口（秒）、单帧最大字节数、未确认帧上限
+STREAM_WINDOW = 0.016
+STREAM_MAX_BYTES = 64 * 1024
+STREAM_MAX_INFLIGHT = 4
+
+_stdout_lock = threading.Lock()
+
+
+def write_message(msg: dict):
+    """线程安全地向 stdout 写一帧 JSON。"""
+    line = json.dumps(msg, ensure_ascii=False) + '\n'
+    with _stdout_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+class Dispatcher:
+    """把请求分流到内联执行或线程池，并按方法限制并发。
+
+    超过方法并发上限的请求在该方法的 FIFO 队列中等待，不占用线程池 worker。
+    """
+
+    def __init__(self, sidecar, limits=None, workers=DISPATCH_WORKERS):
+        self.sidecar = sidecar
+        self.limits = dict(POOLED_METHODS if limits is None else limits)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rpc')
+        self.lock = threading.Lock()
+        self.active = {}    # method -> 已提交到线程池的请求数
+        self.backlog = {}   # method -> 等待并发名额的请求
+        self.queued = 0     # 已接收但尚未开始执行的池化请求数
+        self.completed = 0
+
+    def handle(self, msg_id, method: str, args: list):
+        if method not in self.limits:
+            self._respond(msg_id, self.sidecar._dispatch(method, args))
+            return
+        job = (msg_id, method, args)
+        with self.lock:
+            self.queued += 1
+            if self.active.get(method, 0) < self.limits[method]:
+                self.active[method] = self.active.get(method, 0) + 1
+                self.executor.submit(self._run, job)
+            else:
+                self.backlog.setdefault(method, deque()).append(job)
+
+    def _run(self, job):
+        msg_id, method, args = job
+        with self.lock:
+            self.queued -= 1
+        try:
+            result = self.sidecar._dispatch(method, args)
+            self._respond(msg_id, result)
+        finally:
+            with self.lock:
+                self.completed += 1
+                pending = self.backlog.get(method)
+                if pending:
+                    self.executor.submit(self._run, pending.popleft())
+                else:
+                    self.active[method] -= 1
+
+    def _respond(self, msg_id, result: dict):
+        try:
+            write_message({'id': msg_id, **result})
+        except (TypeError, ValueError) as e:
+            write_message({'id': msg_id, 'ok': False, 'error': f'响应序列化失败: {e}'})
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'queue_depth': self.queued,
+                'completed': self.completed,
+                'active': {m: n for m, n in self.active.items() if n},
+                'backlog': {m: len(q) for m, q in self.backlog.items() if q},
+                'limits': dict(self.limits),
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class TerminalStreamer:
+    """把 TerminalSession 的输出合并成通知帧推送给 Electron。
+
+    默认推送 terminal_output；脚本运行使用 run_output 并在 params 中附带 run_id。
+    读线程只负责唤醒；本线程在空闲时阻塞等待，不产生轮询开销。
+    使用独立的缓冲游标，不影响 terminal_read 等其他读者。
+    """
+
+    READER = 'stream'
+
+    def __init__(self, session, method='terminal_output', params=None,
+                 window=STREAM_WINDOW, max_bytes=STREAM_MAX_BYTES, max_inflight=STREAM_MAX_INFLIGHT):
+        self.session = session
+        self.method = method
+        self.params = dict(params or {})
+        self.window = window
+        self.max_bytes = max_bytes
+        self.max_inflight = max_inflight
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.acked = 0
+        self.dirty = False
+        self.draining = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._loop, name=f'{method}-stream', daemon=True)
+
+    def start(self):
+        self.session.add_listener(self.notify)
+        self.thread.start()
+        self.notify()
+
+    def stop(self, drain=False):
+        """停止推送；drain=True 时先把缓冲中剩余输出发完（不再受背压限制）。"""
+        with self.cond:
+            if drain:
+                self.draining = True
+                self.dirty = True
+            else:
+                self.stopped = True
+            self.cond.notify()
+        self.session.remove_listener(self.notify)
+
+    def notify(self):
+        with self.cond:
+            self.dirty = True
+            self.cond.notify()
+
+    def reset(self):
+        """渲染端重新订阅时调用：丢弃未确认帧的计数，避免推送永久停滞。"""
+        with self.cond:
+            self.acked = self.seq
+            self.dirty = True
+            self.cond.notify()
+
+    def ack(self, seq):
+        with self.cond:
+            self.acked = max(self.acked, min(int(seq), self.seq))
+            self.cond.notify()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while not self.stopped and not (
+                    self.dirty and (self.draining or self.seq - self.acked < self.max_inflight)
+                ):
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                self.dirty = False
+            # 合并窗口：等待后续输出一并发送，缓冲已满一帧时立即发送
+            if not self.draining and self.session.pending_size(self.READER) < self.max_bytes:
+                time.sleep(self.window)
+            data = self.session.read(self.max_bytes, reader=self.READER)
+            with self.cond:
+                if self.session.pending_size(self.READER):
+                    self.dirty = True
+                elif self.draining:
+                    self.stopped = True
+                if not data:
+                    continue
+                self.seq += 1
+                seq = self.seq
+            write_message({'method': self.method, 'params': {**self.params, 'seq': seq, 'data': data}})
+
 
 class SidecarApi:
     """包装 Api 类，移除 pywebview 依赖，适配 stdio JSON-RPC"""
@@ -32,6 +248,15 @@ class SidecarApi:
         self._api = Api()
         self._api.terminal = None  # 终端由我们直接管理
         self._terminal = None      # 独立 TerminalSession 实例
+        self._streamer = None      # 终端输出推送线程
+        self._run_streamers = {}   # run_id → 运行输出推送线程
+        self._run_lock = threading.Lock()
+        self.dispatcher = None
+        self._api.run_manager.listeners.append(self._on_run_change)
+        self._api.batch_manager.listeners.append(self._on_batch_change)
+        self._api.run_manager.progress_listeners.append(self._on_run_progress)
+        self._api.ai_jobs.listeners.append(self._on_ai_change)
+        self._api.ai_jobs.output_listeners.append(self._on_ai_output)
 
     def _dispatch(self, method: str, args: list) -> dict:
         """先查自己（重写的方法），再查原始 Api"""
@@ -47,6 +272,11 @@ class SidecarApi:
             traceback.print_exc(file=sys.stderr)
             return {'ok': False, 'error': str(e)}
 
+    def get_dispatch_stats(self):
+        if not self.dispatcher:
+            return {'ok': True, 'data': {}}
+        return {'ok': True, 'data': self.dispatcher.stats()}
+
     # ── 文件选择 —— Electron 侧处理 ──
     def choose_directory(self):
         return {'ok': False, 'error': '请在 Electron 中使用原生对话框'}
@@ -60,29 +290,50 @@ class SidecarApi:
                 self._terminal = TerminalSession(BASE_DIR)
                 self._api.terminal = self._terminal
             self._terminal.start(int(cols or 100), int(rows or 30))
+            if not self._streamer:
+                self._streamer = TerminalStreamer(self._terminal)
+                self._streamer.start()
             import platform
             return {'ok': True, 'data': {'cwd': str(BASE_DIR), 'platform': platform.system()}}
         except Exception as e:
             return {'ok': False, 'error': str(e)}
 
-    def run_script(self, script_rel_path, config):
-        """通过共享 PTY 运行脚本，确保 Electron 终端能读到输出。"""
+    def run_script(self, script_rel_path, config, profile=False):
+        """在独立 PTY 中运行脚本，输出镜像到共享终端，确保 Electron 终端能读到输出。"""
         started = self.terminal_start()
         if not started.get('ok'):
             return started
         self._api.terminal = self._terminal
-        return self._api.run_script(script_rel_path, config)
+        return self._api.run_script(script_rel_path, config, profile)
 
     def terminal_read(self):
         if not self._terminal:
             return {'ok': True, 'data': ''}
         return {'ok': True, 'data': self._terminal.read()}
 
+    def terminal_read_from(self, cursor=0, max_bytes=None):
+        if not self._terminal:
+            return {'ok': True, 'data': {'text': '', 'cursor': 0}}
+        text, cursor = self._terminal.read_from(cursor, max_bytes)
+        return {'ok': True, 'data': {'text': text, 'cursor': cursor}}
+
+    def terminal_subscribe(self):
+        """渲染端重新订阅 terminal_output（终端面板挂载）：旧订阅未确认的帧不会再被确认，清空计数。"""
+        if self._streamer:
+            self._streamer.reset()
+        return {'ok': True}
+
+    def terminal_ack(self, seq):
+        """渲染端确认已写入 xterm 的 terminal_output 帧序号。"""
+        if self._streamer:
+            self._streamer.ack(seq)
+        return {'ok': True}
+
     def terminal_write(self, data):
+        """终端由本类创建；输入的去向（前台脚本的 PTY 或 shell）由 Api.terminal_write 决定。"""
         if not self._terminal:
             self.terminal_start()
-        self._terminal.write(data or '')
-        return {'ok': True}
+        return self._api.terminal_write(data)
 
     def terminal_resize(self, cols, rows):
         if self._terminal:
@@ -90,14 +341,74 @@ class SidecarApi:
         return {'ok': True}
 
     def terminal_stop(self):
+        if self._streamer:
+            self._streamer.stop()
+            self._streamer = None
         if self._terminal:
             self._terminal.stop()
             self._terminal = None
             self._api.terminal = None
         return {'ok': True}
 
+    # ── 脚本运行（每个运行独占 PTY）──
+    def stream_run(self, run_id):
+        """开始以 run_output 通知推送某次运行的输出（从缓冲中最早的输出开始）。"""
+        run = self._api.runs.get(run_id)
+        if not run:
+            return {'ok': False, 'error': '运行记录不存在'}
+        with self._run_lock:
+            streamer = self._run_streamers.get(run_id)
+            if streamer:
+                streamer.reset()
+            else:
+                streamer = TerminalStreamer(run.session, method='run_output', params={'run_id': run_id})
+                self._run_streamers[run_id] = streamer
+                streamer.start()
+                if run.finished:
+                    streamer.stop(drain=True)
+        return {'ok': True, 'data': run.to_dict()}
+
+    def unstream_run(self, run_id):
+        with self._run_lock:
+            streamer = self._run_streamers.pop(run_id, None)
+        if streamer:
+            streamer.stop()
+        return {'ok': True}
+
+    def run_ack(self, run_id, seq):
+        streamer = self._run_streamers.get(run_id)
+        if streamer:
+            streamer.ack(seq)
+        return {'ok': True}
+
+    def _on_run_change(self, run):
+        if run.finished:
+            with self._run_lock:
+                streamer = self._run_streamers.pop(run.run_id, None)
+            if streamer:
+                streamer.stop(drain=True)
+        write_message({'method': 'run_status', 'params': run.to_dict()})
+
+    def _on_run_progress(self, run):
+        write_message({'method': 'run_progress', 'params': {'run_id': run.run_id, **(run.progress or {})}})
+
+    def _on_ai_change(self, job):
+        write_message({'method': 'ai_status', 'params': job.to_dict()})
+
+    def _on_ai_output(self, job, text):
+        write_message({'method': 'ai_output', 'params': {'job_id': job.job_id, 'data': text, 'cursor': job.length}})
+
+    def _on_batch_change(self, batch, item):
+        params = batch.summary()
+        if item is not None:
+            params['item'] = batch.row(item)
+        write_message({'method': 'batch_status', 'params': params})
+
     def stop_current(self):
-        """向终端发送 Ctrl+C"""
+        """终止当前脚本运行；没有运行中的脚本时向终端发送 Ctrl+C"""
+        run = self._api.runs.get(self._api.current_run)
+        if run and not run.finished:
+            return self._api.stop_current()
         if self._terminal:
             self._terminal.write('\x03')
             return {'ok': True, 'data': '已向终端发送 Ctrl+C'}
@@ -106,10 +417,11 @@ class SidecarApi:
 
 def main():
     sidecar = SidecarApi()
+    dispatcher = Dispatcher(sidecar)
+    sidecar.dispatcher = dispatcher
 
     # 发送 ready 信号
-    sys.stdout.write(json.dumps({'method': 'ready'}) + '\n')
-    sys.stdout.flush()
+    write_message({'method': 'ready'})
 
     for line in sys.stdin:
         line = line.strip()
@@ -117,22 +429,13 @@ def main():
             continue
         try:
             msg = json.loads(line)
-            msg_id = msg.get('id')
-            method = msg.get('method', '')
-            args = msg.get('args', [])
-
-            result = sidecar._dispatch(method, args)
-
-            response = {'id': msg_id, **result}
-            sys.stdout.write(json.dumps(response, ensure_ascii=False) + '\n')
-            sys.stdout.flush()
+            dispatcher.handle(msg.get('id'), msg.get('method', ''), msg.get('args', []))
         except json.JSONDecodeError:
-            sys.stdout.write(json.dumps({'ok': False, 'error': 'JSON 解析失败'}) + '\n')
-            sys.stdout.flush()
+            write_message({'ok': False, 'error': 'JSON 解析失败'})
         except Exception as e:
-            sys.stdout.write(json.dumps({'ok': False, 'error': str(e)}) + '\n')
-            sys.stdout.flush()
+            write_message({'ok': False, 'error': str(e)})
 
+    dispatcher.shutdown()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+CedarEx 预热进程（fork server）
+
+由 main_webview.WarmWorkerPool 启动：
+    python3 warm_worker.py <socket fd> <预加载模块，逗号分隔>
+
+启动时预先 import numpy、cv2、pandas 等重型模块，随后在 Unix socket 上等待任务。
+每个任务 fork 一个子进程：子进程接管随任务传来的 PTY，按原命令行语义
+（sys.argv、sys.path[0]、__main__）执行脚本，重型模块通过写时复制与本进程共享。
+
+消息格式：4 字节大端长度 + UTF-8 JSON；任务消息的首个分段附带 PTY 从端及其余 fd（SCM_RIGHTS）。
+    → {"job": 1, "argv": [...], "cwd": "...", "env": {...}, "pass_fds": [12]}
+    ← {"type": "ready", "modules": [...], "failed": {...}, "import_seconds": 1.2}
+    ← {"type": "started", "job": 1, "pid": 123}
+    ← {"type": "exit", "pid": 123, "code": 0}
+    ← {"type": "rejected", "job": 1, "error": "..."}（任务未附带 PTY 从端，未 fork）
+任务的 pass_fds 列出其余随附 fd 在 sidecar 中的编号，子进程把 argv/环境变量中的
+/dev/fd/<原编号>（配置管道）以及 *_FD 环境变量（进度管道）改写为收到的新编号。
+"""
+
+import array
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+
+HEADER = struct.Struct('>I')
+
+
+def send_message(sock, message):
+    data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_job(sock):
+    """读取一条任务消息，返回 (消息, 附带的 fd 列表)；对端关闭时返回 (None, [])。"""
+    fds = array.array('i')
+    header, ancdata, _, _ = sock.recvmsg(HEADER.size, socket.CMSG_SPACE(4 * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    if len(header) < HEADER.size:
+        rest = recv_exact(sock, HEADER.size - len(header)) if header else None
+        if rest is None:
+            return None, list(fds)
+        header += rest
+    body = recv_exact(sock, HEADER.unpack(header)[0])
+    if body is None:
+        return None, list(fds)
+    return json.loads(body.decode('utf-8')), list(fds)
+
+
+def preload(modules):
+    loaded, failed = [], {}
+    started = time.perf_counter()
+    for name in modules:
+        try:
+            __import__(name)
+            loaded.append(name)
+        except Exception as e:
+            failed[name] = f'{type(e).__name__}: {e}'
+    return loaded, failed, time.perf_counter() - started
+
+
+def serve(sock):
+    """主循环：接收任务并 fork。父进程在 socket 关闭后返回 None，子进程返回自己的任务。"""
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    while True:
+        ready, _, _ = select.select([sock, wake_r], [], [])
+        if wake_r in ready:
+            os.read(wake_r, 512)
+            while True:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if not pid:
+                    break
+                code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+                send_message(sock, {'type': 'exit', 'pid': pid, 'code': code})
+        if sock not in ready:
+            continue
+        job, fds = recv_job(sock)
+        if job is None:
+            return None
+        if not fds:
+            send_message(sock, {'type': 'rejected', 'job': job.get('job'), 'error': '任务未附带 PTY 从端 fd'})
+            continue
+        pid = os.fork()
+        if pid == 0:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            for fd in (wake_r, wake_w):
+                os.close(fd)
+            sock.close()
+            job['slave_fd'] = fds[0]
+            job['fds'] = fds[1:]
+            return job
+        for fd in fds:
+            os.close(fd)
+        send_message(sock, {'type': 'started', 'job': job['job'], 'pid': pid})
+
+
+def run_job(job):
+    """在 fork 出的子进程中按 `python <argv[1:]>` 的语义执行脚本，以其退出码结束进程。"""
+    import fcntl
+    import io
+    import runpy
+    import termios
+    import traceback
+
+    slave_fd = job['slave_fd']
+    os.setsid()
+    fcntl.ioctl(slave_fd, termios.TIOCSCTTY, 0)
+    for fd in (0, 1, 2):
+        os.dup2(slave_fd, fd)
+    if slave_fd > 2:
+        os.close(slave_fd)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    fds = list(zip(job.get('pass_fds', []), job['fds']))
+    paths = {f'/dev/fd/{old}': f'/dev/fd/{new}' for old, new in fds}
+    numbers = {str(old): str(new) for old, new in fds}
+    argv = [paths.get(arg, arg) for arg in job['argv']]
+    os.chdir(job['cwd'])
+    os.environ.clear()
+    os.environ.update({
+        key: numbers.get(value, value) if key.endswith('_FD') else paths.get(value, value)
+        for key, value in job['env'].items()
+    })
+    # 解释器早已启动，PYTHONPATH 需手动补进 sys.path
+    for entry in reversed([p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]):
+        if entry not in sys.path:
+            sys.path.insert(1, entry)
+    encoding = os.environ.get('PYTHONIOENCODING', 'utf-8').split(':')[0] or 'utf-8'
+    sys.stdin = io.TextIOWrapper(io.FileIO(0, 'rb', closefd=False), encoding=encoding)
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, 'wb', closefd=False), encoding=encoding, line_buffering=True)
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, 'wb', closefd=False), encoding=encoding,
+                                  errors='backslashreplace', line_buffering=True)
+
+    # 预加载时的随机数状态被所有子进程继承，这里重新播种
+    import random
+    random.seed()
+    if 'numpy' in sys.modules:
+        sys.modules['numpy'].random.seed()
+
+    try:
+        if argv[1] == '-c':
+            # python -c 启动器（编译脚本）
+            sys.argv = ['-c'] + argv[3:]
+            sys.path[0] = ''
+            exec(compile(argv[2], '<string>', 'exec'), {'__name__': '__main__', '__builtins__': __builtins__})
+        else:
+            script = os.path.abspath(argv[1])
+            sys.argv = [script] + argv[2:]
+            sys.path[0] = os.path.dirname(script)
+            runpy.run_path(script, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        code = e.code
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    sys.exit(code)
+
+
+def main():
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    modules = [name for name in (sys.argv[2] if len(sys.argv) > 2 else '').split(',') if name]
+    loaded, failed, seconds = preload(modules)
+    send_message(sock, {'type': 'ready', 'modules': loaded, 'failed': failed, 'import_seconds': seconds})
+    job = serve(sock)
+    if job is not None:
+        run_job(job)
+
+
+if __name__ == '__main__':
+    main()
@@ -407,7 +407,7 @@ async function runSelectedScript(event) {
     showToast(res.error || '启动失败');
     return;
   }
-  state.runId = null;
+  state.runId = res.data?.run_id || null;
   els.analyze.disabled = false;
   els.aiReviewPanel.classList.add('hidden');
   setRunning(false);